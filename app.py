@@ -61,8 +61,15 @@ else:
 server.logger.setLevel(logging.INFO)
 server.logger.info('Banter.ly startup')
 
-# Create the DB Client (and DB if it doesn't exist)
-db = MongoClient(Config.DB_URL).banterly_main
+# Create the DB Client (and DB if it doesn't exist). It doesn't connect until it's used, and gives up quickly if
+# the DB is unavailable
+db_timeout_ms = int(Config.DB_TIMEOUT * 1000)
+db = MongoClient(
+    Config.DB_URL,
+    serverSelectionTimeoutMS=db_timeout_ms,
+    connectTimeoutMS=db_timeout_ms,
+    socketTimeoutMS=db_timeout_ms,
+).banterly_main
 
 # Initialize the cache
 # if Config.CACHE_TYPE == 'redis':
@@ -0,0 +1,195 @@
+"""Callbacks for the dashboard's figures once it's drawn: loading the sections as they're opened, filling in the
+figures that missed their time budget, drilling down into the hierarchical figures and zooming into the time
+series"""
+from bson import ObjectId
+from bson.errors import InvalidId
+from dash import callback_context
+from dash.dependencies import (
+    ALL,
+    MATCH,
+    ClientsideFunction,
+    Input,
+    Output,
+    State,
+)
+from dash.exceptions import PreventUpdate
+
+from app import app
+from apps import loaded_app
+from constants.div_properties import (
+    CHILDREN,
+    DAQ_THEME,
+    DATA,
+    FIGURE_TEMPLATES,
+    N_CLICKS,
+    SESSION,
+    URL,
+    VALUE,
+)
+from graphs.Graph import Graph
+from layouts.graph_layout import (
+    BRANCH_MESSAGES,
+    CHART,
+    LATE_FIGURE,
+    LATE_FIGURE_POLL,
+    LATE_FIGURE_TOKEN,
+    LAZY_SECTION,
+    SECTION_BODY,
+    SECTION_FIGURES,
+    SECTION_SUMMARY,
+    THEMED_CHART,
+    TIME_SERIES,
+    branch_layout,
+    late_figure,
+    layout_section_figures,
+    template_for,
+)
+from layouts.error_layout import error_layout
+from services.circuit_breaker import ServiceUnavailableError
+from services.session_store import get_session_store
+
+X_RANGE = "xaxis.range"
+X_AUTORANGE = "xaxis.autorange"
+
+
+def __graph_for(search: str, session_id: str) -> Graph:
+    # Shared analyses are looked up by their id, while uploads use the graph of the user's session
+    if search:
+        try:
+            g = loaded_app.load_graph(ObjectId(search[6:]))
+        except InvalidId:
+            raise PreventUpdate
+        except ServiceUnavailableError:
+            # The figures keep what they're showing until the database and the storage are back
+            raise PreventUpdate
+    else:
+        session = get_session_store().get(session_id)
+        g = session.graph if session else None
+    if g is None or g.chat is None:
+        raise PreventUpdate
+    return g
+
+
+@app.callback(
+    [
+        Output({"type": SECTION_BODY, "section": MATCH}, CHILDREN),
+        Output({"type": SECTION_BODY, "section": MATCH}, "className"),
+    ],
+    [Input({"type": SECTION_SUMMARY, "section": MATCH}, N_CLICKS)],
+    [
+        State({"type": SECTION_BODY, "section": MATCH}, "className"),
+        State({"type": SECTION_FIGURES, "section": MATCH}, DATA),
+        State(URL, "search"),
+        State(SESSION, DATA),
+        State(DAQ_THEME, VALUE),
+    ],
+)
+def load_section(
+    n_clicks, class_name, figures, search, session_id, dark_theme
+):
+    # A section is only drawn the first time it's opened, closing and reopening it keeps what was drawn. Figures
+    # whose columns are still being computed are drawn along with the dashboard's other pending figures
+    if not n_clicks or class_name != LAZY_SECTION:
+        raise PreventUpdate
+    g = __graph_for(search, session_id)
+    pending_columns = Graph.required_columns(figures) - set(g.df.columns)
+    for figure in figures:
+        pending_columns.update(
+            set(getattr(Graph, figure).optional_columns) - set(g.df.columns)
+        )
+    return (
+        layout_section_figures(g, figures, dark_theme, pending_columns),
+        "",
+    )
+
+
+@app.callback(
+    Output({"type": LATE_FIGURE, "name": MATCH}, CHILDREN),
+    [Input({"type": LATE_FIGURE_POLL, "name": MATCH}, "n_intervals")],
+    [State({"type": LATE_FIGURE_TOKEN, "name": MATCH}, DATA)],
+)
+def fill_late_figure(_, token):
+    # Replacing the placeholder also removes the interval, which stops the polling
+    try:
+        layout = late_figure(token)
+    except KeyError:
+        return error_layout(
+            "This figure took too long to draw", "Try reloading the page"
+        )
+    if layout is None:
+        raise PreventUpdate
+    return layout
+
+
+@app.callback(
+    Output({"type": BRANCH_MESSAGES, "name": MATCH}, CHILDREN),
+    [Input({"type": CHART, "name": MATCH}, "clickData")],
+    [
+        State({"type": CHART, "name": MATCH}, "id"),
+        State(URL, "search"),
+        State(SESSION, DATA),
+    ],
+)
+def show_branch_messages(click_data, chart_id, search, session_id):
+    if not click_data or not click_data.get("points"):
+        raise PreventUpdate
+    branch = click_data["points"][0].get("customdata") or []
+    g = __graph_for(search, session_id)
+    messages, total = g.branch_messages(chart_id["name"], branch)
+    return branch_layout(branch, messages, total)
+
+
+@app.callback(
+    Output({"type": TIME_SERIES, "name": MATCH}, "figure"),
+    [
+        Input({"type": TIME_SERIES, "name": MATCH}, "relayoutData"),
+        Input(DAQ_THEME, VALUE),
+    ],
+    [
+        State({"type": TIME_SERIES, "name": MATCH}, "id"),
+        State(URL, "search"),
+        State(SESSION, DATA),
+    ],
+)
+def zoom_time_series(relayout_data, dark_theme, chart_id, search, session_id):
+    # The figure is redrawn from the rollups at the resolution that fits the visible range, and reset when the
+    # axes are. Toggling the theme redraws it over the same range
+    triggered = [t["prop_id"] for t in callback_context.triggered]
+    theme_toggled = DAQ_THEME + "." + VALUE in triggered
+    if not relayout_data and not theme_toggled:
+        raise PreventUpdate
+    relayout_data = relayout_data or {}
+    if relayout_data.get(X_AUTORANGE):
+        x_range = None
+    elif X_RANGE + "[0]" in relayout_data:
+        x_range = (
+            relayout_data[X_RANGE + "[0]"],
+            relayout_data[X_RANGE + "[1]"],
+        )
+    elif X_RANGE in relayout_data:
+        x_range = tuple(relayout_data[X_RANGE])
+    elif theme_toggled:
+        x_range = None
+    else:
+        raise PreventUpdate
+
+    g = __graph_for(search, session_id)
+    return getattr(g, chart_id["name"])(x_range).update_layout(
+        template=template_for(dark_theme)
+    )
+
+
+# The other charts only get the template of the theme swapped, without a round trip to the server
+app.clientside_callback(
+    ClientsideFunction(namespace="theme", function_name="swapTemplate"),
+    [
+        Output({"type": CHART, "name": ALL}, "figure"),
+        Output({"type": THEMED_CHART, "name": ALL}, "figure"),
+    ],
+    [Input(DAQ_THEME, VALUE)],
+    [
+        State(FIGURE_TEMPLATES, DATA),
+        State({"type": CHART, "name": ALL}, "figure"),
+        State({"type": THEMED_CHART, "name": ALL}, "figure"),
+    ],
+)
@@ -0,0 +1,39 @@
+"""HTTP endpoints for the status and results of the background jobs, i.e. for API consumers"""
+from flask import Response, abort, jsonify
+
+from app import server
+from services.job_queue import FINISHED, get_job_queue
+from services.processing_service import STAGES, TIMINGS
+
+
+@server.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    job_queue = get_job_queue()
+    status = job_queue.status(job_id)
+    if status is None:
+        abort(404)
+    meta = job_queue.meta(job_id)
+    status.update(
+        {STAGES: meta.get(STAGES, []), TIMINGS: meta.get(TIMINGS, {})}
+    )
+    return jsonify(status)
+
+
+@server.route("/jobs/<job_id>/result", methods=["GET"])
+def job_result(job_id):
+    job_queue = get_job_queue()
+    status = job_queue.status(job_id)
+    if status is None:
+        abort(404)
+    if status["status"] != FINISHED:
+        # Not done yet (or never will be), the status says which
+        abort(409)
+    result = job_queue.result(job_id)
+    return Response(result["df"].to_csv(), mimetype="text/csv")
+
+
+@server.route("/jobs/<job_id>", methods=["DELETE"])
+def cancel_job(job_id):
+    if not get_job_queue().cancel(job_id):
+        abort(404)
+    return jsonify({"id": job_id, "cancelled": True})
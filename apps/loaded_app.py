@@ -1,21 +1,45 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional
+
 import dash_core_components as dcc
 import dash_html_components as html
 from bson import ObjectId
 from bson.errors import InvalidId
-from dash.dependencies import Input, Output
+from dash import callback_context, no_update
+from dash.dependencies import Input, Output, State
 
 from app import app
-from constants.database_keys import COLOR_MAP, MEDIA_COUNTER, URI
+from constants.database_keys import (
+    COLOR_MAP,
+    MEDIA_COUNTER,
+    URI,
+    WORD_CLOUD_LAYOUT,
+    TOPIC_GRAPH_LAYOUT,
+    STATUS,
+)
 from constants.div_properties import CHILDREN, DAQ_THEME, CIRCLE, VALUE
 from datautils.Parser import Parser
 from graphs.Graph import Graph
 from layouts.graph_layout import graph_layout
 from layouts.error_layout import error_layout
-from services.processed_data_service import get_processed_data
+from services.circuit_breaker import ServiceUnavailableError
+from services.processed_data_service import FAILED, PENDING, get_processed_data
+from services.result_sweeper import get_result_sweeper
 
 CIRCLE_LOADING_2 = "circle-loading-2"
 LOADED_CONTENT = "loaded-content"
 LOADED_URL = "loaded-url"
+# Polls a shared result that's still being written
+FINALIZING_INTERVAL = "finalizing-interval"
+# How many of the most recently viewed analyses are kept for the callbacks that drill down into them, and for how
+# many seconds before their entry is checked again
+GRAPH_CACHE_SIZE = 8
+GRAPH_CACHE_TTL = 60
+
+__graphs = OrderedDict()
+__graphs_lock = threading.Lock()
 
 layout = html.Div(
     [
@@ -28,43 +52,131 @@ layout = html.Div(
                 html.Div(id=LOADED_CONTENT),
             ],
         ),
+        dcc.Interval(id=FINALIZING_INTERVAL, interval=1000, disabled=True),
     ]
 )
 
 
+def load_graph(oid: ObjectId) -> Optional[Graph]:
+    """
+    Loads a shared analysis, keeping the most recently viewed ones around for the callbacks that drill down into
+    them. A kept analysis is only served for GRAPH_CACHE_TTL seconds before its entry is checked again, so that it
+    stops being served once it's expired
+    :return: None if there is no such analysis (or it isn't written yet)
+    """
+    with __graphs_lock:
+        g, loaded_at = __graphs.get(oid, (None, 0))
+        if g is not None and time.time() - loaded_at < GRAPH_CACHE_TTL:
+            __graphs.move_to_end(oid)
+            return g
+
+    processed_data = get_processed_data(oid)
+    if not processed_data or processed_data.get(STATUS) in (PENDING, FAILED):
+        forget_graphs([oid])
+        return None
+    if g is None:
+        p = Parser()
+        chat = p.reload_data(processed_data[URI])
+
+        # Update the Graph class with the data
+        g = Graph(chat)
+
+        g.color_map = processed_data[COLOR_MAP]
+        g.media_counter = processed_data[MEDIA_COUNTER]
+        # Older analyses were saved without their word cloud and topic graph layouts
+        g.word_cloud_layout = processed_data.get(WORD_CLOUD_LAYOUT)
+        g.topic_graph_layout = processed_data.get(TOPIC_GRAPH_LAYOUT)
+
+    with __graphs_lock:
+        __graphs[oid] = (g, time.time())
+        __graphs.move_to_end(oid)
+        while len(__graphs) > GRAPH_CACHE_SIZE:
+            __graphs.popitem(last=False)
+    return g
+
+
+def forget_graphs(oids: Iterable[ObjectId]):
+    """Stops serving the kept analyses, i.e. once their results have been deleted"""
+    with __graphs_lock:
+        for oid in oids:
+            __graphs.pop(oid, None)
+
+
+# The analyses whose objects the sweeper deletes are forgotten straight away when it runs in this process
+get_result_sweeper().add_listener(forget_graphs)
+
+
 @app.callback(
-    Output(LOADED_CONTENT, CHILDREN),
-    [Input(LOADED_URL, "search"), Input(DAQ_THEME, VALUE)],
+    [
+        Output(LOADED_CONTENT, CHILDREN),
+        Output(FINALIZING_INTERVAL, "disabled"),
+    ],
+    [Input(LOADED_URL, "search"), Input(FINALIZING_INTERVAL, "n_intervals")],
+    [State(DAQ_THEME, VALUE)],
 )
-def display_loaded_page(search, dark_theme):
+def display_loaded_page(search, _, dark_theme):
     uid = search[6:]
     try:
         oid = ObjectId(uid)
     except InvalidId:
-        return html.Div(
-            [
-                error_layout(
-                    "Analysis Not Found",
-                    "the url you entered is either incorrect or the data has expired",
-                ),
-                dcc.Link("Start another analysis", href="/"),
-            ]
-        )
-    processed_data = get_processed_data(oid)
-    if processed_data:
-        p = Parser()
-        dfs, participants = p.reload_data(processed_data[URI])
-
-        # Update the Graph class with the data and set the default graph template
-        g = Graph()
+        return __layout_not_found(), True
 
-        g.df = p.parsed_df
-        g.dfs = dfs
-        g.participants = participants
-        g.color_map = processed_data[COLOR_MAP]
-        g.media_counter = processed_data[MEDIA_COUNTER]
+    # A link can be opened before its result has been written, in which case it's polled until it has
+    try:
+        processed_data = get_processed_data(oid)
+    except ServiceUnavailableError:
+        return __layout_unavailable(), True
+    status = processed_data.get(STATUS) if processed_data else None
+    if status == PENDING:
+        triggered = [t["prop_id"] for t in callback_context.triggered]
+        if FINALIZING_INTERVAL + ".n_intervals" in triggered:
+            return no_update, no_update
+        return (
+            html.Div(
+                className="container",
+                style={"text-align": "center"},
+                children=[
+                    html.H6(
+                        "⏳ This analysis is still being saved, it'll show up in a few seconds"
+                    )
+                ],
+            ),
+            False,
+        )
+    if status == FAILED:
+        return (
+            error_layout(
+                "This analysis couldn't be saved",
+                "Try sharing it again from the original upload",
+            ),
+            True,
+        )
 
+    try:
+        g = load_graph(oid)
+    except ServiceUnavailableError:
+        return __layout_unavailable(), True
+    if g:
         # Create the final layout with Dash Graphs
-        return graph_layout(g, dark_theme)
+        return graph_layout(g, dark_theme), True
     else:
-        return error_layout
+        return __layout_not_found(), True
+
+
+def __layout_unavailable() -> html.Div:
+    return error_layout(
+        "Shared analyses are unavailable right now",
+        "Try opening this link again in a few minutes",
+    )
+
+
+def __layout_not_found() -> html.Div:
+    return html.Div(
+        [
+            error_layout(
+                "Analysis Not Found",
+                "the url you entered is either incorrect or the data has expired",
+            ),
+            dcc.Link("Start another analysis", href="/"),
+        ]
+    )
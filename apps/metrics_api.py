@@ -0,0 +1,17 @@
+"""HTTP endpoints for the metrics of the background services, i.e. for monitoring"""
+from flask import jsonify
+
+from app import server
+from services.circuit_breaker import ServiceUnavailableError
+from services.processed_data_service import get_sweeper_metrics
+from services.result_sweeper import get_result_sweeper
+
+
+@server.route("/metrics/sweeper", methods=["GET"])
+def sweeper_metrics():
+    # The sweeper usually runs in its own process, which saves its metrics in the DB after every sweep
+    try:
+        metrics = get_sweeper_metrics()
+    except ServiceUnavailableError as e:
+        return jsonify({"error": str(e)}), 503
+    return jsonify(metrics or get_result_sweeper().metrics())
@@ -1,11 +1,15 @@
 import base64
 import io
+from typing import List
 
 import dash_core_components as dcc
 import dash_html_components as html
-from dash.dependencies import Input, Output
+from dash import callback_context, no_update
+from dash.dependencies import ALL, Input, Output, State
+from dash.exceptions import PreventUpdate
 
 from app import app
+from config import Config
 from constants.div_properties import (
     CHAT_COUNT_MEMORY,
     CHILDREN,
@@ -22,27 +26,57 @@ from constants.div_properties import (
     MESSAGE_COUNT,
     PARTICIPANTS_ALIASES,
     ALIASES_COLORS,
+    SESSION,
+    STYLE,
 )
+from constants.figures import DASHBOARD_PRESETS
 from constants.styling import BLUE
 from datautils.Parser import Parser
-from datautils.processor import process_data
+from datautils.chat_frame import ChatFrame
 from graphs.Graph import Graph
-from layouts.graph_layout import graph_layout
+from layouts.graph_layout import (
+    FIGURE,
+    PENDING_FIGURE,
+    graph_layout,
+    layout_figures,
+)
 from layouts.error_layout import error_layout
+from layouts.progress_layout import progress_layout
 from services.counter_service import get_chat_count, get_message_count
+from services.circuit_breaker import ServiceUnavailableError
+from services.job_queue import (
+    CANCELLED,
+    FAILED,
+    FINISHED,
+    TIMED_OUT,
+    QueueFullError,
+    get_job_queue,
+)
+from services.processing_service import (
+    COLUMNS,
+    PARSED,
+    PARSED_URI,
+    STAGES,
+    TIMINGS,
+    delete_partials,
+    process_upload,
+    read_partial,
+)
+from services.session_store import Session, get_session_store
+from services.share_writer import get_share_writer
 
+CANCEL_BUTTON = "cancel-button"
 CIRCLE_LOADING = "circle-loading"
 CONTENTS = "contents"
+DASHBOARD = "dashboard"
 GRAPH = "graph-container"
+JOB_STORE = "job-store"
+PROGRESS = "progress"
+PROGRESS_INTERVAL = "progress-interval"
 SHARE_URL = "share-url"
 SHARE_BUTTON = "share-button"
 UPLOAD = "upload-data"
 
-# This graph and parser objects needs to be initialized here as their data
-# will be shared by most of the methods
-g = Graph()
-parser = Parser()
-
 layout = html.Div(
     [
         dcc.Upload(
@@ -51,7 +85,7 @@ layout = html.Div(
                 [
                     "Drag and drop or ",
                     html.A("select a file"),
-                    " - note that processing may take as long as 2 minutes, or even longer",
+                    " - the first charts show up right away, the rest may take a couple of minutes",
                 ]
             ),
             style={
@@ -68,24 +102,39 @@ layout = html.Div(
             multiple=False,
         ),
         html.Br(),
+        dcc.Store(id=JOB_STORE, storage_type="memory"),
+        dcc.Interval(id=PROGRESS_INTERVAL, interval=1000, disabled=True),
         dcc.Loading(
             id=CIRCLE_LOADING, type="circle", children=[html.Div(id=GRAPH)]
         ),
+        # The progress and dashboard are outside of the loading component so it doesn't flash on every poll
+        html.Div(
+            className="container",
+            style={"text-align": "center"},
+            children=[
+                html.Div(id=PROGRESS),
+                html.Button(
+                    "Cancel",
+                    id=CANCEL_BUTTON,
+                    n_clicks=0,
+                    style={COLOR: BLUE, "display": "none"},
+                ),
+            ],
+        ),
+        html.Div(id=DASHBOARD),
     ]
 )
 
 
 @app.callback(Output(CIRCLE_LOADING, CHILDREN), [Input(GRAPH, VALUE)])
 @app.callback(
-    Output(GRAPH, CHILDREN),
-    [
-        Input(UPLOAD, CONTENTS),
-        Input(DAQ_THEME, VALUE),
-        Input(CUSTOMIZATION_STORE, DATA),
-        Input(FOR_RESEARCH, VALUE),
-    ],
+    [Output(GRAPH, CHILDREN), Output(JOB_STORE, DATA), Output(SESSION, DATA)],
+    [Input(UPLOAD, CONTENTS)],
+    [State(JOB_STORE, DATA), State(SESSION, DATA)],
 )
-def generate_graphs(contents, dark_theme, customization, research_consent):
+def generate_graphs(contents, previous_job_id, previous_session_id):
+    # Only a new upload is processed, the customization and research consent are applied to the processed chat
+    # by update_progress. Every upload gets a session of its own, and the previous one is released
     try:
         if contents is not None:
             content_type, content_string = contents.split(",")
@@ -94,69 +143,371 @@ def generate_graphs(contents, dark_theme, customization, research_consent):
                     base64.b64decode(content_string).decode("utf-8")
                 ).getvalue()
 
-                # Process the uploaded data and generate the new columns
-                parser.parse(raw_text)
-                # Check that the graph configuration matches the number of participants in the convo
-                alias_color_map = None
-                if customization:
-                    participant_alias_map = customization[PARTICIPANTS_ALIASES]
-                    if len(participant_alias_map) != len(parser.participants):
-                        return error_layout(
-                            "There are {} participants in this chat but the customization was set"
-                            "for only {}".format(
-                                len(parser.participants),
-                                len(participant_alias_map),
-                            ),
-                            "Try clearing the graph customization",
-                        )
-                    else:
-                        # Update the parsed dataframe with the aliases
-                        parser.set_customization(participant_alias_map)
-                        alias_color_map = customization[ALIASES_COLORS]
-
-                # Run the processor and generate the new dataframe columns, and get back
-                # an array of dataframes corresponding to each person in the chat
-                # note that because this function is memoized you need to return a new df
-                df, dfs, _ = process_data(parser.parsed_df)
-                parser.parsed_df = df
-
-                # Store a copy of the processed data in the bucket if the user has consented
-                if len(research_consent) > 0:
-                    parser.save_data(alias_color_map, True)
-
-                # Update the Graph class with the data and set the default graph template
-                g.df = parser.parsed_df
-                g.dfs = dfs
-                g.participants = parser.participants
-                g.media_counter = parser.media_count_map
-
-                if alias_color_map:
-                    g.color_map = alias_color_map
-
-                # Create the final layout with Dash Graphs
-                return html.Div(
-                    [
-                        html.Div(
-                            className="container",
-                            style={
-                                "text-align": "center",
-                                "margin-bottom": "30px",
-                            },
-                            children=[
-                                html.Button(
-                                    "Share Results",
-                                    id=SHARE_BUTTON,
-                                    n_clicks=0,
-                                    style={COLOR: BLUE},
-                                ),
-                                html.Div(id=SHARE_URL, style={COLOR: BLUE}),
-                            ],
+                job_queue = get_job_queue()
+                if previous_job_id:
+                    job_queue.release(previous_job_id)
+
+                # The upload is parsed and processed by a background job, and the dashboard is drawn
+                # progressively by polling it. Only the columns needed by the dashboard's figures are computed
+                try:
+                    job_id = job_queue.submit(
+                        process_upload,
+                        raw_text,
+                        columns=Graph.required_columns(
+                            DASHBOARD_PRESETS[Config.DASHBOARD_PRESET]
                         ),
-                        graph_layout(g, dark_theme),
-                    ]
-                )
+                    )
+                except QueueFullError:
+                    return (
+                        error_layout(
+                            "Banter.ly is busy",
+                            "Too many chats are being analysed right now, try again in a few minutes",
+                        ),
+                        None,
+                        no_update,
+                    )
+
+                session_store = get_session_store()
+                session_store.release(previous_session_id)
+                return html.Div(), job_id, session_store.create().id
     except Exception as e:
-        return error_layout("An un expected error occurred", str(e))
+        return (
+            error_layout("An un expected error occurred", str(e)),
+            None,
+            no_update,
+        )
+    raise PreventUpdate
+
+
+@app.callback(
+    [
+        Output(PROGRESS, CHILDREN),
+        Output(PROGRESS_INTERVAL, "disabled"),
+        Output(CANCEL_BUTTON, STYLE),
+        Output(DASHBOARD, CHILDREN),
+        Output({"type": FIGURE, "name": ALL}, CHILDREN),
+        Output({"type": FIGURE, "name": ALL}, "className"),
+    ],
+    [
+        Input(PROGRESS_INTERVAL, "n_intervals"),
+        Input(JOB_STORE, DATA),
+        Input(CUSTOMIZATION_STORE, DATA),
+        Input(FOR_RESEARCH, VALUE),
+    ],
+    [
+        State(SESSION, DATA),
+        State(DAQ_THEME, VALUE),
+        State({"type": FIGURE, "name": ALL}, "id"),
+        State({"type": FIGURE, "name": ALL}, "className"),
+    ],
+)
+def update_progress(
+    _,
+    job_id,
+    customization,
+    research_consent,
+    session_id,
+    dark_theme,
+    figure_ids,
+    class_names,
+):
+    unchanged = [no_update] * len(figure_ids)
+    hidden = {COLOR: BLUE, "display": "none"}
+    visible = {COLOR: BLUE}
+
+    # A new job was just submitted, so the previous dashboard is cleared and polling starts
+    triggered = [t["prop_id"] for t in callback_context.triggered]
+    if JOB_STORE + "." + DATA in triggered:
+        if not job_id:
+            return [], True, hidden, [], unchanged, unchanged
+        return [], False, visible, [], unchanged, unchanged
+
+    session = get_session_store().get(session_id)
+    if session is None:
+        if PROGRESS_INTERVAL + ".n_intervals" not in triggered:
+            raise PreventUpdate
+        # The session was evicted (i.e. it was idle for too long), so there's nowhere to put the chat anymore
+        if job_id:
+            get_job_queue().cancel(job_id)
+            get_job_queue().release(job_id)
+        return (
+            error_layout(
+                "This session has expired", "Try uploading the chat again"
+            ),
+            True,
+            hidden,
+            no_update,
+            unchanged,
+            unchanged,
+        )
+    with session.lock:
+        return __update_session(
+            session,
+            triggered,
+            job_id,
+            customization,
+            research_consent,
+            dark_theme,
+            figure_ids,
+            class_names,
+        )
+
+
+def __update_session(
+    session: Session,
+    triggered,
+    job_id,
+    customization,
+    research_consent,
+    dark_theme,
+    figure_ids,
+    class_names,
+):
+    g = session.graph
+    unchanged = [no_update] * len(figure_ids)
+    hidden = {COLOR: BLUE, "display": "none"}
+
+    # The customization only relabels and recolours the chat that's already been processed, so the dashboard is
+    # redrawn straight away. The research consent saves it if it's already been processed
+    if CUSTOMIZATION_STORE + "." + DATA in triggered:
+        if g.chat is None or not figure_ids:
+            raise PreventUpdate
+        try:
+            __customize(session, customization)
+        except ValueError as e:
+            return (
+                error_layout("Invalid graph customization", str(e)),
+                no_update,
+                no_update,
+                no_update,
+                unchanged,
+                unchanged,
+            )
+        dashboard = __layout_dashboard(g, dark_theme)
+        return no_update, no_update, no_update, dashboard, unchanged, unchanged
+    if FOR_RESEARCH + "." + VALUE in triggered:
+        if not session.is_processed:
+            raise PreventUpdate
+        __save_for_research(session, research_consent)
+        return (no_update,) * 4 + (unchanged, unchanged)
+
+    job_queue = get_job_queue()
+    status = job_queue.status(job_id) if job_id else None
+    if status is None:
+        raise PreventUpdate
+
+    if status["status"] in (FAILED, CANCELLED, TIMED_OUT):
+        job_queue.release(job_id)
+        return (
+            error_layout(
+                "The analysis {}".format(status["status"]),
+                status["error"] or "Try uploading the chat again",
+            ),
+            True,
+            hidden,
+            no_update,
+            unchanged,
+            unchanged,
+        )
+
+    meta = job_queue.meta(job_id)
+    progress = progress_layout(
+        status["status"], meta.get(STAGES, []), meta.get(TIMINGS, {})
+    )
+    parsed = meta.get(PARSED)
+    if parsed is None:
+        return progress, False, no_update, no_update, unchanged, unchanged
+
+    # Collect the columns of the stages that finished
+    done = status["status"] == FINISHED
+    is_drawn = bool(figure_ids)
+    if not is_drawn:
+        try:
+            df = read_partial(parsed[PARSED_URI])
+        except ServiceUnavailableError:
+            # It's read again at the next poll
+            return progress, False, no_update, no_update, unchanged, unchanged
+        g.chat = ChatFrame(df, parsed["participants"])
+        session.collected_partials = set()
+        g.word_cloud_layout = None
+        g.topic_graph_layout = None
+        session.parsed_participants = list(parsed["participants"])
+        session.parsed_media_count = dict(parsed["media_count_map"])
+        try:
+            __customize(session, customization)
+        except ValueError as e:
+            job_queue.cancel(job_id)
+            job_queue.release(job_id)
+            return (
+                error_layout("Invalid graph customization", str(e)),
+                True,
+                hidden,
+                no_update,
+                unchanged,
+                unchanged,
+            )
+    if done:
+        result = job_queue.result(job_id)
+        g.add_columns(
+            {column: result["df"][column] for column in result["df"]}
+        )
+    else:
+        # Each stage's columns are only read once, and the ones that can't be read right now at the next poll
+        for uri in meta.get(COLUMNS, {}).values():
+            if uri in session.collected_partials:
+                continue
+            try:
+                columns = read_partial(uri)
+            except ServiceUnavailableError:
+                break
+            g.add_columns({column: columns[column] for column in columns})
+            session.collected_partials.add(uri)
+
+    if done:
+        try:
+            delete_partials(meta)
+        except ServiceUnavailableError:
+            # They're swept instead
+            pass
+        job_queue.release(job_id)
+        session.is_processed = True
+        __save_for_research(session, research_consent)
+
+    # Draw the dashboard as soon as the upload has been parsed, with placeholders for the figures that are still
+    # waiting on their columns
+    if not is_drawn:
+        return (
+            progress,
+            done,
+            hidden if done else no_update,
+            __layout_dashboard(g, dark_theme),
+            [],
+            [],
+        )
+
+    # Then draw the figures that were waiting as their columns come in. Once everything is done, whatever is left
+    # is drawn with what's there
+    ready = [
+        figure_id["name"]
+        for figure_id, class_name in zip(figure_ids, class_names)
+        if class_name == PENDING_FIGURE
+        and (done or g.is_ready(figure_id["name"]))
+    ]
+    layouts = layout_figures(g, ready, dark_theme)
+    figures, figure_class_names = [], []
+    for figure_id in figure_ids:
+        figure = figure_id["name"]
+        if figure in layouts:
+            figures.append(layouts[figure])
+            figure_class_names.append("")
+        else:
+            figures.append(no_update)
+            figure_class_names.append(no_update)
+
+    return (
+        progress,
+        done,
+        hidden if done else no_update,
+        no_update,
+        figures,
+        figure_class_names,
+    )
+
+
+def __customize(session: Session, customization):
+    """Relabels the participants with their aliases and recolours the figures, without processing the chat again"""
+    g = session.graph
+    aliases = customization[PARTICIPANTS_ALIASES] if customization else {}
+    if aliases and len(aliases) != len(session.parsed_participants):
+        raise ValueError(
+            "There are {} participants in this chat but the customization was set for only {} - try "
+            "clearing the graph customization".format(
+                len(session.parsed_participants), len(aliases)
+            )
+        )
+    g.chat.rename_participants(
+        dict(
+            zip(
+                g.participants,
+                [
+                    aliases.get(name, name)
+                    for name in session.parsed_participants
+                ],
+            )
+        )
+    )
+    g.media_counter = {
+        aliases.get(name, name): count
+        for name, count in session.parsed_media_count.items()
+    }
+    g.color_map = customization[ALIASES_COLORS] if customization else None
+
+
+def __save_for_research(session: Session, research_consent):
+    # The processed chat is only stored once, the first time it's both processed and consented to
+    if research_consent and session.research_uid is None:
+        g = session.graph
+        try:
+            session.research_uid = get_share_writer().submit(
+                __sync_parser(session),
+                g.color_map,
+                True,
+                g.word_cloud_layout,
+                g.topic_graph_layout,
+            )
+        except ServiceUnavailableError:
+            # It's stored the next time the dashboard is updated instead
+            pass
+
+
+def __sync_parser(session: Session) -> Parser:
+    # The parser holds whatever is shared
+    g, parser = session.graph, session.parser
+    parser.parsed_df = g.df
+    parser.participants = g.participants
+    parser.media_count_map = g.media_counter
+    parser.entities = g.chat.entities
+    parser.emojis = g.chat.emojis
+    parser.conversations = g.chat.conversations
+    return parser
+
+
+def __layout_dashboard(g: Graph, dark_theme: bool) -> List:
+    # Figures that need columns that are still being computed get placeholders
+    pending_columns = Graph.required_columns(
+        DASHBOARD_PRESETS[Config.DASHBOARD_PRESET]
+    ) - set(g.df.columns)
+    return [
+        html.Div(
+            className="container",
+            style={"text-align": "center", "margin-bottom": "30px"},
+            children=[
+                html.Button(
+                    "Share Results",
+                    id=SHARE_BUTTON,
+                    n_clicks=0,
+                    style={COLOR: BLUE},
+                ),
+                html.Div(id=SHARE_URL, style={COLOR: BLUE}),
+            ],
+        ),
+        graph_layout(g, dark_theme, pending_columns=pending_columns),
+    ]
+
+
+@app.callback(
+    Output(CANCEL_BUTTON, "disabled"),
+    [Input(CANCEL_BUTTON, N_CLICKS), Input(JOB_STORE, DATA)],
+)
+def cancel_job(n_clicks, job_id):
+    # The button is enabled again whenever a new job is submitted
+    triggered = [t["prop_id"] for t in callback_context.triggered]
+    if JOB_STORE + "." + DATA in triggered:
+        return False
+    if n_clicks and job_id:
+        get_job_queue().cancel(job_id)
+        return True
+    raise PreventUpdate
 
 
 @app.callback(Output(CHAT_COUNT_MEMORY, DATA), [Input(UPLOAD, CONTENTS)])
@@ -178,11 +529,30 @@ def update_message_counter(content):
         Input(URL, "href"),
         Input(CUSTOMIZATION_STORE, DATA),
     ],
+    [State(SESSION, DATA)],
 )
-def generate_share_url(n_clicks, href, customization_data):
+def generate_share_url(n_clicks, href, customization_data, session_id):
     # Only trigger this the first time a user clicks on a button, after that no need
     if n_clicks == 1:
-        uuid = parser.save_data(g.color_map)
+        session = get_session_store().get(session_id)
+        if session is None:
+            return html.H6(
+                "This session has expired. To generate a link re-upload your data"
+            )
+        # The link is shown straight away, while the result is written in the background
+        with session.lock:
+            g = session.graph
+            try:
+                uuid = get_share_writer().submit(
+                    __sync_parser(session),
+                    g.color_map,
+                    word_cloud_layout=g.word_cloud_layout,
+                    topic_graph_layout=g.topic_graph_layout,
+                )
+            except ServiceUnavailableError:
+                return html.H6(
+                    "Sharing is unavailable right now. To generate a link re-upload your data in a few minutes"
+                )
         return [
             html.H6(href + "share?uuid=" + uuid),
             html.H6("This link will be valid for 3 days"),
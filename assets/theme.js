@@ -0,0 +1,17 @@
+/* Swaps the plotly template of the dashboard's charts when the theme is toggled, without redrawing them */
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    theme: {
+        swapTemplate: function (darkTheme, templates, ...chartFigures) {
+            const template = templates[darkTheme ? "dark" : "light"];
+            return chartFigures.map(figures =>
+                figures.map(figure =>
+                    figure
+                        ? Object.assign({}, figure, {
+                              layout: Object.assign({}, figure.layout, {template: template}),
+                          })
+                        : figure
+                )
+            );
+        },
+    },
+});
@@ -17,6 +17,13 @@ class Config:
 
     # Database Config
     DB_URL = environ.get("DB_URL")
+    # Seconds to wait for the DB (to be found, connected to, and to answer) and for the bucket, before giving up
+    DB_TIMEOUT = float(environ.get("DB_TIMEOUT", 2))
+    STORAGE_TIMEOUT = float(environ.get("STORAGE_TIMEOUT", 5))
+    # After this many failures in a row the DB (or the bucket) isn't called for a while (in seconds), and the app
+    # runs without counters or sharing
+    CIRCUIT_BREAKER_FAILURES = int(environ.get("CIRCUIT_BREAKER_FAILURES", 3))
+    CIRCUIT_BREAKER_RESET = float(environ.get("CIRCUIT_BREAKER_RESET", 30))
 
     # Cache Config
     # CACHE_DEBUG = environ.get('CACHE_DEBUG')
@@ -28,6 +35,70 @@ class Config:
     AWS_SECRET_ACCESS_KEY = environ.get("AWS_SECRET_ACCESS_KEY")
     PERMANENT_BUCKET_PATH = environ.get("PERMANENT_BUCKET_PATH")
     TEMP_BUCKET_PATH = environ.get("TEMP_BUCKET_PATH")
+    # Where results are stored when the bucket isn't configured (or can't be reached without credentials)
+    LOCAL_RESULT_PATH = environ.get("LOCAL_RESULT_PATH", "./tmp/")
+    # The connections the bucket's client keeps open, and the parts of a result that are transferred at a time
+    RESULT_STORE_CONNECTIONS = int(environ.get("RESULT_STORE_CONNECTIONS", 10))
+    RESULT_STORE_CONCURRENCY = int(environ.get("RESULT_STORE_CONCURRENCY", 4))
+
+    # Processing Config
+    PROCESSOR_WORKERS = (
+        int(environ.get("PROCESSOR_WORKERS"))
+        if environ.get("PROCESSOR_WORKERS")
+        else None
+    )
+    PROCESSOR_START_METHOD = environ.get("PROCESSOR_START_METHOD")
+    # One of the presets in constants.figures, "fast" skips all of the NLP models
+    DASHBOARD_PRESET = environ.get("DASHBOARD_PRESET", "full")
+    # Figures are built concurrently, and any that take longer than the budget (in seconds) are filled in later
+    FIGURE_WORKERS = int(environ.get("FIGURE_WORKERS", 4))
+    FIGURE_TIME_BUDGET = float(environ.get("FIGURE_TIME_BUDGET", 3))
+    # A message sent after a silence longer than this (in seconds) starts a new conversation
+    CONVERSATION_GAP = float(environ.get("CONVERSATION_GAP", 4 * 3600))
+
+    # Model Server Config, the NLP models are loaded by every processing worker unless MODEL_SERVER_ADDRESS (the
+    # path of a Unix socket) is set, in which case they're run by `python -m services.model_server`. It batches
+    # texts until there are MODEL_BATCH_SIZE of them or the first has waited MODEL_BATCH_LATENCY seconds, and runs
+    # up to MODEL_SERVER_THREADS batches at a time on MODEL_SERVER_PROCESSES processes (0 runs them on threads)
+    MODEL_SERVER_ADDRESS = environ.get("MODEL_SERVER_ADDRESS")
+    MODEL_BATCH_SIZE = int(environ.get("MODEL_BATCH_SIZE", 512))
+    MODEL_BATCH_LATENCY = float(environ.get("MODEL_BATCH_LATENCY", 0.02))
+    MODEL_SERVER_THREADS = int(environ.get("MODEL_SERVER_THREADS", 2))
+    MODEL_SERVER_PROCESSES = int(environ.get("MODEL_SERVER_PROCESSES", 2))
+    # The stop words, lexicons and lemmas compiled by `python setup.py` (or at boot if their sources have changed).
+    # The bundles of older sources are kept for RESOURCE_BUNDLE_GRACE seconds after they're replaced
+    RESOURCE_BUNDLE_PATH = environ.get(
+        "RESOURCE_BUNDLE_PATH", "./data/resources/"
+    )
+    RESOURCE_BUNDLE_GRACE = int(environ.get("RESOURCE_BUNDLE_GRACE", 86400))
+
+    # Session Config, the server side state of each user's upload is evicted once there are too many sessions,
+    # they use too much memory (in MB) or they've been idle for too long (in seconds)
+    SESSION_LIMIT = int(environ.get("SESSION_LIMIT", 32))
+    SESSION_MEMORY_LIMIT = (
+        int(environ.get("SESSION_MEMORY_LIMIT", 1024)) * 1024 * 1024
+    )
+    SESSION_TTL = int(environ.get("SESSION_TTL", 3600))
+
+    # Share Config, results are written in the background and failed writes are retried
+    SHARE_WRITER_WORKERS = int(environ.get("SHARE_WRITER_WORKERS", 2))
+    SHARE_WRITE_RETRIES = int(environ.get("SHARE_WRITE_RETRIES", 3))
+
+    # Expiry Config, temporary results are deleted RESULT_TTL seconds after they're written. The sweeper (run with
+    # `python -m services.result_sweeper`) deletes the objects of expired results every SWEEP_INTERVAL seconds (0
+    # turns it off), in batches, skipping ones that were written in the last SWEEP_GRACE_PERIOD seconds
+    RESULT_TTL = int(environ.get("RESULT_TTL", 72 * 60 * 60))
+    SWEEP_INTERVAL = int(environ.get("SWEEP_INTERVAL", 60 * 60))
+    SWEEP_BATCH_SIZE = int(environ.get("SWEEP_BATCH_SIZE", 500))
+    SWEEP_GRACE_PERIOD = int(environ.get("SWEEP_GRACE_PERIOD", 60 * 60))
+
+    # Job Queue Config, the "rq" backend also needs REDIS_URL
+    JOB_BACKEND = environ.get("JOB_BACKEND", "local")
+    JOB_WORKERS = int(environ.get("JOB_WORKERS", 2))
+    JOB_QUEUE_SIZE = int(environ.get("JOB_QUEUE_SIZE", 16))
+    JOB_TIMEOUT = int(environ.get("JOB_TIMEOUT", 600))
+    JOB_RESULT_TTL = int(environ.get("JOB_RESULT_TTL", 3600))
+    REDIS_URL = environ.get("REDIS_URL")
 
     # Heroku Deployment Config
     LOG_TO_STDOUT = environ.get("LOG_TO_STDOUT")
@@ -1,9 +1,10 @@
 """A list of all the columns in the fully analysed CSV, mainly cause I hate making typos in column names"""
-
 TOTAL = "Total"
 CLEANED_TEXT = "Cleaned Text"
+CONVERSATION = "Conversation"
 DAY = "Day"
 ENTITIES = "Entities"
+EMOJIS = "Emojis"
 EMOTION_LABEL = "Emotion Label"
 HOUR = "Hour"
 PROFANITY_SCORE = "Profanity Score"
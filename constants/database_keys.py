@@ -10,3 +10,9 @@ TYPE = "type"
 URI = "uri"
 MEDIA_COUNTER = "media_counter"
 COLOR_MAP = "color_map"
+WORD_CLOUD_LAYOUT = "word_cloud_layout"
+TOPIC_GRAPH_LAYOUT = "topic_graph_layout"
+# Whether the result has been written yet, older entries without one were always written before being inserted
+STATUS = "status"
+# Whether the result is kept for research, rather than expiring after RESULT_TTL
+IS_PERMANENT = "is_permanent"
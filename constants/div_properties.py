@@ -12,12 +12,14 @@ FOR_RESEARCH = "for-research"
 PARTICIPANT_COLORS = "participant-colors"
 DAQ_THEME = "daq-light-dark-theme"
 DATA = "data"
+FIGURE_TEMPLATES = "figure-templates"
 N_CLICKS = "n_clicks"
 MESSAGE_COUNT = "message-count"
 MESSAGE_COUNT_MEMORY = "message-count-memory"
 PARTICIPANTS = "participants"
 PARTICIPANTS_ALIASES = "participants-aliases"
 PRIVACY = "privacy"
+SESSION = "session"
 STYLE = "style"
 URL = "url"
 VALUE = "value"
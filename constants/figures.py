@@ -0,0 +1,43 @@
+"""The figures that can be drawn on the dashboard, named after their Graph methods, and presets of them"""
+PIE_CHARTS = "pie_charts"
+EMOJI_FREQUENCY = "emoji_frequency"
+DAILY_MESSAGES = "daily_messages"
+WORD_DISTRIBUTION = "word_distribution"
+WORD_CLOUD = "word_cloud"
+TIME_HEAT_MAP = "time_heat_map"
+CONVERSATIONS = "conversations"
+SENTIMENT_OVER_TIME = "sentiment_over_time"
+EMOTION_TREE_MAP = "emotion_tree_map"
+PROFANITY_SUNBURST = "profanity_sunburst"
+TOPIC_GRAPH = "topic_graph"
+REPLY_HEAT_MAP = "reply_heat_map"
+RESPONSE_TIMES = "response_times"
+
+FULL_DASHBOARD = "full"
+# Only the figures that can be drawn straight from the parser's output, without loading any NLP models
+FAST_DASHBOARD = "fast"
+
+DASHBOARD_PRESETS = {
+    FULL_DASHBOARD: [
+        PIE_CHARTS,
+        DAILY_MESSAGES,
+        WORD_DISTRIBUTION,
+        EMOJI_FREQUENCY,
+        WORD_CLOUD,
+        TIME_HEAT_MAP,
+        CONVERSATIONS,
+        SENTIMENT_OVER_TIME,
+        EMOTION_TREE_MAP,
+        PROFANITY_SUNBURST,
+        TOPIC_GRAPH,
+        REPLY_HEAT_MAP,
+        RESPONSE_TIMES,
+    ],
+    FAST_DASHBOARD: [
+        PIE_CHARTS,
+        DAILY_MESSAGES,
+        WORD_DISTRIBUTION,
+        EMOJI_FREQUENCY,
+        TIME_HEAT_MAP,
+    ],
+}
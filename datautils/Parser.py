@@ -1,15 +1,12 @@
-"""The Parser class is used for converting raw exported chats from various sources to a standard DF format """
+"""The Parser class is used for converting raw exported chats from various sources to a standard DF format"""
 import datetime
 from ast import literal_eval
 from collections import defaultdict
-from io import StringIO
 from typing import Dict
 
 import pandas as pd
-from boto3.session import Session
 from botocore.exceptions import NoCredentialsError
 from bson.objectid import ObjectId
-from smart_open import open
 
 from config import Config
 from constants.column_names import (
@@ -17,6 +14,8 @@ from constants.column_names import (
     RAW_TEXT,
     SENDER,
     CLEANED_TEXT,
+    CONVERSATION,
+    EMOJIS,
     ENTITIES,
 )
 from constants.date_formats import (
@@ -27,7 +26,12 @@ from constants.date_formats import (
     IS_SQUARE_BRACKET_Y_M_D_12,
 )
 from constants.messengers import WHATSAPP
+from datautils.chat_frame import ChatFrame
+from datautils.conversations import ConversationTable
+from datautils.emojis import EmojiTable
+from datautils.entities import EntityTable
 from services import counter_service, processed_data_service
+from services.result_store import get_result_store
 
 
 class Parser:
@@ -36,10 +40,9 @@ class Parser:
         self.parsed_df = None
         self.participants = None
         self.media_count_map = None
-        self.session = Session(
-            aws_access_key_id=Config.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=Config.AWS_SECRET_ACCESS_KEY,
-        )
+        self.entities = None
+        self.emojis = None
+        self.conversations = None
 
     def parse(self, raw_text: str, messenger: str = WHATSAPP):
         """
@@ -116,64 +119,152 @@ class Parser:
         self.media_count_map = media_count_map
         self.participants = list(df[SENDER].unique())
 
-        # The try-catch is here only in case there's some error reaching the DB, i.e. we still want users
-        # to be able to have their data parsed even if the DB is down
-        try:
-            counter_service.increment_chat_count()
-            counter_service.increase_message_count(df.shape[0])
-        finally:
-            pass
-
-    def reload_data(self, uri):
-        with open(
-            uri,
-            mode="r",
+        # The counters are skipped if the DB is down or slow, users can still have their data parsed
+        counter_service.increment_chat_count()
+        counter_service.increase_message_count(df.shape[0])
+
+    def reload_data(self, uri) -> ChatFrame:
+        # The entity, emoji and conversation tables (if there are any) are downloaded while the dataframe is
+        # being parsed
+        store = get_result_store(uri)
+        store.prefetch(self.__entities_uri(uri))
+        store.prefetch(self.__emojis_uri(uri))
+        store.prefetch(self.__conversations_uri(uri))
+        df = pd.read_csv(
+            store.fetch(uri),
+            index_col=0,
+            parse_dates=[TIMESTAMP],
             encoding="utf-8",
-            transport_params=dict(session=self.session),
-        ) as f:
-            df = pd.read_csv(f, index_col=0, parse_dates=[TIMESTAMP])
+        )
 
-        # Arrays and Dicts are stored as strings so you need to turn them back
-        df[CLEANED_TEXT] = df[CLEANED_TEXT].apply(lambda x: literal_eval(x))
-        df[ENTITIES] = df[ENTITIES].apply(lambda x: literal_eval(x))
+        # Arrays and Dicts are stored as strings so you need to turn them back (they might not have been
+        # computed if the dashboard only needed some of the columns)
+        if CLEANED_TEXT in df.columns:
+            df[CLEANED_TEXT] = df[CLEANED_TEXT].apply(
+                lambda x: literal_eval(x)
+            )
+        # Results saved before the entity table existed have a dict of entities per message, which the
+        # ChatFrame turns into the table
+        entities_frame = None
+        if ENTITIES in df.columns:
+            if df[ENTITIES].dtype == object:
+                df[ENTITIES] = df[ENTITIES].apply(lambda x: literal_eval(x))
+            else:
+                entities_frame = pd.read_csv(
+                    store.fetch(self.__entities_uri(uri)),
+                    keep_default_na=False,
+                    encoding="utf-8",
+                )
 
-        dfs = []
-        participants = df[SENDER].unique()
-        for participant in participants:
-            dfs.append(df[df[SENDER] == participant])
+        emojis_frame = None
+        if EMOJIS in df.columns:
+            emojis_frame = pd.read_csv(
+                store.fetch(self.__emojis_uri(uri)),
+                keep_default_na=False,
+                encoding="utf-8",
+            )
 
-        self.parsed_df = df
-        self.participants = participants
-        return dfs, participants
+        conversations = None
+        if CONVERSATION in df.columns:
+            conversations = ConversationTable.from_frame(
+                pd.read_csv(
+                    store.fetch(self.__conversations_uri(uri)),
+                    keep_default_na=False,
+                    encoding="utf-8",
+                ),
+                list(pd.unique(df[SENDER].values)),
+            )
 
-    def save_data(self, sender_color_map: Dict, is_permanent=False) -> str:
-        oid = ObjectId()
+        chat = ChatFrame(df, conversations=conversations)
+        if entities_frame is not None:
+            chat.entities = EntityTable.from_frame(
+                entities_frame, chat.df[SENDER].cat.codes.values
+            )
+        if emojis_frame is not None:
+            chat.emojis = EmojiTable.from_frame(
+                emojis_frame, chat.df[SENDER].cat.codes.values
+            )
+        self.parsed_df = chat.df
+        self.participants = chat.participants
+        self.entities = chat.entities
+        self.emojis = chat.emojis
+        self.conversations = chat.conversations
+        return chat
+
+    def save_data(
+        self,
+        sender_color_map: Dict,
+        is_permanent=False,
+        word_cloud_layout: Dict = None,
+        topic_graph_layout: Dict = None,
+        oid: ObjectId = None,
+    ) -> str:
+        """
+        Stores the parsed data in the bucket, and its entry in the DB
+        :param oid: the id to save it under, i.e. one that was handed out before it was saved. A new one by default
+        :return: the id it was saved under
+        """
+        if oid is None:
+            oid = ObjectId()
         uid = str(oid)
-        uri = Config.TEMP_BUCKET_PATH + uid + ".csv"
-        if is_permanent:
-            uri = Config.PERMANENT_BUCKET_PATH + uid + ".csv"
+        bucket_path = (
+            Config.PERMANENT_BUCKET_PATH
+            if is_permanent
+            else Config.TEMP_BUCKET_PATH
+        )
+        uri = (bucket_path or Config.LOCAL_RESULT_PATH) + uid + ".csv"
+        data = self.parsed_df.to_csv().encode("utf-8")
         try:
-            fout = open(
-                uri,
-                "w",
-                encoding="utf-8",
-                transport_params=dict(session=self.session),
+            get_result_store(uri).write(uri, data)
+        except NoCredentialsError:
+            uri = Config.LOCAL_RESULT_PATH + uid + ".csv"
+            get_result_store(uri).write(uri, data)
+
+        # The entity table is stored next to the dataframe, as a long table of mentions
+        if self.entities is not None:
+            get_result_store(uri).write(
+                self.__entities_uri(uri),
+                self.entities.to_frame().to_csv(index=False).encode("utf-8"),
+            )
+        if self.emojis is not None:
+            get_result_store(uri).write(
+                self.__emojis_uri(uri),
+                self.emojis.to_frame().to_csv(index=False).encode("utf-8"),
+            )
+        if self.conversations is not None:
+            get_result_store(uri).write(
+                self.__conversations_uri(uri),
+                self.conversations.to_frame(
+                    list(self.parsed_df[SENDER].cat.categories)
+                )
+                .to_csv(index=False)
+                .encode("utf-8"),
             )
-        except (NoCredentialsError, ValueError) as e:
-            uri = "./tmp/" + uid + ".csv"
-            fout = open(uri, "w", encoding="utf-8")
-
-        csv_buffer = StringIO()
-        self.parsed_df.to_csv(csv_buffer)
-        fout.write(csv_buffer.getvalue())
-        csv_buffer.close()
-        fout.close()
 
         processed_data_service.create_processed_data_entry(
-            oid, uri, sender_color_map, self.media_count_map
+            oid,
+            uri,
+            sender_color_map,
+            self.media_count_map,
+            word_cloud_layout,
+            topic_graph_layout,
+            is_permanent,
         )
         return uid
 
+    def snapshot(self) -> "Parser":
+        """
+        A copy of what's been parsed, which can be saved in the background while this parser keeps changing
+        """
+        snapshot = Parser()
+        snapshot.parsed_df = self.parsed_df.copy(deep=False)
+        snapshot.participants = list(self.participants)
+        snapshot.media_count_map = dict(self.media_count_map or {})
+        snapshot.entities = self.entities
+        snapshot.emojis = self.emojis
+        snapshot.conversations = self.conversations
+        return snapshot
+
     def set_customization(self, participant_alias_mapping):
         if len(self.parsed_df) == 0:
             raise ValueError("the parser has not parsed any dataframes")
@@ -192,6 +283,18 @@ class Parser:
 
         self.participants = list(self.parsed_df[SENDER].unique())
 
+    @staticmethod
+    def __entities_uri(uri: str) -> str:
+        return uri[: -len(".csv")] + ".entities.csv"
+
+    @staticmethod
+    def __emojis_uri(uri: str) -> str:
+        return uri[: -len(".csv")] + ".emojis.csv"
+
+    @staticmethod
+    def __conversations_uri(uri: str) -> str:
+        return uri[: -len(".csv")] + ".conversations.csv"
+
     @staticmethod
     def __invalid_whatsapp_message(message: str) -> bool:
         return (
@@ -0,0 +1,217 @@
+"""The aggregate cube of a chat, which the time based figures are sliced from instead of each grouping the messages"""
+from collections import Counter
+from itertools import chain
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from constants.column_names import (
+    CLEANED_TEXT,
+    SENDER,
+    SENTIMENT_SCORE,
+    TIMESTAMP,
+    WORD_COUNT,
+)
+from datautils.chat_frame import ChatFrame
+
+MESSAGES = "messages"
+WORDS = "words"
+SENTIMENT_SUM = "sentiment sum"
+SENTIMENT_COUNT = "sentiment count"
+
+DAILY = "D"
+WEEKLY = "W"
+MONTHLY = "M"
+# From the finest to the coarsest, with roughly how many days are in each period
+RESOLUTIONS = [(DAILY, 1), (WEEKLY, 7), (MONTHLY, 30.44)]
+# The most periods a time series is drawn with, the resolution is lowered to stay under it
+MAX_POINTS = 400
+
+NS_PER_HOUR = 3600 * 10 ** 9
+NS_PER_DAY = 24 * NS_PER_HOUR
+# 1970-01-01 was a Thursday
+EPOCH_WEEKDAY = 3
+
+
+class ChatCube:
+    """
+    Counts of a chat's messages per participant × day × hour × weekday, built in a single pass over the messages.
+    Only the cells that hold at least one message are stored, so it never grows past the size of the chat.
+    Measures whose column hasn't been computed yet are added by update() once it has, without another pass over
+    the timestamps
+    """
+
+    def __init__(self, chat: ChatFrame):
+        self.chat = chat
+        participant_codes = chat.df[SENDER].cat.codes.values.astype(np.int64)
+        ns = chat.df[TIMESTAMP].values.astype("datetime64[ns]").view(np.int64)
+        days = ns // NS_PER_DAY
+        hours = (ns // NS_PER_HOUR) % 24
+
+        self.first_day = int(days.min()) if len(days) else 0
+        self.num_days = (
+            int(days.max()) - self.first_day + 1 if len(days) else 0
+        )
+        days = days - self.first_day
+
+        # Every message is mapped to the cell it falls in, which is kept to add measures later on
+        keys = (participant_codes * max(self.num_days, 1) + days) * 24 + hours
+        cells, self.__cell_of_message = np.unique(keys, return_inverse=True)
+        self.__cell_of_message = self.__cell_of_message.astype(np.int32)
+        self.num_cells = len(cells)
+
+        self.hour = (cells % 24).astype(np.int8)
+        self.day = (cells // 24 % max(self.num_days, 1)).astype(np.int32)
+        self.participant = (cells // 24 // max(self.num_days, 1)).astype(
+            np.int16
+        )
+        self.weekday = (
+            (self.day + self.first_day + EPOCH_WEEKDAY) % 7
+        ).astype(np.int8)
+
+        self.measures = {MESSAGES: self.__sum(None)}
+        self.word_histogram = None
+        self.word_frequencies = None
+        self.__rollups = {}
+        self.update()
+
+    @property
+    def participants(self) -> List[str]:
+        return self.chat.participants
+
+    @property
+    def dates(self) -> pd.DatetimeIndex:
+        """The date of every day between the first and last message, including the ones without any"""
+        return pd.to_datetime(
+            (self.first_day + np.arange(self.num_days)) * NS_PER_DAY
+        )
+
+    def update(self):
+        """Adds the measures of any columns that have been computed since the cube was built"""
+        df = self.chat.df
+        if WORDS not in self.measures and WORD_COUNT in df.columns:
+            word_counts = df[WORD_COUNT].values.astype(np.int64)
+            self.measures[WORDS] = self.__sum(word_counts)
+            # How many messages of each length every participant sent
+            width = int(word_counts.max()) + 1 if len(word_counts) else 1
+            self.word_histogram = np.bincount(
+                df[SENDER].cat.codes.values.astype(np.int64) * width
+                + word_counts,
+                minlength=len(self.participants) * width,
+            ).reshape(len(self.participants), width)
+        if (
+            SENTIMENT_SUM not in self.measures
+            and SENTIMENT_SCORE in df.columns
+        ):
+            scores = df[SENTIMENT_SCORE].values.astype(np.float64)
+            scored = ~np.isnan(scores)
+            self.measures[SENTIMENT_SUM] = self.__sum(
+                np.where(scored, scores, 0)
+            )
+            self.measures[SENTIMENT_COUNT] = self.__sum(scored)
+        if self.word_frequencies is None and CLEANED_TEXT in df.columns:
+            # How often every word (after cleaning) is used in the whole chat
+            self.word_frequencies = Counter(
+                chain.from_iterable(df[CLEANED_TEXT].values)
+            )
+
+    def resolution(
+        self,
+        start: pd.Timestamp = None,
+        end: pd.Timestamp = None,
+        max_points: int = MAX_POINTS,
+    ) -> str:
+        """
+        The finest resolution a time series between start and end can be drawn with, without going over max_points
+        periods. Defaults to the whole chat
+        """
+        dates = self.dates
+        if start is None and len(dates):
+            start = dates[0]
+        if end is None and len(dates):
+            end = dates[-1]
+        num_days = (end - start).days + 1 if len(dates) else 0
+        for freq, days_per_period in RESOLUTIONS:
+            if num_days / days_per_period <= max_points:
+                return freq
+        return RESOLUTIONS[-1][0]
+
+    def over_time(
+        self,
+        measure: str,
+        freq: str = DAILY,
+        start: pd.Timestamp = None,
+        end: pd.Timestamp = None,
+    ) -> pd.DataFrame:
+        """
+        Rolls a measure up over the hours and into periods. Each rollup is computed once and then sliced
+        :param measure: one of the measures, i.e. MESSAGES
+        :param freq: DAILY, WEEKLY or MONTHLY
+        :param start: only the periods that end after it are returned
+        :param end: only the periods that start before it are returned
+        :return: a dataframe with a row per period, labelled by its start, and a column per participant
+        """
+        if (measure, freq) not in self.__rollups:
+            self.__rollups[measure, freq] = self.__roll_up(measure, freq)
+        index, totals = self.__rollups[measure, freq]
+
+        first, last = 0, len(index)
+        if start is not None:
+            first = max(index.searchsorted(start, side="right") - 1, 0)
+        if end is not None:
+            last = index.searchsorted(end, side="right")
+        return pd.DataFrame(
+            totals[first:last],
+            index=index[first:last],
+            columns=self.participants,
+        )
+
+    def sentiment_over_time(
+        self,
+        freq: str = DAILY,
+        start: pd.Timestamp = None,
+        end: pd.Timestamp = None,
+    ) -> pd.DataFrame:
+        """The mean sentiment of each participant per period, NaN for periods without any messages"""
+        sums = self.over_time(SENTIMENT_SUM, freq, start, end)
+        counts = self.over_time(SENTIMENT_COUNT, freq, start, end)
+        return sums / counts.where(counts > 0)
+
+    def heat_map(self, measure: str = MESSAGES) -> np.ndarray:
+        """A measure summed over the participants and days, with a row per hour and a column per weekday"""
+        return np.bincount(
+            self.hour.astype(np.int64) * 7 + self.weekday,
+            weights=self.measures[measure],
+            minlength=24 * 7,
+        ).reshape(24, 7)
+
+    def totals(self, measure: str = MESSAGES) -> Dict[str, float]:
+        """A measure summed over everything but the participants"""
+        return dict(
+            zip(
+                self.participants,
+                np.bincount(
+                    self.participant,
+                    weights=self.measures[measure],
+                    minlength=len(self.participants),
+                ),
+            )
+        )
+
+    def __roll_up(self, measure: str, freq: str):
+        periods = self.dates.to_period(freq)
+        period_of_day, unique_periods = pd.factorize(periods, sort=True)
+        num_periods = len(unique_periods)
+        totals = np.bincount(
+            self.participant.astype(np.int64) * num_periods
+            + period_of_day[self.day],
+            weights=self.measures[measure],
+            minlength=len(self.participants) * num_periods,
+        ).reshape(len(self.participants), num_periods)
+        return unique_periods.to_timestamp(), totals.T
+
+    def __sum(self, values) -> np.ndarray:
+        return np.bincount(
+            self.__cell_of_message, weights=values, minlength=self.num_cells
+        )
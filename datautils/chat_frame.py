@@ -0,0 +1,182 @@
+"""The ChatFrame is the compact, columnar form of a chat that's shared by the processor and the graphs"""
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from constants.column_names import (
+    CONVERSATION,
+    DAY,
+    EMOJIS,
+    EMOTION_LABEL,
+    ENTITIES,
+    HOUR,
+    PROFANITY_LABEL,
+    PROFANITY_SCORE,
+    SENDER,
+    SENTIMENT_LABEL,
+    SENTIMENT_SCORE,
+    TIMESTAMP,
+    WORD_COUNT,
+)
+from datautils.conversations import ConversationTable
+from datautils.emojis import EmojiTable
+from datautils.entities import MESSAGE_ID, EntityTable
+
+# The narrowest types that fit each column's values
+NUMERIC_DTYPES = {
+    HOUR: np.int8,
+    DAY: np.int8,
+    WORD_COUNT: np.int32,
+    SENTIMENT_SCORE: np.float32,
+    PROFANITY_SCORE: np.float32,
+    # Once the entities are moved to the entity table, the column holds how many each message mentions
+    ENTITIES: np.int16,
+    # The same goes for the emojis, which are moved to the emoji table
+    EMOJIS: np.int16,
+    CONVERSATION: np.int32,
+}
+# Columns with only a handful of distinct values, which are stored as codes into their categories
+CATEGORICAL_COLUMNS = [SENDER, SENTIMENT_LABEL, PROFANITY_LABEL, EMOTION_LABEL]
+
+
+class ChatFrame:
+    """
+    Wraps the dataframe of a chat, storing the sender and labels as categoricals and the numbers in the narrowest
+    types that fit them. The messages of each participant are exposed through the positions of their rows instead
+    of a copy of the dataframe per participant. The named entities, the emojis and the conversations are kept in separate tables
+    """
+
+    def __init__(
+        self,
+        df: pd.DataFrame,
+        participants: List[str] = None,
+        entities: EntityTable = None,
+        emojis: EmojiTable = None,
+        conversations: ConversationTable = None,
+    ):
+        """
+        :param df: a dataframe with at least the parser's columns, it's compacted in place
+        :param participants: the order of the participants, defaults to the order they first show up in
+        :param entities: the entity table, if it was stored separately from the dataframe
+        :param emojis: the emoji table, if it was stored separately from the dataframe
+        :param conversations: the conversation table, if it was stored separately from the dataframe
+        """
+        self.df = df
+        self.entities = entities
+        self.emojis = emojis
+        self.conversations = conversations
+        if participants is None:
+            participants = list(pd.unique(df[SENDER].values))
+        self.df[SENDER] = pd.Categorical(
+            df[SENDER].values, categories=list(participants)
+        )
+        self.df[TIMESTAMP] = pd.to_datetime(df[TIMESTAMP])
+        self.__groups = None
+        self.compact()
+
+    @property
+    def participants(self) -> List[str]:
+        return list(self.df[SENDER].cat.categories)
+
+    @property
+    def timestamps(self) -> pd.DatetimeIndex:
+        """The timestamps as a DatetimeIndex, sharing memory with the column"""
+        return pd.DatetimeIndex(self.df[TIMESTAMP].values)
+
+    @property
+    def groups(self) -> Dict[str, np.ndarray]:
+        """The row positions of each participant's messages, computed once"""
+        if self.__groups is None:
+            codes = self.df[SENDER].cat.codes.values
+            order = np.argsort(codes, kind="stable")
+            bounds = np.searchsorted(
+                codes[order], np.arange(len(self.participants) + 1)
+            )
+            self.__groups = {
+                participant: order[bounds[i] : bounds[i + 1]]
+                for i, participant in enumerate(self.participants)
+            }
+        return self.__groups
+
+    def by_participant(self, column: str) -> Iterator[Tuple[str, np.ndarray]]:
+        """
+        Iterates over the values of a single column for each participant, without copying any other column
+        """
+        values = self.df[column].values
+        for participant, positions in self.groups.items():
+            yield participant, values[positions]
+
+    def entities_between(
+        self, start: pd.Timestamp, end: pd.Timestamp
+    ) -> EntityTable:
+        """The entities mentioned in the messages sent in [start, end)"""
+        timestamps = self.df[TIMESTAMP].values
+        return self.entities.select(
+            (timestamps >= np.datetime64(start))
+            & (timestamps < np.datetime64(end))
+        )
+
+    def compact(self):
+        """Narrows the types of any columns that were added since the last time"""
+        if ENTITIES in self.df.columns and self.df[ENTITIES].dtype == object:
+            # The entities found in each message are moved to the entity table
+            self.entities = EntityTable.from_messages(
+                self.df[ENTITIES].values, self.df[SENDER].cat.codes.values
+            )
+            self.df[ENTITIES] = np.bincount(
+                self.entities.mentions[MESSAGE_ID].values,
+                minlength=len(self.df),
+            ).astype(np.int16)
+        if EMOJIS in self.df.columns and self.df[EMOJIS].dtype == object:
+            self.emojis = EmojiTable.from_messages(
+                self.df[EMOJIS].values, self.df[SENDER].cat.codes.values
+            )
+            self.df[EMOJIS] = np.bincount(
+                self.emojis.uses[MESSAGE_ID].values, minlength=len(self.df)
+            ).astype(np.int16)
+        if CONVERSATION in self.df.columns and self.conversations is None:
+            # The column keeps the conversation of each message, and the table what happened in each one
+            self.conversations = ConversationTable.from_messages(
+                self.df[CONVERSATION].values,
+                self.df[TIMESTAMP].values,
+                self.df[SENDER].cat.codes.values,
+            )
+        for column, dtype in NUMERIC_DTYPES.items():
+            if column in self.df.columns and self.df[column].dtype != dtype:
+                self.df[column] = self.df[column].astype(dtype)
+        for column in CATEGORICAL_COLUMNS:
+            if column in self.df.columns and not isinstance(
+                self.df[column].dtype, pd.CategoricalDtype
+            ):
+                self.df[column] = self.df[column].astype("category")
+
+    def add_columns(self, columns: Dict[str, pd.Series]) -> bool:
+        """
+        Adds columns that were computed elsewhere (i.e. in the background), skipping the ones it already has
+        :return: whether anything was added
+        """
+        new_columns = {
+            name: column
+            for name, column in columns.items()
+            if name not in self.df.columns
+        }
+        for name, column in new_columns.items():
+            self.df[name] = column
+        if new_columns:
+            self.compact()
+        return bool(new_columns)
+
+    def rename_participants(self, aliases: Dict[str, str]):
+        """Replaces the participants' names, only the categories are touched"""
+        self.df[SENDER] = self.df[SENDER].cat.rename_categories(
+            lambda name: aliases.get(name, name)
+        )
+        self.__groups = None
+
+    def memory_usage(self) -> int:
+        """The number of bytes used by the dataframe, including the strings"""
+        return int(self.df.memory_usage(index=True, deep=True).sum())
+
+    def __len__(self) -> int:
+        return len(self.df)
@@ -0,0 +1,216 @@
+"""The conversations of a chat, i.e. runs of messages without a long silence between them. They're found with a
+single pass over the timestamps, and stored as a long table of who took part in each conversation, so that the
+figures about them never go back to the messages"""
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from datautils.entities import PARTICIPANT
+
+# The columns of the conversations table
+START = "Start"
+END = "End"
+INITIATOR = "Initiator"
+# The columns of the members table, besides the participant
+CONVERSATION = "Conversation"
+MESSAGES = "Messages"
+REPLIES = "Replies"
+REPLY_TIME = "Reply Time"
+
+NS_PER_SECOND = 10 ** 9
+
+
+def split_conversations(timestamps: np.ndarray, gap: float) -> np.ndarray:
+    """
+    The conversation id of each message, where a new conversation is started by every message sent more than gap
+    seconds after the one before it
+    :param timestamps: the messages' timestamps, in the order they were sent
+    :param gap: the longest silence (in seconds) within a conversation
+    """
+    ns = np.asarray(timestamps).astype("datetime64[ns]").view(np.int64)
+    starts = np.ones(len(ns), dtype=bool)
+    np.greater(np.diff(ns), gap * NS_PER_SECOND, out=starts[1:])
+    return (np.cumsum(starts) - 1).astype(np.int32)
+
+
+class ConversationTable:
+    """
+    A row of (start, end, initiator code) per conversation, and a row of (conversation id, participant code,
+    messages, replies, reply time) for every participant of each conversation. A reply is a message that follows
+    someone else's message in the same conversation, and its reply time is the seconds since that message
+    """
+
+    def __init__(self, conversations: pd.DataFrame, members: pd.DataFrame):
+        """
+        :param conversations: the conversations table, by conversation id
+        :param members: the long table of the participants of each conversation, sorted by conversation
+        """
+        self.conversations = conversations
+        self.members = members
+
+    @classmethod
+    def from_messages(
+        cls,
+        conversation_ids: np.ndarray,
+        timestamps: np.ndarray,
+        participant_codes: np.ndarray,
+    ) -> "ConversationTable":
+        """
+        Builds the table from the conversation each message is part of
+        :param conversation_ids: what split_conversations() returned
+        :param timestamps: the messages' timestamps
+        :param participant_codes: the code of each message's sender
+        """
+        conversation_ids = np.asarray(conversation_ids, dtype=np.int64)
+        codes = np.asarray(participant_codes, dtype=np.int64)
+        timestamps = np.asarray(timestamps).astype("datetime64[ns]")
+        ns = timestamps.view(np.int64)
+
+        # The conversation ids only ever grow, so each conversation is a contiguous run of messages
+        is_first = np.ones(len(conversation_ids), dtype=bool)
+        np.not_equal(
+            conversation_ids[1:], conversation_ids[:-1], out=is_first[1:]
+        )
+        firsts = np.flatnonzero(is_first)
+        lasts = np.append(firsts[1:] - 1, len(conversation_ids) - 1)[
+            : len(firsts)
+        ]
+        conversations = pd.DataFrame(
+            {
+                START: timestamps[firsts],
+                END: timestamps[lasts],
+                INITIATOR: codes[firsts].astype(np.int16),
+            }
+        )
+
+        is_reply = ~is_first
+        is_reply[1:] &= codes[1:] != codes[:-1]
+        reply_times = np.zeros(len(ns), dtype=np.float64)
+        reply_times[1:] = np.diff(ns) / NS_PER_SECOND
+        reply_times[~is_reply] = 0
+
+        # Every message is mapped to its (conversation, participant) pair, in the order the pairs first show up
+        width = int(codes.max()) + 1 if len(codes) else 1
+        member_of_message, pairs = pd.factorize(
+            (np.cumsum(is_first) - 1) * width + codes
+        )
+        members = pd.DataFrame(
+            {
+                CONVERSATION: (pairs // width).astype(np.int32),
+                PARTICIPANT: (pairs % width).astype(np.int16),
+                MESSAGES: np.bincount(
+                    member_of_message, minlength=len(pairs)
+                ).astype(np.int32),
+                REPLIES: np.bincount(
+                    member_of_message, weights=is_reply, minlength=len(pairs)
+                ).astype(np.int32),
+                REPLY_TIME: np.bincount(
+                    member_of_message,
+                    weights=reply_times,
+                    minlength=len(pairs),
+                ),
+            }
+        )
+        return cls(conversations, members)
+
+    @classmethod
+    def from_frame(
+        cls, df: pd.DataFrame, participants: List[str]
+    ) -> "ConversationTable":
+        """Rebuilds the table from what to_frame() returned, i.e. once it's been read back from a CSV"""
+        conversations = df.drop_duplicates(CONVERSATION)
+        participants = [str(participant) for participant in participants]
+        return cls(
+            pd.DataFrame(
+                {
+                    START: pd.to_datetime(conversations[START]).values,
+                    END: pd.to_datetime(conversations[END]).values,
+                    INITIATOR: cls.__codes(
+                        conversations[INITIATOR], participants
+                    ),
+                }
+            ),
+            pd.DataFrame(
+                {
+                    CONVERSATION: df[CONVERSATION].values.astype(np.int32),
+                    PARTICIPANT: cls.__codes(df[PARTICIPANT], participants),
+                    MESSAGES: df[MESSAGES].values.astype(np.int32),
+                    REPLIES: df[REPLIES].values.astype(np.int32),
+                    REPLY_TIME: df[REPLY_TIME].values.astype(np.float64),
+                }
+            ),
+        )
+
+    def to_frame(self, participants: List[str]) -> pd.DataFrame:
+        """
+        The members with the start, end and initiator of their conversation, and the participants' names instead
+        of their codes, for storing
+        """
+        conversation_ids = self.members[CONVERSATION].values
+        names = np.array(participants, dtype=object)
+        return pd.DataFrame(
+            {
+                CONVERSATION: conversation_ids,
+                START: self.conversations[START].values[conversation_ids],
+                END: self.conversations[END].values[conversation_ids],
+                INITIATOR: names[
+                    self.conversations[INITIATOR].values[conversation_ids]
+                ],
+                PARTICIPANT: names[self.members[PARTICIPANT].values],
+                MESSAGES: self.members[MESSAGES].values,
+                REPLIES: self.members[REPLIES].values,
+                REPLY_TIME: self.members[REPLY_TIME].values,
+            }
+        )
+
+    def message_counts(self) -> np.ndarray:
+        """How many messages each conversation holds, by conversation id"""
+        return np.bincount(
+            self.members[CONVERSATION].values,
+            weights=self.members[MESSAGES].values,
+            minlength=len(self),
+        ).astype(np.int64)
+
+    def durations(self) -> np.ndarray:
+        """How many seconds each conversation lasted, by conversation id"""
+        return (
+            self.conversations[END].values - self.conversations[START].values
+        ) / np.timedelta64(1, "s")
+
+    def initiations(self, num_participants: int) -> np.ndarray:
+        """How many conversations each participant started, by participant code"""
+        return np.bincount(
+            self.conversations[INITIATOR].values, minlength=num_participants
+        )
+
+    def response_times(
+        self, num_participants: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        How long each participant takes to reply on average, by participant code
+        :return: the mean reply time (in seconds, NaN for participants who never replied) and the number of replies
+        """
+        codes = self.members[PARTICIPANT].values
+        replies = np.bincount(
+            codes,
+            weights=self.members[REPLIES].values,
+            minlength=num_participants,
+        )
+        reply_time = np.bincount(
+            codes,
+            weights=self.members[REPLY_TIME].values,
+            minlength=num_participants,
+        )
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(replies > 0, reply_time / replies, np.nan)
+        return mean, replies.astype(np.int64)
+
+    def __len__(self) -> int:
+        return len(self.conversations)
+
+    @staticmethod
+    def __codes(names: pd.Series, participants: List[str]) -> np.ndarray:
+        return pd.Categorical(
+            names.astype(str).values, categories=participants
+        ).codes.astype(np.int16)
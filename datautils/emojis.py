@@ -0,0 +1,146 @@
+"""The emojis used in a chat, found in a single pass over the text and stored as a long table of uses with a
+dictionary of emojis"""
+from typing import Iterable, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import regex
+
+from datautils.entities import MESSAGE_ID, PARTICIPANT
+
+# An emoji is a whole grapheme (i.e. with its skin tone, or every person of a ZWJ sequence) that starts with a
+# pictograph or a flag's letter, or a keycap
+EMOJI = r"[#*0-9]️?⃣|(?=[\p{Extended_Pictographic}\p{Regional_Indicator}])\X"
+EMOJI_PATTERN = regex.compile(EMOJI)
+# A word made of nothing but letters and emojis
+WORD_PATTERN = regex.compile(r"(?:\p{L}|" + EMOJI + r")*")
+# Put between the messages when they're searched as one text, which no emoji can span
+SEPARATOR = "\n"
+
+# The columns of the uses table, besides the message id and participant
+EMOJI_ID = "Emoji"
+USES = "Uses"
+
+
+def find_emojis(texts: Sequence[str]) -> Tuple[np.ndarray, List[str]]:
+    """
+    Finds every emoji used in a column of messages, by searching them all at once rather than one at a time
+    :return: the position of the message each emoji was used in, and the emojis themselves, in order
+    """
+    texts = [str(text) for text in texts]
+    starts = np.zeros(len(texts) + 1, dtype=np.int64)
+    np.cumsum([len(text) + 1 for text in texts], out=starts[1:])
+    positions, emojis = [], []
+    for match in EMOJI_PATTERN.finditer(SEPARATOR.join(texts)):
+        positions.append(match.start())
+        emojis.append(match.group())
+    message_ids = np.searchsorted(starts, positions, side="right") - 1
+    return message_ids.astype(np.int32), emojis
+
+
+class EmojiTable:
+    """
+    Every use of an emoji is a row of (message id, participant code, emoji id), where the message id is the
+    position of the message in the chat, and the dictionary holds the emoji of each id
+    """
+
+    def __init__(self, uses: pd.DataFrame, emojis: np.ndarray):
+        """
+        :param uses: the long table of uses
+        :param emojis: the emoji of each id
+        """
+        self.uses = uses
+        self.emojis = emojis
+
+    @classmethod
+    def from_messages(
+        cls, emojis: Iterable, participant_codes: np.ndarray
+    ) -> "EmojiTable":
+        """
+        Builds the table from the emojis found in each message
+        :param emojis: a list of emojis per message
+        :param participant_codes: the code of each message's sender
+        """
+        message_ids, found = [], []
+        for message_id, message_emojis in enumerate(emojis):
+            for emoji in message_emojis:
+                message_ids.append(message_id)
+                found.append(emoji)
+        message_ids = np.array(message_ids, dtype=np.int32)
+        return cls.__build(
+            message_ids, np.asarray(participant_codes)[message_ids], found
+        )
+
+    @classmethod
+    def from_frame(
+        cls, df: pd.DataFrame, participant_codes: np.ndarray
+    ) -> "EmojiTable":
+        """Rebuilds the table from what to_frame() returned, i.e. once it's been read back from a CSV"""
+        message_ids = df[MESSAGE_ID].values.astype(np.int32)
+        return cls.__build(
+            message_ids,
+            np.asarray(participant_codes)[message_ids],
+            df[EMOJI_ID].astype(str).values,
+        )
+
+    def to_frame(self) -> pd.DataFrame:
+        """The uses with the emojis instead of their ids, for storing"""
+        return pd.DataFrame(
+            {
+                MESSAGE_ID: self.uses[MESSAGE_ID].values,
+                EMOJI_ID: self.emojis[self.uses[EMOJI_ID].values],
+            }
+        )
+
+    def counts(self) -> np.ndarray:
+        """How many times each emoji was used, by emoji id"""
+        return np.bincount(
+            self.uses[EMOJI_ID].values, minlength=len(self.emojis)
+        )
+
+    def top_emojis(self, participants: List[str], n: int) -> pd.DataFrame:
+        """
+        How many times each participant used each of the n emojis used the most overall, with a row per
+        (participant, emoji) ordered by the emoji's rank
+        """
+        top_ids = np.argsort(-self.counts(), kind="stable")[:n]
+        ranks = np.full(len(self.emojis), -1, dtype=np.int32)
+        ranks[top_ids] = np.arange(len(top_ids))
+        uses = self.uses[ranks[self.uses[EMOJI_ID].values] >= 0]
+        weights = (
+            uses.groupby([EMOJI_ID, PARTICIPANT], sort=False)
+            .size()
+            .rename(USES)
+            .reset_index()
+        )
+        weights = weights.iloc[
+            np.lexsort(
+                (weights[PARTICIPANT].values, ranks[weights[EMOJI_ID].values])
+            )
+        ]
+        return pd.DataFrame(
+            {
+                PARTICIPANT: np.array(participants)[
+                    weights[PARTICIPANT].values
+                ],
+                EMOJI_ID: self.emojis[weights[EMOJI_ID].values],
+                USES: weights[USES].values,
+            }
+        )
+
+    def __len__(self) -> int:
+        return len(self.uses)
+
+    @classmethod
+    def __build(cls, message_ids, participant_codes, found):
+        emojis, emoji_ids = np.unique(
+            np.array(found, dtype=object).astype(str), return_inverse=True
+        )
+        uses = pd.DataFrame(
+            {
+                MESSAGE_ID: np.asarray(message_ids, dtype=np.int32),
+                PARTICIPANT: np.asarray(participant_codes, dtype=np.int16),
+                EMOJI_ID: emoji_ids.astype(np.int32),
+            }
+        )
+        return cls(uses, emojis.astype(object))
@@ -0,0 +1,165 @@
+"""The named entities mentioned in a chat, stored as a long table of mentions with a dictionary of entities"""
+from typing import Iterable, List
+
+import numpy as np
+import pandas as pd
+
+from constants.topic_labels import SIMPLIFIED_LABELS
+
+# The columns of the mentions table
+MESSAGE_ID = "Message ID"
+PARTICIPANT = "Participant"
+ENTITY = "Entity"
+LABEL = "Label"
+MENTIONS = "Mentions"
+
+
+class EntityTable:
+    """
+    Every mention of an entity is a row of (message id, participant code, entity id, label code), where the
+    message id is the position of the message in the chat. Entities that only differ in case share an id, and
+    the dictionary holds the most common form and label of each one
+    """
+
+    def __init__(
+        self, mentions: pd.DataFrame, names: np.ndarray, labels: np.ndarray
+    ):
+        """
+        :param mentions: the long table of mentions
+        :param names: the text of each entity id
+        :param labels: the label code of each entity id, into SIMPLIFIED_LABELS
+        """
+        self.mentions = mentions
+        self.names = names
+        self.labels = labels
+
+    @classmethod
+    def from_messages(
+        cls, entities: Iterable, participant_codes: np.ndarray
+    ) -> "EntityTable":
+        """
+        Builds the table from what the entity extraction found in each message
+        :param entities: a {text: label} dict (or (text, label) pairs) per message
+        :param participant_codes: the code of each message's sender
+        """
+        message_ids, texts, labels = [], [], []
+        for message_id, message_entities in enumerate(entities):
+            if isinstance(message_entities, dict):
+                message_entities = message_entities.items()
+            for text, label in message_entities:
+                message_ids.append(message_id)
+                texts.append(text)
+                labels.append(label)
+        message_ids = np.array(message_ids, dtype=np.int32)
+        return cls.__build(
+            message_ids,
+            np.asarray(participant_codes)[message_ids],
+            texts,
+            labels,
+        )
+
+    @classmethod
+    def from_frame(
+        cls, df: pd.DataFrame, participant_codes: np.ndarray
+    ) -> "EntityTable":
+        """Rebuilds the table from what to_frame() returned, i.e. once it's been read back from a CSV"""
+        message_ids = df[MESSAGE_ID].values.astype(np.int32)
+        return cls.__build(
+            message_ids,
+            np.asarray(participant_codes)[message_ids],
+            df[ENTITY].astype(str).values,
+            df[LABEL].values,
+        )
+
+    def to_frame(self) -> pd.DataFrame:
+        """The mentions with the entities' text and labels instead of their codes, for storing"""
+        return pd.DataFrame(
+            {
+                MESSAGE_ID: self.mentions[MESSAGE_ID].values,
+                ENTITY: self.names[self.mentions[ENTITY].values],
+                LABEL: np.array(SIMPLIFIED_LABELS)[
+                    self.mentions[LABEL].values
+                ],
+            }
+        )
+
+    def counts(self) -> np.ndarray:
+        """How many times each entity was mentioned, by entity id"""
+        return np.bincount(
+            self.mentions[ENTITY].values, minlength=len(self.names)
+        )
+
+    def weights(self) -> pd.Series:
+        """How many times each participant mentioned each entity, indexed by (participant code, entity id)"""
+        return self.mentions.groupby([PARTICIPANT, ENTITY], sort=True).size()
+
+    def top_entities(self, participants: List[str], n: int) -> pd.DataFrame:
+        """The n entities each participant mentioned the most, with a row per (participant, entity)"""
+        weights = self.weights().rename(MENTIONS).reset_index()
+        weights = weights.sort_values(
+            [PARTICIPANT, MENTIONS], ascending=[True, False], kind="stable"
+        )
+        top = weights[weights.groupby(PARTICIPANT).cumcount() < n]
+        return pd.DataFrame(
+            {
+                PARTICIPANT: np.array(participants)[top[PARTICIPANT].values],
+                ENTITY: self.names[top[ENTITY].values],
+                LABEL: np.array(SIMPLIFIED_LABELS)[
+                    self.labels[top[ENTITY].values]
+                ],
+                MENTIONS: top[MENTIONS].values,
+            }
+        )
+
+    def select(self, message_mask: np.ndarray) -> "EntityTable":
+        """
+        The mentions in some of the messages, i.e. the ones sent within a time range. The dictionary is shared
+        :param message_mask: a boolean per message of the chat
+        """
+        keep = message_mask[self.mentions[MESSAGE_ID].values]
+        return EntityTable(
+            self.mentions[keep].reset_index(drop=True), self.names, self.labels
+        )
+
+    def __len__(self) -> int:
+        return len(self.mentions)
+
+    @classmethod
+    def __build(cls, message_ids, participant_codes, texts, labels):
+        texts = pd.Series(texts, dtype=object)
+        keys, entity_ids = np.unique(
+            texts.str.casefold().values.astype(str), return_inverse=True
+        )
+        label_codes = pd.Categorical(
+            labels, categories=SIMPLIFIED_LABELS
+        ).codes.astype(np.int8)
+
+        # Each entity is named after its most common form, and labelled with its most common label
+        forms = (
+            pd.DataFrame({ENTITY: entity_ids, "text": texts.values})
+            .groupby([ENTITY, "text"], sort=False)
+            .size()
+            .sort_values(ascending=False, kind="stable")
+            .reset_index()
+            .drop_duplicates(ENTITY)
+            .sort_values(ENTITY)
+        )
+        names = np.empty(len(keys), dtype=object)
+        names[forms[ENTITY].values] = forms["text"].values
+        entity_labels = np.zeros(len(keys), dtype=np.int8)
+        if len(keys):
+            label_counts = np.zeros(
+                (len(keys), len(SIMPLIFIED_LABELS)), dtype=np.int64
+            )
+            np.add.at(label_counts, (entity_ids, label_codes), 1)
+            entity_labels = label_counts.argmax(axis=1).astype(np.int8)
+
+        mentions = pd.DataFrame(
+            {
+                MESSAGE_ID: np.asarray(message_ids, dtype=np.int32),
+                PARTICIPANT: np.asarray(participant_codes, dtype=np.int16),
+                ENTITY: entity_ids.astype(np.int32),
+                LABEL: label_codes,
+            }
+        )
+        return cls(mentions, names, entity_labels)
@@ -0,0 +1,326 @@
+"""A small stage DAG executor, used to run the independent parts of the processing pipeline concurrently"""
+import logging
+import math
+import mmap
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Callable, Dict, List, NamedTuple, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Each parallel stage is split into roughly this many chunks per worker so that a slow stage
+# (i.e. entity extraction) can still be spread over every core
+CHUNKS_PER_WORKER = 4
+MIN_CHUNK_SIZE = 256
+# How often (in seconds) the stages check whether they should stop while they wait for the workers
+CHECK_INTERVAL = 0.25
+
+__pool = None
+
+
+class Stage(NamedTuple):
+    """
+    A single step of the pipeline
+    :param name: a unique name, used for reporting
+    :param inputs: the columns the stage reads
+    :param outputs: the columns the stage produces
+    :param func: func(columns, context) -> {column: values}. Parallel stages receive lists holding a chunk of
+    rows and must be defined at the module level so they can be sent to a worker process, while inline stages
+    receive the full pandas Series and run in the calling process
+    :param parallel: whether the stage should run on the process pool or inline
+    """
+
+    name: str
+    inputs: Tuple[str, ...]
+    outputs: Tuple[str, ...]
+    func: Callable
+    parallel: bool = True
+
+
+class StageTiming(NamedTuple):
+    """
+    How long a stage took
+    :param wall_time: seconds between the first chunk starting and the last one finishing
+    :param cpu_time: CPU seconds summed over every chunk
+    :param queue_wait: average seconds a chunk spent waiting for a free worker
+    """
+
+    name: str
+    wall_time: float
+    cpu_time: float
+    queue_wait: float
+
+
+class SharedTextColumn:
+    """
+    A string column packed into a single memory mapped file (on /dev/shm when available), so that worker
+    processes can read any slice of it without the text being pickled for each task. The file starts with the
+    int64 byte offsets of every value, followed by the UTF-8 encoded values themselves
+    """
+
+    def __init__(self, values: Sequence[str]):
+        encoded = [str(value).encode("utf-8") for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+
+        shm_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+        fd, self.path = tempfile.mkstemp(
+            prefix="banterly-", suffix=".col", dir=shm_dir
+        )
+        with os.fdopen(fd, "wb") as f:
+            f.write(offsets.tobytes())
+            f.write(b"".join(encoded))
+        self.length = len(encoded)
+
+    @property
+    def handle(self) -> Tuple[str, int]:
+        return self.path, self.length
+
+    def close(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def read_shared_text(
+    handle: Tuple[str, int], start: int, stop: int
+) -> List[str]:
+    """
+    Reads the values [start, stop) of a SharedTextColumn from its handle
+    """
+    path, length = handle
+    with open(path, "rb") as f, mmap.mmap(
+        f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as buffer:
+        offsets = np.frombuffer(buffer, dtype=np.int64, count=length + 1)
+        base = offsets.nbytes
+        values = [
+            buffer[base + offsets[i] : base + offsets[i + 1]].decode("utf-8")
+            for i in range(start, stop)
+        ]
+        del offsets
+    return values
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """
+    The process pool is shared by every request handled by this process, and created on first use
+    """
+    global __pool
+    if __pool is None:
+        __pool = ProcessPoolExecutor(
+            max_workers=Config.PROCESSOR_WORKERS,
+            mp_context=multiprocessing.get_context(
+                Config.PROCESSOR_START_METHOD
+            ),
+        )
+    return __pool
+
+
+def run_stages(
+    df: pd.DataFrame,
+    stages: Sequence[Stage],
+    context: Dict = None,
+    shared_columns: Sequence[str] = (),
+    callback: Callable[[StageTiming], None] = None,
+    check: Callable[[], None] = None,
+) -> List[StageTiming]:
+    """
+    Runs every stage as soon as all of its inputs are available, and adds their outputs to the dataframe in place
+    :param df: the dataframe holding the stages' initial inputs
+    :param stages: the stages to run, in any order
+    :param context: extra read only arguments passed to every stage (i.e. the language)
+    :param shared_columns: string columns that are shared with the workers through memory mapping
+    :param callback: called with the timing of each stage as soon as it completes
+    :param check: called between stages and every CHECK_INTERVAL while waiting for the workers, and stops the
+    stages by raising (i.e. when the job they're part of is cancelled). The chunks that haven't started yet are
+    cancelled, and the ones already running are left to finish in the background
+    :return: the timing of each stage, in order of completion
+    """
+    context = context or {}
+    available = set(df.columns)
+    producible = set(available)
+    for stage in stages:
+        producible.update(stage.outputs)
+    for stage in stages:
+        missing = set(stage.inputs) - producible
+        if missing:
+            raise ValueError(
+                "stage {} needs the columns {} which nothing produces".format(
+                    stage.name, sorted(missing)
+                )
+            )
+
+    num_rows = len(df)
+    pool = get_pool() if any(s.parallel for s in stages) else None
+    workers = Config.PROCESSOR_WORKERS or os.cpu_count() or 1
+    chunk_size = max(
+        MIN_CHUNK_SIZE, math.ceil(num_rows / (workers * CHUNKS_PER_WORKER))
+    )
+    chunks = [
+        (start, min(start + chunk_size, num_rows))
+        for start in range(0, num_rows, chunk_size)
+    ]
+
+    shared = {}
+    pending = list(stages)
+    futures = {}
+    results = {}
+    timings = []
+
+    def complete(stage: Stage, outputs: Dict, timing: StageTiming):
+        for column in stage.outputs:
+            df[column] = pd.Series(outputs[column], index=df.index)
+        available.update(stage.outputs)
+        timings.append(timing)
+        logger.info(
+            "stage %s finished in %.3fs (cpu %.3fs, queue wait %.3fs)",
+            timing.name,
+            timing.wall_time,
+            timing.cpu_time,
+            timing.queue_wait,
+        )
+        if callback:
+            callback(timing)
+
+    try:
+        while pending or futures:
+            # Keep starting stages until none of the remaining ones can run yet
+            ready = [s for s in pending if set(s.inputs) <= available]
+            while ready:
+                for stage in ready:
+                    if check:
+                        check()
+                    pending.remove(stage)
+                    if not stage.parallel or not chunks:
+                        outputs, timing = __run_inline(df, stage, context)
+                        complete(stage, outputs, timing)
+                        continue
+
+                    handles = {}
+                    for column in stage.inputs:
+                        if column in shared_columns:
+                            if column not in shared:
+                                shared[column] = SharedTextColumn(
+                                    df[column].values
+                                )
+                            handles[column] = shared[column].handle
+                    results[stage.name] = [None] * len(chunks)
+                    for index, (start, stop) in enumerate(chunks):
+                        sliced = {
+                            column: df[column].values[start:stop].tolist()
+                            for column in stage.inputs
+                            if column not in handles
+                        }
+                        future = pool.submit(
+                            _run_chunk,
+                            stage.func,
+                            handles,
+                            sliced,
+                            start,
+                            stop,
+                            context,
+                            time.time(),
+                        )
+                        futures[future] = (stage, index)
+                ready = [s for s in pending if set(s.inputs) <= available]
+
+            if not futures:
+                if pending:
+                    raise ValueError(
+                        "the stages {} depend on each other".format(
+                            [s.name for s in pending]
+                        )
+                    )
+                break
+
+            done, _ = wait(
+                list(futures),
+                timeout=CHECK_INTERVAL if check else None,
+                return_when=FIRST_COMPLETED,
+            )
+            if check:
+                check()
+            for future in done:
+                stage, index = futures.pop(future)
+                results[stage.name][index] = future.result()
+                if any(r is None for r in results[stage.name]):
+                    continue
+
+                chunk_results = results.pop(stage.name)
+                outputs = {
+                    column: [
+                        value
+                        for chunk_outputs, *_ in chunk_results
+                        for value in chunk_outputs[column]
+                    ]
+                    for column in stage.outputs
+                }
+                timing = StageTiming(
+                    name=stage.name,
+                    wall_time=max(r[3] for r in chunk_results)
+                    - min(r[2] for r in chunk_results),
+                    cpu_time=sum(r[4] for r in chunk_results),
+                    queue_wait=sum(r[1] for r in chunk_results)
+                    / len(chunk_results),
+                )
+                complete(stage, outputs, timing)
+    finally:
+        for future in futures:
+            future.cancel()
+        for column in shared.values():
+            column.close()
+
+    return timings
+
+
+def __run_inline(df: pd.DataFrame, stage: Stage, context: Dict):
+    started_at = time.time()
+    cpu_started_at = time.process_time()
+    if len(df) == 0:
+        outputs = {column: [] for column in stage.outputs}
+    else:
+        outputs = stage.func(
+            {column: df[column] for column in stage.inputs}, context
+        )
+    timing = StageTiming(
+        name=stage.name,
+        wall_time=time.time() - started_at,
+        cpu_time=time.process_time() - cpu_started_at,
+        queue_wait=0.0,
+    )
+    return outputs, timing
+
+
+def _run_chunk(
+    func: Callable,
+    handles: Dict[str, Tuple[str, int]],
+    sliced: Dict[str, List],
+    start: int,
+    stop: int,
+    context: Dict,
+    submitted_at: float,
+):
+    """Runs a single chunk of a parallel stage inside of a worker process"""
+    started_at = time.time()
+    cpu_started_at = time.process_time()
+    columns = dict(sliced)
+    for column, handle in handles.items():
+        columns[column] = read_shared_text(handle, start, stop)
+    outputs = func(columns, context)
+    return (
+        outputs,
+        started_at - submitted_at,
+        started_at,
+        time.time(),
+        time.process_time() - cpu_started_at,
+    )
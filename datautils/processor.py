@@ -1,19 +1,19 @@
+import logging
 import string
-from collections import defaultdict
-from typing import List
+from functools import lru_cache
+from typing import Callable, Iterable, List, Tuple
 
 import constants.column_names as cn
-import emoji
-from datautils.stopwords import stopwords
+import numpy as np
 import pandas as pd
 import spacy
 from nltk.sentiment.vader import SentimentIntensityAnalyzer
-from nltk.stem import WordNetLemmatizer
 from nltk.tokenize import word_tokenize
 from profanity_check import predict_prob as predict_prob_profane
 from typing import Set
 
 # from app import cache
+from config import Config
 from constants.profanity_labels import CLEAN, QUESTIONABLE, PROFANE
 from constants.sentiment_labels import (
     SUPER_POSITIVE,
@@ -25,70 +25,331 @@ from constants.sentiment_labels import (
     SUPER_NEGATIVE,
 )
 from constants.topic_labels import PARTICIPANTS_LABEL, TOPIC_REDUCTION_MAP
+from datautils.chat_frame import ChatFrame
+from datautils.conversations import split_conversations
+from datautils.emojis import WORD_PATTERN, find_emojis
+from datautils.executor import Stage, StageTiming, run_stages
+from datautils.resources import EmotionLexicon, load_bundle
+from services.model_server import get_model_client
+
+logger = logging.getLogger(__name__)
+
+# The tasks that need the NLP models, which run on the model server if there is one
+CLEANING_TASK = "cleaning"
+SENTIMENT_TASK = "sentiment"
+PROFANITY_TASK = "profanity"
+EMOTION_TASK = "emotion"
+ENTITIES_TASK = "entities"
 
 
 # @cache.memoize(timeout=3000)
 def process_data(
-    df: pd.DataFrame, lang: str = "en"
-) -> (List[pd.DataFrame], List[str]):
+    df: pd.DataFrame,
+    lang: str = "en",
+    columns: Iterable[str] = None,
+    callback: Callable[[StageTiming], None] = None,
+) -> ChatFrame:
     """
-    Adds extra columns to the dataframe passed in and generates subsets of it based on the sender
+    Adds extra columns to the dataframe passed in and wraps it in a ChatFrame. The stages that don't depend on
+    each other (i.e. sentiment, profanity and entities) run concurrently on the process pool
     :param df: a pandas dataframe with columns Timestamp: pandas.Timestamp | Sender: str | Raw Text: str
     :param lang: language code, default is 'en'
-    :return: dfs:
+    :param columns: the columns that are needed, only these and whatever they depend on are computed. All
+    of them are computed by default
+    :param callback: called with the timing of each stage as soon as it completes
+    :return: the processed chat
     """
-    # Load the language specific processing libraries
-    nlp = None
-    stop_words = None
-    if lang == "en":
-        nlp = spacy.load("en_core_web_sm")
-        stop_words = stopwords(nlp, lang)
-
-    df[cn.WORD_COUNT] = df[cn.RAW_TEXT].str.split(" ").apply(lambda l: len(l))
-    df[cn.HOUR] = df[cn.TIMESTAMP].apply(lambda x: x.hour)
-    df[cn.DAY] = df[cn.TIMESTAMP].apply(lambda x: x.dayofweek)
-    df[cn.CLEANED_TEXT] = df[cn.RAW_TEXT].apply(
-        lambda x: __clean(x, stop_words)
-    )
+    chat = ChatFrame(df)
+    compute_columns(chat.df, columns, lang, callback)
+    chat.compact()
+    return chat
 
-    sia = SentimentIntensityAnalyzer()
-    df[cn.SENTIMENT_SCORE] = df[cn.RAW_TEXT].apply(
-        lambda x: sia.polarity_scores(x)["compound"]
-    )
-    df[cn.SENTIMENT_LABEL] = df[cn.SENTIMENT_SCORE].apply(
-        lambda x: __label_sentiment(x)
-    )
-    df[cn.PROFANITY_SCORE] = df[cn.RAW_TEXT].apply(
-        lambda x: predict_prob_profane([x])[0]
-    )
-    df[cn.PROFANITY_LABEL] = df[cn.PROFANITY_SCORE].apply(
-        lambda x: __label_profanity(x)
-    )
 
-    emolex_df = pd.read_csv(
-        "./data/NRC-Emotion-Intensity-Lexicon-v1.txt",
-        names=["word", "emotion", "association"],
-        sep="\t",
-    )
-    df[cn.EMOTION_LABEL] = df[cn.CLEANED_TEXT].apply(
-        lambda x: __extract_emotion(x, emolex_df)
+def compute_columns(
+    df: pd.DataFrame,
+    columns: Iterable[str] = None,
+    lang: str = "en",
+    callback: Callable[[StageTiming], None] = None,
+    check: Callable[[], None] = None,
+) -> List[str]:
+    """
+    Computes the requested columns that are missing from the dataframe, along with any missing columns they
+    depend on, and adds them to it in place
+    :param df: a pandas dataframe with at least the parser's columns
+    :param columns: the columns that are needed, defaults to all of them
+    :param lang: language code, default is 'en'
+    :param callback: called with the timing of each stage as soon as it completes
+    :param check: called regularly while the stages run, to stop them by raising
+    :return: the names of the columns that were added
+    """
+    stages = stages_for(
+        columns if columns is not None else ALL_COLUMNS, df.columns
     )
+    if not stages:
+        return []
 
     participants = list(df[cn.SENDER].unique())
-
-    df[cn.ENTITIES] = df[cn.RAW_TEXT].apply(
-        lambda x: __extract_named_entities(x, participants, nlp)
+    run_stages(
+        df,
+        stages,
+        context={"lang": lang, "participants": participants},
+        shared_columns=[cn.RAW_TEXT],
+        callback=callback,
+        check=check,
     )
+    return [column for stage in stages for column in stage.outputs]
+
+
+def inline_columns(
+    columns: Iterable[str], available: Iterable[str] = ()
+) -> List[str]:
+    """
+    The columns among the ones needed that come from inline stages, i.e. that are cheap enough to compute
+    while the user waits, unlike the NLP stages that run on the process pool
+    :param columns: the needed columns
+    :param available: the columns that already exist and don't need to be computed
+    """
+    return [
+        column
+        for stage in stages_for(columns, available)
+        if not stage.parallel
+        for column in stage.outputs
+    ]
+
+
+def stages_for(
+    columns: Iterable[str], available: Iterable[str] = ()
+) -> List[Stage]:
+    """
+    Resolves the stages needed to produce the columns, i.e. the transitive closure of their inputs
+    :param columns: the needed columns
+    :param available: the columns that already exist and don't need to be computed
+    :return: the stages to run, in pipeline order
+    """
+    available = set(available)
+    needed = set(columns) - available
+    selected = set()
+    while needed:
+        column = needed.pop()
+        for stage in STAGES:
+            if column in stage.outputs and stage.name not in selected:
+                selected.add(stage.name)
+                needed.update(set(stage.inputs) - available)
+    return [stage for stage in STAGES if stage.name in selected]
+
+
+def load_models(lang: str = "en"):
+    """Loads every model up front, i.e. when the model server starts, rather than on the first batch"""
+    load_bundle()
+    __load_nlp(lang)
+    __load_sentiment_analyzer()
+    predict_prob_profane([""])
+
+
+# The language specific processing libraries are loaded once per process that uses them, which is only the model
+# server if there is one
+@lru_cache(maxsize=None)
+def __load_nlp(lang: str):
+    if lang == "en":
+        return spacy.load("en_core_web_sm")
+    return None
+
+
+@lru_cache(maxsize=None)
+def __load_stop_words(lang: str) -> Set[str]:
+    if lang == "en":
+        return load_bundle().stop_words
+    return set()
+
+
+@lru_cache(maxsize=None)
+def __load_sentiment_analyzer() -> SentimentIntensityAnalyzer:
+    return load_bundle().sentiment_analyzer()
+
 
-    # Construct a list of participant specific dataframes
-    dfs = []
-    for participant in participants:
-        dfs.append(df[df[cn.SENDER] == participant])
+def __count_words(columns, context):
+    # The same as the number of pieces when splitting on spaces, without creating the pieces
+    return {
+        cn.WORD_COUNT: (columns[cn.RAW_TEXT].str.count(" ") + 1)
+        .astype(np.int32)
+        .values
+    }
 
-    return df, dfs, participants
 
+def __extract_time(columns, context):
+    timestamps = pd.to_datetime(columns[cn.TIMESTAMP])
+    return {
+        cn.HOUR: timestamps.dt.hour.astype(np.int8).values,
+        cn.DAY: timestamps.dt.dayofweek.astype(np.int8).values,
+    }
 
-def __clean(text: str, stop_words: Set[str]) -> List[str]:
+
+def __split_conversations(columns, context):
+    return {
+        cn.CONVERSATION: split_conversations(
+            columns[cn.TIMESTAMP].values, Config.CONVERSATION_GAP
+        )
+    }
+
+
+def __extract_emojis(columns, context):
+    # A single search over every message, the emojis of each message are moved to the emoji table by the ChatFrame
+    message_ids, emojis = find_emojis(columns[cn.RAW_TEXT].values)
+    emojis_by_message = [[] for _ in range(len(columns[cn.RAW_TEXT]))]
+    for message_id, emoji in zip(message_ids, emojis):
+        emojis_by_message[message_id].append(emoji)
+    return {cn.EMOJIS: emojis_by_message}
+
+
+def __clean_text(columns, context):
+    return {
+        cn.CLEANED_TEXT: __infer(
+            CLEANING_TASK, columns[cn.RAW_TEXT], context["lang"]
+        )
+    }
+
+
+def __score_sentiment(columns, context):
+    scores = __infer(SENTIMENT_TASK, columns[cn.RAW_TEXT], context["lang"])
+    return {
+        cn.SENTIMENT_SCORE: scores,
+        cn.SENTIMENT_LABEL: [__label_sentiment(score) for score in scores],
+    }
+
+
+def __score_profanity(columns, context):
+    scores = __infer(PROFANITY_TASK, columns[cn.RAW_TEXT], context["lang"])
+    return {
+        cn.PROFANITY_SCORE: scores,
+        cn.PROFANITY_LABEL: [__label_profanity(score) for score in scores],
+    }
+
+
+def __label_emotions(columns, context):
+    return {
+        cn.EMOTION_LABEL: __infer(
+            EMOTION_TASK, columns[cn.CLEANED_TEXT], context["lang"]
+        )
+    }
+
+
+def __extract_entities(columns, context):
+    # The entities are found by the model, and then the ones that are participants are labelled as such
+    return {
+        cn.ENTITIES: [
+            __label_named_entities(entities, context["participants"])
+            for entities in __infer(
+                ENTITIES_TASK, columns[cn.RAW_TEXT], context["lang"]
+            )
+        ]
+    }
+
+
+def __infer(task: str, values, lang: str) -> List:
+    values = list(values)
+    try:
+        client = get_model_client()
+        if client is not None:
+            return client.infer(task, values, lang)
+    except ConnectionError as e:
+        logger.warning("running %s locally: %s", task, e)
+    return MODEL_TASKS[task](values, lang)
+
+
+# The tasks take a batch of values (i.e. texts from several requests) and return an output per value
+def __clean_batch(texts: List[str], lang: str) -> List[List[str]]:
+    stop_words = __load_stop_words(lang)
+    lemmatize = load_bundle().lemmatize_verb
+    return [__clean(text, stop_words, lemmatize) for text in texts]
+
+
+def __sentiment_batch(texts: List[str], lang: str) -> List[float]:
+    sia = __load_sentiment_analyzer()
+    return [sia.polarity_scores(text)["compound"] for text in texts]
+
+
+def __profanity_batch(texts: List[str], lang: str) -> List[float]:
+    return predict_prob_profane(texts).tolist() if texts else []
+
+
+def __emotion_batch(cleaned_texts: List[List[str]], lang: str) -> List[str]:
+    emotion_lexicon = load_bundle().emotion_lexicon
+    return [
+        __extract_emotion(cleaned_text, emotion_lexicon)
+        for cleaned_text in cleaned_texts
+    ]
+
+
+def __entities_batch(texts: List[str], lang: str) -> List[List[Tuple]]:
+    nlp = __load_nlp(lang)
+    return [
+        [(ent.text, ent.label_) for ent in doc.ents] for doc in nlp.pipe(texts)
+    ]
+
+
+MODEL_TASKS = {
+    CLEANING_TASK: __clean_batch,
+    SENTIMENT_TASK: __sentiment_batch,
+    PROFANITY_TASK: __profanity_batch,
+    EMOTION_TASK: __emotion_batch,
+    ENTITIES_TASK: __entities_batch,
+}
+
+
+# The processing pipeline, expressed as the columns each stage reads and writes
+STAGES = [
+    Stage(
+        "word count",
+        (cn.RAW_TEXT,),
+        (cn.WORD_COUNT,),
+        __count_words,
+        parallel=False,
+    ),
+    Stage(
+        "time",
+        (cn.TIMESTAMP,),
+        (cn.HOUR, cn.DAY),
+        __extract_time,
+        parallel=False,
+    ),
+    Stage(
+        "conversations",
+        (cn.TIMESTAMP,),
+        (cn.CONVERSATION,),
+        __split_conversations,
+        parallel=False,
+    ),
+    Stage(
+        "emojis",
+        (cn.RAW_TEXT,),
+        (cn.EMOJIS,),
+        __extract_emojis,
+        parallel=False,
+    ),
+    Stage("cleaning", (cn.RAW_TEXT,), (cn.CLEANED_TEXT,), __clean_text),
+    Stage(
+        "sentiment",
+        (cn.RAW_TEXT,),
+        (cn.SENTIMENT_SCORE, cn.SENTIMENT_LABEL),
+        __score_sentiment,
+    ),
+    Stage(
+        "profanity",
+        (cn.RAW_TEXT,),
+        (cn.PROFANITY_SCORE, cn.PROFANITY_LABEL),
+        __score_profanity,
+    ),
+    Stage(
+        "emotion", (cn.CLEANED_TEXT,), (cn.EMOTION_LABEL,), __label_emotions
+    ),
+    Stage("entities", (cn.RAW_TEXT,), (cn.ENTITIES,), __extract_entities),
+]
+ALL_COLUMNS = [column for stage in STAGES for column in stage.outputs]
+
+
+def __clean(
+    text: str, stop_words: Set[str], lemmatize: Callable[[str], str]
+) -> List[str]:
     tokens = word_tokenize(text)
     # convert to lower case
     tokens = [w.lower() for w in tokens]
@@ -96,21 +357,11 @@ def __clean(text: str, stop_words: Set[str]) -> List[str]:
     table = str.maketrans("", "", string.punctuation)
     stripped = [w.translate(table) for w in tokens]
     # remove remaining tokens that are not alphabetic or emojis
-    words = []
-    for word in stripped:
-        valid_word = True
-        for char in word:
-            if not (char.isalpha() or char in emoji.UNICODE_EMOJI):
-                valid_word = False
-        if valid_word:
-            words.append(word)
+    words = [word for word in stripped if WORD_PATTERN.fullmatch(word)]
 
     # filter out stop words and any empty stragglers
     cleaned_words = [w for w in words if not (w in stop_words or w == "")]
-    # return cleaned_words
-    lemmatizer = WordNetLemmatizer()
-
-    return [lemmatizer.lemmatize(word, "v") for word in cleaned_words]
+    return [lemmatize(word) for word in cleaned_words]
 
 
 def __label_sentiment(score: float) -> str:
@@ -144,27 +395,17 @@ def __label_profanity(score: float) -> str:
         return PROFANE
 
 
-def __extract_named_entities(text: str, participants: List[str], spacy_nlp):
+def __label_named_entities(entities: List[Tuple], participants: List[str]):
     named_entities = {}
-    doc = spacy_nlp(text)
-    for ent in doc.ents:
-        if ent.text in participants:
-            named_entities[ent.text] = PARTICIPANTS_LABEL
+    for text, label in entities:
+        if text in participants:
+            named_entities[text] = PARTICIPANTS_LABEL
         else:
-            named_entities[ent.text] = TOPIC_REDUCTION_MAP[ent.label_]
+            named_entities[text] = TOPIC_REDUCTION_MAP[label]
     return named_entities
 
 
-def __extract_emotion(cleaned_text: List[str], emolex: pd.DataFrame):
-    emotion_scores = defaultdict(float)
-    emotion_scores["❔"] = 0.01
-    for word in cleaned_text:
-        matches = emolex[emolex["word"] == word]
-        if len(matches) > 0:
-            for match in matches.values:
-                try:
-                    emotion_scores[match[1]] += float(match[2])
-                # There's a weird line in the emolex, this try-except is just to circumvent that
-                except ValueError:
-                    continue
-    return max(emotion_scores, key=emotion_scores.get)
+def __extract_emotion(
+    cleaned_text: List[str], emotion_lexicon: EmotionLexicon
+) -> str:
+    return emotion_lexicon.label(cleaned_text)
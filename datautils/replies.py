@@ -0,0 +1,96 @@
+"""Who replies to whom in a chat and how fast, as sparse participant × participant matrices built with a single
+vectorized pass over the messages, so that they stay small in groups with hundreds of participants"""
+from typing import List
+
+import numpy as np
+from scipy import sparse
+
+# The edges (in seconds) of the reply time buckets, and their names
+LATENCY_BINS = np.array([0, 60, 5 * 60, 15 * 60, 3600, 3 * 3600])
+LATENCY_LABELS = [
+    "< 1 min",
+    "1-5 min",
+    "5-15 min",
+    "15-60 min",
+    "1-3 h",
+    "3 h +",
+]
+
+NS_PER_SECOND = 10 ** 9
+
+
+class ReplyGraph:
+    """
+    A reply is a message that follows someone else's message in the same conversation. The matrices have a row
+    per participant who replied and a column per participant who was replied to, and the histograms a row per
+    participant who replied and a column per reply time bucket
+    """
+
+    def __init__(
+        self,
+        counts: sparse.csr_matrix,
+        reply_times: sparse.csr_matrix,
+        histograms: np.ndarray,
+    ):
+        """
+        :param counts: how many times each participant replied to each other one
+        :param reply_times: the seconds those replies took in total
+        :param histograms: how many of each participant's replies fall in each of the LATENCY_BINS
+        """
+        self.counts = counts
+        self.reply_times = reply_times
+        self.histograms = histograms
+
+    @classmethod
+    def from_messages(
+        cls,
+        conversation_ids: np.ndarray,
+        timestamps: np.ndarray,
+        participant_codes: np.ndarray,
+        num_participants: int,
+    ) -> "ReplyGraph":
+        """
+        :param conversation_ids: the conversation of each message
+        :param timestamps: the messages' timestamps, in the order they were sent
+        :param participant_codes: the code of each message's sender
+        :param num_participants: how many participants there are in the chat
+        """
+        conversation_ids = np.asarray(conversation_ids)
+        codes = np.asarray(participant_codes, dtype=np.int64)
+        ns = np.asarray(timestamps).astype("datetime64[ns]").view(np.int64)
+
+        # Each message is compared with the one before it
+        is_reply = (conversation_ids[1:] == conversation_ids[:-1]) & (
+            codes[1:] != codes[:-1]
+        )
+        repliers = codes[1:][is_reply]
+        replied_to = codes[:-1][is_reply]
+        seconds = np.diff(ns)[is_reply] / NS_PER_SECOND
+
+        shape = (num_participants, num_participants)
+        counts = sparse.coo_matrix(
+            (np.ones(len(repliers), dtype=np.int64), (repliers, replied_to)),
+            shape=shape,
+        ).tocsr()
+        reply_times = sparse.coo_matrix(
+            (seconds, (repliers, replied_to)), shape=shape
+        ).tocsr()
+        buckets = np.searchsorted(LATENCY_BINS, seconds, side="right") - 1
+        histograms = np.bincount(
+            repliers * len(LATENCY_BINS) + np.maximum(buckets, 0),
+            minlength=num_participants * len(LATENCY_BINS),
+        ).reshape(num_participants, len(LATENCY_BINS))
+        return cls(counts, reply_times, histograms)
+
+    def mean_reply_times(self) -> np.ndarray:
+        """The average seconds each participant took to reply to each other one, NaN where they never did"""
+        counts = self.counts.toarray()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(
+                counts > 0, self.reply_times.toarray() / counts, np.nan
+            )
+
+    def most_replying(self, n: int) -> List[int]:
+        """The codes of the n participants who replied the most"""
+        replies = np.asarray(self.counts.sum(axis=1)).ravel()
+        return list(np.argsort(-replies, kind="stable")[:n])
@@ -0,0 +1,350 @@
+"""The static language resources the processing needs (stop words, the emotion and sentiment lexicons and a table of
+verb lemmas), compiled once into a bundle of numpy arrays rather than rebuilt from NLTK, spaCy and the NRC lexicon
+by every process. A bundle's directory is named after a fingerprint of its sources, so it's rebuilt whenever they
+change, and its arrays are memory mapped so that loading it takes milliseconds (see ResourceBundle for which
+ones stay mapped)"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from nltk.sentiment.vader import SentimentIntensityAnalyzer, VaderConstants
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Bump this whenever what's in a bundle (or how it's stored) changes
+RESOURCES_VERSION = 1
+MANIFEST = "manifest.json"
+EMOLEX_PATH = "./data/NRC-Emotion-Intensity-Lexicon-v1.txt"
+# The label of a message that doesn't match any emotion well enough
+UNKNOWN_EMOTION = "❔"
+UNKNOWN_EMOTION_SCORE = 0.01
+# The suffixes WordNet strips from verbs (and what it replaces them with) to find their lemmas
+VERB_SUBSTITUTIONS = [
+    ("s", ""),
+    ("ies", "y"),
+    ("es", "e"),
+    ("es", ""),
+    ("ed", "e"),
+    ("ed", ""),
+    ("ing", "e"),
+    ("ing", ""),
+]
+# The NLTK data the bundle is compiled from
+NLTK_RESOURCES = [
+    "corpora/stopwords",
+    "corpora/wordnet",
+    "sentiment/vader_lexicon.zip",
+]
+
+
+class EmotionLexicon:
+    """The intensity of each emotion for every word of the NRC lexicon, looked up by binary search"""
+
+    def __init__(
+        self, words: np.ndarray, emotions: np.ndarray, scores: np.ndarray
+    ):
+        """
+        :param words: the lexicon's words, sorted
+        :param emotions: the emotions' names
+        :param scores: a row of intensities per word, with a column per emotion
+        """
+        self.words = words
+        self.emotions = emotions
+        self.scores = scores
+
+    def label(self, words: List[str]) -> str:
+        """
+        The emotion the words are the most intense in, summed over every word (repeats included)
+        :return: UNKNOWN_EMOTION if none of them are intense enough
+        """
+        if not words or not len(self.words):
+            return UNKNOWN_EMOTION
+        positions = np.searchsorted(self.words, words)
+        positions[positions == len(self.words)] = 0
+        rows = positions[self.words[positions] == np.asarray(words)]
+        if not len(rows):
+            return UNKNOWN_EMOTION
+        totals = self.scores[rows].sum(axis=0)
+        best = int(totals.argmax())
+        if totals[best] <= UNKNOWN_EMOTION_SCORE:
+            return UNKNOWN_EMOTION
+        return str(self.emotions[best])
+
+
+class BundledSentimentAnalyzer(SentimentIntensityAnalyzer):
+    """VADER, with its lexicon taken from the bundle rather than parsed from NLTK's data"""
+
+    def __init__(self, lexicon: Dict[str, float]):
+        self.lexicon = lexicon
+        self.constants = VaderConstants()
+
+
+class ResourceBundle:
+    """
+    A compiled bundle, read from its directory. Only the emotion lexicon stays memory mapped, so it's the only table
+    shared by every process. The stop words, sentiment lexicon and verb lemmas are looked up one word at a time,
+    so each process copies them into a set and dicts, which are much faster to look up than a binary search of the
+    mapped arrays
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.stop_words = frozenset(self.__load("stop_words").tolist())
+        self.emotion_lexicon = EmotionLexicon(
+            self.__load("emotion_words"),
+            self.__load("emotions"),
+            self.__load("emotion_scores"),
+        )
+        self.sentiment_lexicon = dict(
+            zip(
+                self.__load("sentiment_words").tolist(),
+                self.__load("sentiment_scores").tolist(),
+            )
+        )
+        self.verb_lemmas = dict(
+            zip(
+                self.__load("verb_forms").tolist(),
+                self.__load("verb_lemmas").tolist(),
+            )
+        )
+
+    def sentiment_analyzer(self) -> SentimentIntensityAnalyzer:
+        return BundledSentimentAnalyzer(self.sentiment_lexicon)
+
+    def lemmatize_verb(self, word: str) -> str:
+        """The same as WordNetLemmatizer().lemmatize(word, "v"), without loading WordNet"""
+        return self.verb_lemmas.get(word, word)
+
+    def __load(self, name: str) -> np.ndarray:
+        return np.load(
+            os.path.join(self.path, name + ".npy"),
+            mmap_mode="r",
+            allow_pickle=False,
+        )
+
+
+def write_bundle(
+    path: str,
+    stop_words: Iterable[str],
+    emolex: pd.DataFrame,
+    sentiment_lexicon: Dict[str, float],
+    verb_lemmas: Dict[str, str],
+    sources: Dict = None,
+):
+    """
+    Writes a bundle to a new directory, which only appears once it's complete
+    :param stop_words: the stop words of every source
+    :param emolex: the NRC lexicon, with word, emotion and score columns
+    :param sentiment_lexicon: VADER's score of each word
+    :param verb_lemmas: the lemma of each verb form that isn't its own lemma
+    :param sources: what the bundle was compiled from, for its manifest
+    """
+    emolex = emolex.pivot_table(
+        index="word", columns="emotion", values="score", aggfunc="sum"
+    ).fillna(0)
+    arrays = {
+        "stop_words": __strings(sorted(set(stop_words))),
+        "emotion_words": __strings(emolex.index),
+        "emotions": __strings(emolex.columns),
+        "emotion_scores": emolex.values.astype(np.float32),
+        "sentiment_words": __strings(sentiment_lexicon.keys()),
+        "sentiment_scores": np.array(
+            list(sentiment_lexicon.values()), dtype=np.float64
+        ),
+        "verb_forms": __strings(verb_lemmas.keys()),
+        "verb_lemmas": __strings(verb_lemmas.values()),
+    }
+
+    parent = os.path.dirname(os.path.normpath(path))
+    os.makedirs(parent, exist_ok=True)
+    temp_path = tempfile.mkdtemp(prefix=".building-", dir=parent)
+    try:
+        for name, array in arrays.items():
+            np.save(os.path.join(temp_path, name + ".npy"), array)
+        with open(os.path.join(temp_path, MANIFEST), "w") as f:
+            json.dump(
+                {"version": RESOURCES_VERSION, "sources": sources or {}}, f
+            )
+        os.rename(temp_path, path)
+    except OSError:
+        # Another process built the same bundle first
+        shutil.rmtree(temp_path, ignore_errors=True)
+        if not os.path.exists(os.path.join(path, MANIFEST)):
+            raise
+
+
+def verb_lemma_table(
+    lemmas: Iterable[str],
+    exceptions: Iterable[str],
+    lemmatize: Callable[[str], str],
+) -> Dict[str, str]:
+    """
+    The lemma of every form a verb lemma can be found from, i.e. every lemma with one of WordNet's suffixes, and
+    WordNet's irregular forms. Other words are their own lemmas
+    :param lemmas: WordNet's verb lemmas
+    :param exceptions: WordNet's irregular verb forms
+    :param lemmatize: what the forms are lemmatized with
+    """
+    forms = set(exceptions)
+    for lemma in lemmas:
+        for old, new in VERB_SUBSTITUTIONS:
+            if lemma.endswith(new):
+                forms.add(lemma[: len(lemma) - len(new)] + old)
+    table = {}
+    for form in sorted(forms):
+        lemma = lemmatize(form)
+        if lemma != form:
+            table[form] = lemma
+    return table
+
+
+def source_fingerprint() -> Dict:
+    """What the bundle is compiled from: the versions of the libraries, and the files of the data"""
+    sources = {"version": RESOURCES_VERSION}
+    for package in ["nltk", "spacy", "wordcloud"]:
+        sources[package] = __package_version(package)
+    sources["emolex"] = __file_fingerprint(EMOLEX_PATH)
+    for resource in NLTK_RESOURCES:
+        sources[resource] = __file_fingerprint(__nltk_path(resource))
+    return sources
+
+
+def bundle_path(sources: Dict = None) -> str:
+    digest = hashlib.sha256(
+        json.dumps(sources or source_fingerprint(), sort_keys=True).encode()
+    ).hexdigest()[:16]
+    return os.path.join(
+        Config.RESOURCE_BUNDLE_PATH, "v{}-{}".format(RESOURCES_VERSION, digest)
+    )
+
+
+def ensure_bundle() -> str:
+    """
+    Checks that the bundle of the current sources exists, and builds it if it doesn't (i.e. the first time the app
+    starts after they've changed). Bundles of older sources are deleted once they're no longer needed
+    :return: its path
+    """
+    sources = source_fingerprint()
+    path = bundle_path(sources)
+    if not os.path.exists(os.path.join(path, MANIFEST)):
+        logger.info("building the resource bundle in %s", path)
+        write_bundle(path, *__compile_sources(), sources=sources)
+    # Checked at every start rather than only after a build, since the older bundles outlive it by their grace
+    remove_stale_bundles(path)
+    return path
+
+
+def remove_stale_bundles(
+    path: str, grace: float = Config.RESOURCE_BUNDLE_GRACE
+):
+    """
+    Deletes the bundles built before the one in path, once they're more than grace seconds old. Until then they're
+    kept, since the processes of the previous release (e.g. during a rolling deploy) may still load them, and a
+    bundle built after this one is never deleted, since it belongs to a newer release
+    """
+    parent = os.path.dirname(os.path.normpath(path))
+    built_at = __built_at(path)
+    if built_at is None:
+        # Without its manifest (i.e. it was copied, or only partly written) there's nothing to compare them to
+        return
+    for name in os.listdir(parent):
+        stale = os.path.join(parent, name)
+        if stale == os.path.normpath(path) or not name.startswith("v"):
+            continue
+        stale_built_at = __built_at(stale)
+        if (
+            stale_built_at is not None
+            and stale_built_at < built_at
+            and stale_built_at < time.time() - grace
+        ):
+            logger.info("deleting the stale resource bundle in %s", stale)
+            shutil.rmtree(stale, ignore_errors=True)
+
+
+@lru_cache(maxsize=None)
+def load_bundle() -> ResourceBundle:
+    """The bundle of this process, built first if needed"""
+    return ResourceBundle(ensure_bundle())
+
+
+def __compile_sources() -> Tuple:
+    from nltk.corpus import wordnet
+    from nltk.stem import WordNetLemmatizer
+
+    from datautils.stopwords import stopwords
+
+    # The first line of the NRC lexicon is its header
+    emolex = pd.read_csv(
+        EMOLEX_PATH,
+        names=["word", "emotion", "score"],
+        sep="\t",
+        skiprows=1,
+        keep_default_na=False,
+    )
+    with wordnet.open("verb.exc") as f:
+        exceptions = [line.split()[0] for line in f if line.strip()]
+    lemmatizer = WordNetLemmatizer()
+    verb_lemmas = verb_lemma_table(
+        wordnet.all_lemma_names(pos="v"),
+        exceptions,
+        lambda form: lemmatizer.lemmatize(form, "v"),
+    )
+    return (
+        stopwords("en"),
+        emolex,
+        SentimentIntensityAnalyzer().lexicon,
+        verb_lemmas,
+    )
+
+
+def __built_at(path: str) -> Optional[float]:
+    # A bundle is complete once its manifest is written, which is what it's dated by
+    try:
+        return os.path.getmtime(os.path.join(path, MANIFEST))
+    except OSError:
+        return None
+
+
+def __strings(values: Iterable[str]) -> np.ndarray:
+    # Fixed width strings, which can be memory mapped unlike python objects
+    return np.array([str(value) for value in values], dtype=np.str_)
+
+
+def __package_version(package: str) -> Optional[str]:
+    try:
+        from importlib.metadata import PackageNotFoundError, version
+    except ImportError:
+        from importlib_metadata import PackageNotFoundError, version
+    try:
+        return version(package)
+    except PackageNotFoundError:
+        return None
+
+
+def __nltk_path(resource: str) -> Optional[str]:
+    import nltk
+
+    try:
+        pointer = nltk.data.find(resource)
+    except LookupError:
+        return None
+    return getattr(pointer, "path", None) or getattr(
+        getattr(pointer, "zipfile", None), "filename", None
+    )
+
+
+def __file_fingerprint(path: Optional[str]) -> Optional[List]:
+    if path is None or not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return [os.path.abspath(path), stat.st_size, int(stat.st_mtime)]
@@ -1,16 +1,14 @@
-import spacy
 from nltk.corpus import stopwords as nltk_stopwords
+from spacy.lang.en.stop_words import STOP_WORDS as SPACY_STOPWORDS
 from typing import Set
 from wordcloud import STOPWORDS
 
 
-def stopwords(nlp=None, lang: str = "en") -> Set[str]:
+def stopwords(lang: str = "en") -> Set[str]:
+    """The stop words of NLTK, spaCy and wordcloud, which are compiled into the resource bundle"""
     s = set()
-    if nlp is None:
-        nlp = spacy.load("en_core_web_sm")
     if lang == "en":
-        s = set()
         s.update(nltk_stopwords.words("english"))
-        s = s.union(nlp.Defaults.stop_words)
+        s = s.union(SPACY_STOPWORDS)
         s = s.union(STOPWORDS)
     return s
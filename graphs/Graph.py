@@ -1,12 +1,13 @@
+import hashlib
+import threading
 from collections import Counter, defaultdict
-from typing import Dict, List
+from functools import lru_cache, wraps
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
 import networkx as nx
 import numpy as np
 import pandas as pd
-import plotly.express as px
 import plotly.graph_objects as go
-from emoji import UNICODE_EMOJI
 from plotly.subplots import make_subplots
 from wordcloud import WordCloud
 
@@ -17,38 +18,112 @@ from constants.column_names import (
     SENTIMENT_SCORE,
     ENTITIES,
     WORD_COUNT,
-    HOUR,
-    DAY,
     SENDER,
     SENTIMENT_LABEL,
     PROFANITY_LABEL,
+    PROFANITY_SCORE,
     CLEANED_TEXT,
+    CONVERSATION,
+    EMOJIS,
     EMOTION_LABEL,
 )
+from constants.figures import (
+    DAILY_MESSAGES,
+    EMOTION_TREE_MAP,
+    PROFANITY_SUNBURST,
+    SENTIMENT_OVER_TIME,
+)
 from constants.profanity_labels import PROFANE, QUESTIONABLE, CLEAN
 from constants.topic_labels import PARTICIPANTS_LABEL, SIMPLIFIED_LABELS
-from datautils.stopwords import stopwords
+from datautils.aggregates import DAILY, MESSAGES, MONTHLY, WEEKLY, ChatCube
+from datautils.chat_frame import ChatFrame
+from datautils.conversations import INITIATOR
+from datautils.emojis import EMOJI_ID, PARTICIPANT, USES
+from datautils.processor import compute_columns
+from datautils.replies import LATENCY_LABELS, ReplyGraph
 from utils import random_color
 
+# The paths of the hierarchical figures, which can be drilled down into
+HIERARCHIES = {
+    EMOTION_TREE_MAP: [SENDER, EMOTION_LABEL, SENTIMENT_LABEL],
+    PROFANITY_SUNBURST: [SENDER, PROFANITY_LABEL],
+}
+# The most messages drawn in a single branch of a hierarchical figure
+MAX_LEAVES = 10
+MESSAGE_COUNT = "Message Count"
+# The bounds on the number of words in the word cloud, which grows with the size of the chat's vocabulary
+MIN_CLOUD_WORDS = 50
+MAX_CLOUD_WORDS = 500
+# The most entities drawn on the topic graph, and the seed its layout is computed with
+MAX_TOPICS = 150
+LAYOUT_SEED = 42
+# The most emojis drawn on the emoji frequency chart
+MAX_EMOJIS = 20
+# The most participants whose reply times are drawn, the ones who replied the most
+MAX_REPLYING = 10
+# The keys of a stored word cloud or topic graph layout
+FINGERPRINT = "fingerprint"
+LAYOUT = "layout"
+RESOLUTION_NAMES = {DAILY: "Daily", WEEKLY: "Weekly", MONTHLY: "Monthly"}
+RANK = "Rank"
+
+
+def requires(*columns: str, optional: Iterable[str] = ()):
+    """
+    Declares the columns a figure is built from. Any of them that haven't been computed yet are computed
+    right before the figure is built, while the optional ones are only used if they're already there
+    """
+
+    def decorator(graph_func):
+        @wraps(graph_func)
+        def wrapper(self, *args, **kwargs):
+            self.ensure_columns(columns)
+            return graph_func(self, *args, **kwargs)
+
+        wrapper.required_columns = columns
+        wrapper.optional_columns = tuple(optional)
+        return wrapper
+
+    return decorator
+
+
+def cloud_size(frequencies: Counter) -> int:
+    """
+    How many words the word cloud should show. Words that were only used once are mostly noise, so the cloud
+    grows with the square root of the number of words used more than that
+    """
+    repeated = sum(1 for count in frequencies.values() if count > 1)
+    return min(
+        len(frequencies),
+        MAX_CLOUD_WORDS,
+        max(MIN_CLOUD_WORDS, int(10 * repeated ** 0.5)),
+    )
+
 
 class Graph:
     def __init__(
         self,
-        df: pd.DataFrame = None,
-        dfs: List[pd.DataFrame] = None,
-        participants: List[str] = None,
+        chat: ChatFrame = None,
         color_map: Dict = None,
         media_counter: Dict = None,
+        word_cloud_layout: Dict = None,
+        topic_graph_layout: Dict = None,
         title_size: float = 24.0,
         font_size: float = 18,
+        lang: str = "en",
     ):
-        self.df = df
-        self.dfs = dfs
-        self.participants = participants
+        self.chat = chat
+        self.__cube = None
+        self.__replies = None
+        # The figures are drawn on concurrent threads, which share the lazily built aggregates
+        self.__aggregates_lock = threading.Lock()
         self.color_map = color_map
         self.media_counter = media_counter
+        self.word_cloud_layout = word_cloud_layout
+        self.topic_graph_layout = topic_graph_layout
         self.title_size = title_size
         self.font_size = font_size
+        self.lang = lang
         self.title_dict = {"size": title_size}
         self.font_dict = {"size": font_size}
         self.hide_axis_dict = {
@@ -57,40 +132,99 @@ class Graph:
             "zeroline": False,
         }
 
+    @property
+    def df(self) -> pd.DataFrame:
+        return self.chat.df
+
+    @property
+    def participants(self) -> List[str]:
+        return self.chat.participants
+
+    @property
+    def cube(self) -> ChatCube:
+        """
+        The aggregates the time based figures are sliced from, built once per chat and extended as columns arrive
+        """
+        with self.__aggregates_lock:
+            if self.__cube is None or self.__cube.chat is not self.chat:
+                self.__cube = ChatCube(self.chat)
+            else:
+                self.__cube.update()
+            return self.__cube
+
+    @property
+    def replies(self) -> ReplyGraph:
+        """Who replies to whom and how fast, built once per chat"""
+        with self.__aggregates_lock:
+            if self.__replies is None or self.__replies[0] is not self.chat:
+                self.__replies = (
+                    self.chat,
+                    ReplyGraph.from_messages(
+                        self.df[CONVERSATION].values,
+                        self.df[TIMESTAMP].values,
+                        self.df[SENDER].cat.codes.values,
+                        len(self.participants),
+                    ),
+                )
+            return self.__replies[1]
+
+    @staticmethod
+    def required_columns(figures: Iterable[str]) -> Set[str]:
+        """
+        The columns needed to build the figures
+        :param figures: names of Graph methods, i.e. the constants in constants.figures
+        """
+        columns = set()
+        for figure in figures:
+            columns.update(getattr(Graph, figure).required_columns)
+        return columns
+
+    def ensure_columns(self, columns: Iterable[str]):
+        """
+        Lazily computes the columns that are missing from the dataframe
+        """
+        if compute_columns(self.df, columns, self.lang):
+            self.chat.compact()
+
+    def add_columns(self, columns: Dict[str, pd.Series]):
+        """
+        Adds columns that were computed elsewhere (i.e. in the background) to the dataframe
+        """
+        self.chat.add_columns(columns)
+
+    def is_ready(self, figure: str) -> bool:
+        """
+        Whether all of the columns a figure uses, including the optional ones, have been computed
+        """
+        graph_func = getattr(Graph, figure)
+        columns = graph_func.required_columns + graph_func.optional_columns
+        return set(columns) <= set(self.df.columns)
+
+    @requires(SENDER, CONVERSATION, EMOJIS, optional=(PROFANITY_LABEL,))
     def pie_charts(self) -> go.Figure:
         # @title Frequency Analysis
         # @markdown What stories do the numbers tell?
 
-        # Find out who initiates contact the most. We'll just say the first person to
-        # text after 4 am on any given day is the initiator (even if it's a conversation continuing from the day before)
-        initiator_dict = defaultdict(int)
-        previous_timestamp = pd.Timestamp("1960-01-01T12")
-        for timestamp, sender in self.df[[TIMESTAMP, SENDER]].values:
-            if timestamp.date() == previous_timestamp.date():
-                continue
-            if timestamp.hour >= 4:
-                initiator_dict[sender] += 1
-            previous_timestamp = timestamp
-
-        # Find the number of emojis each person texts
-        emoji_counts = defaultdict(int)
-        for i_df, participant in zip(self.dfs, self.participants):
-            c = Counter(" ".join(i_df[RAW_TEXT].values))
-            emoji_count = 0
-            for char, count in c.items():
-                if char in UNICODE_EMOJI:
-                    emoji_count += count
-            emoji_counts[participant] = emoji_count
-
-        # Count the number of profane messages
+        # Find out who initiates contact the most, i.e. who sends the first message of each conversation
+        initiator_dict = dict(
+            zip(
+                self.participants,
+                self.chat.conversations.initiations(len(self.participants)),
+            )
+        )
+
+        # Find the number of emojis each person texts, from the count of each message
+        emoji_counts = {
+            participant: int(counts.sum())
+            for participant, counts in self.chat.by_participant(EMOJIS)
+        }
+
+        # Count the number of profane messages, if the profanity has been scored already (it isn't in the
+        # fast dashboard, or while it's still running in the background)
         swear_count = defaultdict(int)
-        for i_df, alias in zip(self.dfs, self.participants):
-            try:
-                swear_count[alias] = i_df[PROFANITY_LABEL].value_counts()[
-                    PROFANE
-                ]
-            except KeyError:
-                swear_count[alias] = 0
+        if PROFANITY_LABEL in self.df.columns:
+            for alias, labels in self.chat.by_participant(PROFANITY_LABEL):
+                swear_count[alias] = int(np.count_nonzero(labels == PROFANE))
 
         # Figure setup
         specs = [
@@ -131,15 +265,16 @@ class Graph:
             1,
         )
 
-        fig.add_trace(
-            go.Pie(
-                title="Swearing 🤬",
-                labels=list(swear_count.keys()),
-                values=list(swear_count.values()),
-            ),
-            2,
-            2,
-        )
+        if swear_count:
+            fig.add_trace(
+                go.Pie(
+                    title="Swearing 🤬",
+                    labels=list(swear_count.keys()),
+                    values=list(swear_count.values()),
+                ),
+                2,
+                2,
+            )
 
         if self.color_map:
             fig.update_traces(marker_colors=list(self.color_map.values()))
@@ -166,49 +301,181 @@ class Graph:
         fig = go.Figure(fig)
         return fig
 
-    def daily_messages(self) -> go.Figure:
-        fig = go.Figure()
+    @requires(TIMESTAMP, SENDER)
+    def daily_messages(self, x_range: Tuple = None) -> go.Figure:
+        """
+        :param x_range: the (start, end) that's visible, i.e. after zooming in. The resolution is picked to keep
+        the number of points bounded
+        """
+        start, end = self.__time_range(x_range)
+        freq = self.cube.resolution(start, end)
+        messages = self.cube.over_time(MESSAGES, freq, start, end)
 
-        for i_df, alias in zip(self.dfs, self.participants):
-            messages_day = (
-                i_df.groupby(pd.Grouper(key=TIMESTAMP, freq="D"))
-                .count()
-                .reset_index()
-            )
+        fig = go.Figure()
+        for alias in messages.columns:
             fig.add_trace(
-                go.Bar(
-                    x=messages_day[TIMESTAMP],
-                    y=messages_day[RAW_TEXT],
+                go.Scattergl(
+                    x=messages.index,
+                    y=messages[alias].values,
                     name=alias,
+                    mode="lines",
                 )
             )
 
+        if self.color_map:
+            for alias, color in self.color_map.items():
+                fig.update_traces(selector={"name": alias}, line_color=color)
+
+        fig.update_layout(
+            title="Number of {} Messages 🗓️".format(RESOLUTION_NAMES[freq]),
+            title_x=0.5,
+            title_font=self.title_dict,
+            font=self.font_dict,
+            hovermode="x unified",
+            uirevision=DAILY_MESSAGES,
+        )
+        if x_range:
+            fig.update_xaxes(range=[start, end])
+
+        return fig
+
+    @requires(SENDER, WORD_COUNT)
+    def word_distribution(self) -> go.Figure:
+        fig = go.Figure()
+
+        histogram = self.cube.word_histogram
+        for alias, messages in zip(self.participants, histogram):
+            (counts,) = np.nonzero(messages)
+            fig.add_trace(go.Bar(x=counts, y=messages[counts], name=alias))
+
         if self.color_map:
             for alias, color in self.color_map.items():
                 fig.update_traces(selector={"name": alias}, marker_color=color)
 
         fig.update_layout(
             barmode="stack",
-            title="Number of Daily Messages 🗓️",
+            title="Word Count Distribution 🧮",
             title_x=0.5,
             title_font=self.title_dict,
             font=self.font_dict,
+            xaxis_title="Word Count",
+            yaxis_title="Messages",
             hovermode="x",
+            height=600,
         )
 
         return fig
 
-    def word_distribution(self) -> go.Figure:
-        fig = go.Figure()
+    @requires(SENDER, CONVERSATION)
+    def conversations(self) -> go.Figure:
+        conversations = self.chat.conversations
+        fig = make_subplots(
+            rows=1,
+            cols=2,
+            subplot_titles=[
+                "Messages per Conversation",
+                "Average Reply Time (Minutes)",
+            ],
+        )
+
+        # How long the conversations each participant started were
+        lengths = conversations.message_counts()
+        initiators = conversations.conversations[INITIATOR].values
+        for code, alias in enumerate(self.participants):
+            fig.add_trace(
+                go.Histogram(
+                    x=lengths[initiators == code],
+                    name=alias,
+                    legendgroup=alias,
+                ),
+                1,
+                1,
+            )
+
+        # How long each participant takes to reply to someone else
+        reply_times, replies = conversations.response_times(
+            len(self.participants)
+        )
+        fig.add_trace(
+            go.Bar(
+                x=self.participants,
+                y=reply_times / 60,
+                customdata=replies,
+                hovertemplate="%{y:.1f} minutes over %{customdata} replies",
+                marker_color=(
+                    [self.color_map.get(alias) for alias in self.participants]
+                    if self.color_map
+                    else None
+                ),
+                showlegend=False,
+            ),
+            1,
+            2,
+        )
+
+        if self.color_map:
+            for alias, color in self.color_map.items():
+                fig.update_traces(
+                    selector={"type": "histogram", "name": alias},
+                    marker_color=color,
+                )
+
+        fig.update_layout(
+            barmode="stack",
+            title="Conversations 💬",
+            title_x=0.5,
+            title_font=self.title_dict,
+            font=self.font_dict,
+            height=600,
+        )
+        fig.update_xaxes(title_text="Messages", row=1, col=1)
+        fig.update_yaxes(title_text="Conversations", row=1, col=1)
 
-        for i_df, alias in zip(self.dfs, self.participants):
-            word_count_distribution = (
-                i_df.groupby(WORD_COUNT).count().reset_index()
+        return fig
+
+    @requires(TIMESTAMP, SENDER, CONVERSATION)
+    def reply_heat_map(self) -> go.Figure:
+        replies = self.replies
+        fig = go.Figure(
+            go.Heatmap(
+                z=replies.counts.toarray(),
+                x=self.participants,
+                y=self.participants,
+                customdata=replies.mean_reply_times() / 60,
+                hovertemplate="%{y} replied to %{x} %{z} times, "
+                "after %{customdata:.1f} minutes on average<extra></extra>",
+                colorscale="Blues",
             )
+        )
+        fig.update_layout(
+            title="Who Replies to Whom 🗣️",
+            title_x=0.5,
+            title_font=self.title_dict,
+            font=self.font_dict,
+            xaxis_title="Replied To",
+            yaxis_title="Replied",
+            height=600,
+        )
+        return fig
+
+    @requires(TIMESTAMP, SENDER, CONVERSATION)
+    def response_times(self, max_replying: int = MAX_REPLYING) -> go.Figure:
+        """
+        :param max_replying: how many of the participants who replied the most are drawn
+        """
+        histograms = self.replies.histograms
+        fig = go.Figure()
+        for code in self.replies.most_replying(max_replying):
+            replies = histograms[code].sum()
+            if not replies:
+                continue
+            alias = self.participants[code]
             fig.add_trace(
                 go.Bar(
-                    x=word_count_distribution[WORD_COUNT],
-                    y=word_count_distribution[RAW_TEXT],
+                    x=LATENCY_LABELS,
+                    y=histograms[code] / replies * 100,
+                    customdata=histograms[code],
+                    hovertemplate="%{y:.1f}% (%{customdata} replies)",
                     name=alias,
                 )
             )
@@ -217,31 +484,73 @@ class Graph:
             for alias, color in self.color_map.items():
                 fig.update_traces(selector={"name": alias}, marker_color=color)
 
+        fig.update_layout(
+            barmode="group",
+            title="How Fast Everyone Replies ⏱️",
+            title_x=0.5,
+            title_font=self.title_dict,
+            font=self.font_dict,
+            xaxis_title="Reply Time",
+            yaxis_title="% of Replies",
+            height=600,
+        )
+        return fig
+
+    @requires(SENDER, EMOJIS)
+    def emoji_frequency(self, max_emojis: int = MAX_EMOJIS) -> go.Figure:
+        """
+        :param max_emojis: how many of the most used emojis are drawn
+        """
+        fig = go.Figure()
+
+        top = self.chat.emojis.top_emojis(self.participants, max_emojis)
+        for alias in self.participants:
+            uses = top[top[PARTICIPANT] == alias]
+            fig.add_trace(
+                go.Bar(
+                    x=uses[USES], y=uses[EMOJI_ID], name=alias, orientation="h"
+                )
+            )
+
+        if self.color_map:
+            for alias, color in self.color_map.items():
+                fig.update_traces(selector={"name": alias}, marker_color=color)
+
         fig.update_layout(
             barmode="stack",
-            title="Word Count Distribution 🧮",
+            title="Most Used Emojis 😂",
             title_x=0.5,
             title_font=self.title_dict,
             font=self.font_dict,
-            xaxis_title="Word Count",
-            yaxis_title="Messages",
-            hovermode="x",
+            xaxis_title="Uses",
+            hovermode="y",
             height=600,
         )
+        # The most used emoji is at the top
+        fig.update_yaxes(
+            categoryorder="array",
+            categoryarray=list(pd.unique(top[EMOJI_ID].values))[::-1],
+        )
 
         return fig
 
+    @requires(CLEANED_TEXT)
     def word_cloud(self):
-        wc = WordCloud(
-            stopwords=stopwords(),
-            max_words=2500,
-            color_func=lambda word, font_size, position, orientation, random_state, font_path: random_color(),
-        )
-        wc.generate_from_frequencies(
-            pd.Series(
-                np.concatenate(self.df[CLEANED_TEXT].values)
-            ).value_counts()
-        )
+        # The frequencies come from the counter on the cube, and only the most frequent words are laid out
+        frequencies = self.cube.word_frequencies
+        top_words = tuple(frequencies.most_common(cloud_size(frequencies)))
+
+        # Laying the words out is expensive, so it's done once per chat and then reused, including when the
+        # analysis is shared
+        fingerprint = hashlib.sha1(repr(top_words).encode("utf-8")).hexdigest()
+        if (
+            self.word_cloud_layout is None
+            or self.word_cloud_layout[FINGERPRINT] != fingerprint
+        ):
+            self.word_cloud_layout = {
+                FINGERPRINT: fingerprint,
+                LAYOUT: self.__layout_word_cloud(top_words),
+            }
 
         word_list = []
         freq_list = []
@@ -249,7 +558,14 @@ class Graph:
         position_list = []
         orientation_list = []
         color_list = []
-        for (word, freq), fontsize, position, orientation, color in wc.layout_:
+        for (
+            word,
+            freq,
+            fontsize,
+            position,
+            orientation,
+            color,
+        ) in self.word_cloud_layout[LAYOUT]:
             word_list.append(word)
             freq_list.append(freq)
             fontsize_list.append(fontsize)
@@ -294,18 +610,11 @@ class Graph:
 
         return fig
 
+    @requires(TIMESTAMP, SENDER)
     def time_heat_map(self) -> go.Figure:
-        time_tuples = []
-        for i in range(24):
-            for j in range(7):
-                time_tuples.append((i, j))
-
-        messages_per_time_slot = (
-            self.df.groupby([HOUR, DAY])
-            .count()
-            .reindex(time_tuples)
-            .unstack()[RAW_TEXT]
-        )
+        # Time slots without any messages are left as gaps
+        messages_per_time_slot = self.cube.heat_map(MESSAGES)
+        messages_per_time_slot[messages_per_time_slot == 0] = np.nan
 
         times = [
             "0:00",
@@ -366,6 +675,7 @@ class Graph:
 
         return fig
 
+    @requires(SENDER, EMOTION_LABEL, SENTIMENT_LABEL, RAW_TEXT)
     def emotion_tree_map(self) -> go.Figure:
         # @title Sentiment Analysis
         # @markdown So now that we have established some patterns, what other insights can we glean?
@@ -383,13 +693,13 @@ class Graph:
             "trust": "#4f3824",
         }
 
-        # colors = df.apply((lambda x: f(x.col_1, x.col_2), axis=1)
-        self.df[TOTAL] = TOTAL
-        fig = px.treemap(
-            self.df,
-            path=[TOTAL, SENDER, EMOTION_LABEL, SENTIMENT_LABEL, RAW_TEXT],
-            color="Emotion Label",
-            color_discrete_map=color_dict,
+        fig = go.Figure(
+            go.Treemap(
+                **self.__hierarchy(
+                    HIERARCHIES[EMOTION_TREE_MAP], EMOTION_LABEL, color_dict
+                ),
+                branchvalues="total",
+            )
         )
 
         fig.update_traces(
@@ -406,51 +716,64 @@ class Graph:
 
         return fig
 
-    def sentiment_over_time(self) -> go.Figure:
+    @requires(TIMESTAMP, SENDER, SENTIMENT_SCORE)
+    def sentiment_over_time(self, x_range: Tuple = None) -> go.Figure:
+        """
+        :param x_range: the (start, end) that's visible, i.e. after zooming in. The resolution is picked to keep
+        the number of points bounded
+        """
         # @markdown How have our interactions changed over time? What do the peaks and troughs correspond to here?
-        fig = go.Figure()
+        start, end = self.__time_range(x_range)
+        freq = self.cube.resolution(start, end)
+        sentiment = self.cube.sentiment_over_time(freq, start, end)
 
-        for i_df, alias in zip(self.dfs, self.participants):
-            sentiment_day = (
-                i_df.groupby(pd.Grouper(key=TIMESTAMP, freq="D"))
-                .mean()
-                .reset_index()
-            )
+        fig = go.Figure()
+        for alias in sentiment.columns:
             fig.add_trace(
-                go.Scatter(
-                    x=sentiment_day[TIMESTAMP],
-                    y=sentiment_day[SENTIMENT_SCORE],
+                go.Scattergl(
+                    x=sentiment.index,
+                    y=sentiment[alias].values,
                     name=alias,
                     mode="lines+markers",
                     connectgaps=True,
                 )
             )
 
+        # The lines are coloured along with the markers, or they'd take the default palette's colours
         if self.color_map:
             for alias, color in self.color_map.items():
-                fig.update_traces(selector={"name": alias}, marker_color=color)
+                fig.update_traces(
+                    selector={"name": alias},
+                    marker_color=color,
+                    line_color=color,
+                )
 
-        fig.add_shape(
-            # Line Horizontal
-            type="line",
-            x0=self.df[TIMESTAMP][0],
-            x1=self.df[TIMESTAMP][len(self.df) - 1],
-            y0=0,
-            y1=0,
-            line=dict(color="gray", width=2, dash="dashdot"),
-        )
+        if len(sentiment):
+            fig.add_shape(
+                # Line Horizontal
+                type="line",
+                x0=sentiment.index[0],
+                x1=sentiment.index[-1],
+                y0=0,
+                y1=0,
+                line=dict(color="gray", width=2, dash="dashdot"),
+            )
 
         fig.update_layout(
-            title="Sentiment over Time ⌚",
+            title="{} Sentiment over Time ⌚".format(RESOLUTION_NAMES[freq]),
             title_x=0.5,
             title_font=self.title_dict,
             yaxis_title="Positivity",
             font=self.font_dict,
             hovermode="x unified",
+            uirevision=SENTIMENT_OVER_TIME,
         )
+        if x_range:
+            fig.update_xaxes(range=[start, end])
 
         return fig
 
+    @requires(SENDER, PROFANITY_LABEL, PROFANITY_SCORE, RAW_TEXT)
     def profanity_sunburst(self) -> go.Figure:
         color_dict = {
             "(?)": "#",
@@ -459,12 +782,16 @@ class Graph:
             QUESTIONABLE: "#f3ffb9",
         }
 
-        self.df[TOTAL] = TOTAL
-        fig = px.sunburst(
-            self.df,
-            path=[TOTAL, SENDER, PROFANITY_LABEL, RAW_TEXT],
-            color=PROFANITY_LABEL,
-            color_discrete_map=color_dict,
+        fig = go.Figure(
+            go.Sunburst(
+                **self.__hierarchy(
+                    HIERARCHIES[PROFANITY_SUNBURST],
+                    PROFANITY_LABEL,
+                    color_dict,
+                    score_column=PROFANITY_SCORE,
+                ),
+                branchvalues="total",
+            )
         )
 
         fig.update_traces(
@@ -480,7 +807,179 @@ class Graph:
         )
         return fig
 
-    def topic_graph(self) -> go.Figure:
+    @staticmethod
+    @lru_cache(maxsize=32)
+    def __layout_word_cloud(top_words: Tuple[Tuple[str, int], ...]) -> List:
+        wc = WordCloud(
+            max_words=len(top_words),
+            color_func=lambda word, font_size, position, orientation, random_state, font_path: random_color(),
+        )
+        wc.generate_from_frequencies(dict(top_words))
+        return [
+            [word, freq, fontsize, list(position), orientation, color]
+            for (
+                word,
+                freq,
+            ), fontsize, position, orientation, color in wc.layout_
+        ]
+
+    @staticmethod
+    @lru_cache(maxsize=32)
+    def __layout_topic_graph(edges: Tuple[Tuple[int, str, int], ...]) -> List:
+        topic_graph = nx.Graph()
+        topic_graph.add_weighted_edges_from(edges)
+        # Generate the positions for node plotting based on edge weights, the same way every time
+        node_positions = nx.spring_layout(topic_graph, seed=LAYOUT_SEED)
+        return [
+            [node, float(x), float(y)]
+            for node, (x, y) in node_positions.items()
+        ]
+
+    @staticmethod
+    def __time_range(x_range: Optional[Tuple]) -> Tuple:
+        if not x_range:
+            return None, None
+        start, end = x_range
+        return pd.Timestamp(start), pd.Timestamp(end)
+
+    def branch_messages(
+        self, figure: str, branch: List[str], limit: int = 50
+    ) -> Tuple[List[Tuple[str, int]], int]:
+        """
+        The messages of a single branch of the emotion tree map or profanity sunburst, fetched when it's clicked
+        :param figure: EMOTION_TREE_MAP or PROFANITY_SUNBURST
+        :param branch: the values of the branch along the figure's path, i.e. [participant, emotion]
+        :param limit: the maximum number of distinct messages to return
+        :return: the top (message, count) pairs, ranked the same way as the figure's leaves, and the branch's
+        total number of messages
+        """
+        path = HIERARCHIES[figure]
+        mask = np.ones(len(self.df), dtype=bool)
+        for column, value in zip(path, branch):
+            mask &= (self.df[column] == value).values
+        score_column = (
+            PROFANITY_SCORE if figure == PROFANITY_SUNBURST else None
+        )
+        top = self.__top_messages(self.df[mask], [], score_column, limit)
+        return list(zip(top[RAW_TEXT], top[MESSAGE_COUNT])), int(mask.sum())
+
+    @staticmethod
+    def __top_messages(
+        df: pd.DataFrame,
+        path: List[str],
+        score_column: Optional[str],
+        max_leaves: int,
+    ) -> pd.DataFrame:
+        # Each distinct message of each branch is ranked by how often it was sent, or by its score (i.e. how
+        # profane it is), and only the top ones are kept
+        keys = list(path) + [RAW_TEXT]
+        grouped = df.groupby(keys, observed=True, sort=False)
+        leaves = grouped.size().rename(MESSAGE_COUNT).to_frame()
+        leaves[RANK] = (
+            leaves[MESSAGE_COUNT]
+            if score_column is None
+            else grouped[score_column].max()
+        )
+        leaves = leaves.reset_index().sort_values(
+            [RANK, MESSAGE_COUNT], ascending=False, kind="stable"
+        )
+        if path:
+            rank_in_branch = leaves.groupby(
+                list(path), observed=True, sort=False
+            ).cumcount()
+        else:
+            rank_in_branch = pd.Series(np.arange(len(leaves)), leaves.index)
+        return leaves[rank_in_branch.values < max_leaves]
+
+    def __hierarchy(
+        self,
+        path: List[str],
+        color_column: str,
+        color_dict: Dict[str, str],
+        score_column: str = None,
+        max_leaves: int = MAX_LEAVES,
+    ) -> Dict:
+        """
+        Aggregates the messages into the nodes of a tree map or sunburst, so that the figure's size doesn't grow
+        with the chat: every branch along the path gets its number of messages, but only its top max_leaves
+        messages are drawn, followed by a single node for the rest. Each node's customdata holds its branch,
+        which is what branch_messages() takes
+        """
+        ids, labels, parents, values, colors, branches = [], [], [], [], [], []
+        node_ids = {(): "total"}
+        branch_counts = {}
+        color_depth = path.index(color_column) + 1
+
+        def add_node(node_id, label, parent, value, branch):
+            ids.append(node_id)
+            labels.append(label)
+            parents.append(parent)
+            values.append(int(value))
+            colors.append(
+                color_dict.get(branch[color_depth - 1])
+                if len(branch) >= color_depth
+                else None
+            )
+            branches.append(list(branch))
+
+        add_node("total", TOTAL, "", len(self.df), ())
+        for depth in range(1, len(path) + 1):
+            counts = self.df.groupby(
+                list(path[:depth]), observed=True, sort=True
+            ).size()
+            for branch, count in counts.items():
+                branch = branch if isinstance(branch, tuple) else (branch,)
+                node_ids[branch] = "b{}".format(len(node_ids))
+                branch_counts[branch] = count
+                add_node(
+                    node_ids[branch],
+                    branch[-1],
+                    node_ids[branch[:-1]],
+                    count,
+                    branch,
+                )
+
+        leaves = self.__top_messages(self.df, path, score_column, max_leaves)
+        shown = defaultdict(int)
+        for i, row in enumerate(
+            leaves[list(path) + [RAW_TEXT, MESSAGE_COUNT]].values
+        ):
+            branch, text, count = tuple(row[:-2]), row[-2], row[-1]
+            shown[branch] += count
+            add_node(
+                "m{}".format(i),
+                text if len(text) <= 60 else text[:57] + "...",
+                node_ids[branch],
+                count,
+                branch,
+            )
+
+        # Whatever isn't drawn is summed up into a single node per branch, and can be fetched by clicking on it
+        for branch, count in shown.items():
+            hidden = branch_counts[branch] - count
+            if hidden > 0:
+                add_node(
+                    node_ids[branch] + "-more",
+                    "… {} more".format(hidden),
+                    node_ids[branch],
+                    hidden,
+                    branch,
+                )
+
+        return dict(
+            ids=ids,
+            labels=labels,
+            parents=parents,
+            values=values,
+            marker={"colors": colors},
+            customdata=branches,
+        )
+
+    @requires(ENTITIES)
+    def topic_graph(self, max_topics: int = MAX_TOPICS) -> go.Figure:
+        """
+        :param max_topics: how many of the most discussed entities are drawn
+        """
         # @title Topic Analysis
         # @markdown What are the things you commonly talk about? What are things you've been avoiding? \
         # @markdown Note that the **entity extraction is shaky** because the sentences are so small,
@@ -488,48 +987,60 @@ class Graph:
         # @markdown \
         # @markdown The *Topic Graph* is the most informative and comprehensive visualizations,
         # but I've also included some word clouds if graphs aren't your thing.
-        # The generated graph will be slightly different each time
 
-        topic_graph = nx.Graph()
-        entity_label = "entity_label"
-        weight = "weight"
-
-        # Let's generate a graph of the topics discussed
-        topic_graph.add_nodes_from(
-            self.participants, entity_label=PARTICIPANTS_LABEL
+        # How often each participant talks about each entity is a single groupby over the entity table (where
+        # entities that only differ in case are already merged), and only the most discussed entities are kept
+        entities = self.chat.entities
+        weights = entities.weights()
+        participant_codes = weights.index.get_level_values(0).values
+        entity_ids = weights.index.get_level_values(1).values
+        top_ids = np.argsort(-entities.counts(), kind="stable")[:max_topics]
+        kept = np.isin(entity_ids, top_ids)
+        edges = tuple(
+            sorted(
+                zip(
+                    participant_codes[kept].tolist(),
+                    entities.names[entity_ids[kept]],
+                    weights.values[kept].tolist(),
+                )
+            )
         )
-        for i_df, participant in zip(self.dfs, self.participants):
-            for entities in i_df[ENTITIES].values:
-                for text, label in entities.items():
-                    topic_graph.add_node(text, entity_label=label)
-                    if topic_graph.has_edge(participant, text):
-                        topic_graph[participant][text][weight] += 1
-                    else:
-                        topic_graph.add_edge(participant, text, weight=1)
-
-        # Remove isolated nodes (can happen when there's an incorrect number of senders)
-        topic_graph.remove_nodes_from(list(nx.isolates(topic_graph)))
 
-        # Map each entity label to some random color
-        topic_color_map = {
-            label: random_color() for label in SIMPLIFIED_LABELS
+        # Laying the graph out is expensive, so it's done once per chat and then reused, including when the
+        # analysis is shared. The participants are laid out by their codes, so renaming them keeps the layout
+        fingerprint = hashlib.sha1(repr(edges).encode("utf-8")).hexdigest()
+        if (
+            self.topic_graph_layout is None
+            or self.topic_graph_layout[FINGERPRINT] != fingerprint
+        ):
+            self.topic_graph_layout = {
+                FINGERPRINT: fingerprint,
+                LAYOUT: self.__layout_topic_graph(edges),
+            }
+        # The nodes keep the layout's keys, i.e. the participants' codes and the entities' names, so that an entity
+        # named after a participant (which NER often tags as a person) is still drawn as a node of its own
+        node_positions = {
+            node: (x, y) for node, x, y in self.topic_graph_layout[LAYOUT]
         }
 
-        # Generate the positions for node plotting based on edge weights
-        node_positions = nx.spring_layout(topic_graph)
-
-        # Generate the edge plot
+        # Build the edges, and the nodes of each label, in a single pass
+        node_labels = {
+            entities.names[entity_id]: SIMPLIFIED_LABELS[
+                entities.labels[entity_id]
+            ]
+            for entity_id in top_ids
+        }
+        node_weights = Counter()
         edge_x = []
         edge_y = []
-        for edge in topic_graph.edges():
-            x0, y0 = node_positions[edge[0]]
-            x1, y1 = node_positions[edge[1]]
-            edge_x.append(x0)
-            edge_x.append(x1)
-            edge_x.append(None)
-            edge_y.append(y0)
-            edge_y.append(y1)
-            edge_y.append(None)
+        for participant_code, text, weight in edges:
+            node_labels[participant_code] = PARTICIPANTS_LABEL
+            node_weights[participant_code] += weight
+            node_weights[text] += weight
+            x0, y0 = node_positions[participant_code]
+            x1, y1 = node_positions[text]
+            edge_x.extend((x0, x1, None))
+            edge_y.extend((y0, y1, None))
 
         edge_trace = go.Scatter(
             x=edge_x,
@@ -551,45 +1062,43 @@ class Graph:
             else:
                 return 40
 
-        node_traces = []
-        for label in SIMPLIFIED_LABELS:
-            node_x = []
-            node_y = []
-            for node in topic_graph.nodes():
-                if label != topic_graph.nodes[node][entity_label]:
-                    continue
-                x, y = node_positions[node]
-                node_x.append(x)
-                node_y.append(y)
-
-            node_trace = go.Scatter(
-                x=node_x,
-                y=node_y,
+        nodes = {
+            label: {"x": [], "y": [], "size": [], "text": []}
+            for label in SIMPLIFIED_LABELS
+        }
+        for node, node_weight in node_weights.items():
+            label_nodes = nodes[node_labels[node]]
+            x, y = node_positions[node]
+            label_nodes["x"].append(x)
+            label_nodes["y"].append(y)
+            label_nodes["size"].append(map_size(node_weight))
+            label_nodes["text"].append(
+                "<b>{}</b> <br>Discussion Frequency: {}".format(
+                    self.participants[node] if isinstance(node, int) else node,
+                    node_weight,
+                )
+            )
+
+        # Map each entity label to some random color
+        topic_color_map = {
+            label: random_color() for label in SIMPLIFIED_LABELS
+        }
+        node_traces = [
+            go.Scatter(
+                x=nodes[label]["x"],
+                y=nodes[label]["y"],
                 name=label,
                 mode="markers",
                 hoverinfo="text",
-                marker={"color": topic_color_map[label], "line_width": 2},
-            )
-
-            node_colors, node_weights, node_text = [], [], []
-            for adjacencies in topic_graph.adjacency():
-                node_weight = 0
-                if topic_graph.nodes[adjacencies[0]][entity_label] != label:
-                    continue
-                for adjacency in adjacencies[1].values():
-                    node_weight += adjacency[weight]
-                node_weights.append(node_weight)
-                node_text.append(
-                    "<b>{}</b> <br>Discussion Frequency: {}".format(
-                        adjacencies[0], node_weight
-                    )
-                )
-
-            node_trace.marker.size = list(
-                map(lambda m: map_size(m), node_weights)
+                text=nodes[label]["text"],
+                marker={
+                    "color": topic_color_map[label],
+                    "line_width": 2,
+                    "size": nodes[label]["size"],
+                },
             )
-            node_trace.text = node_text
-            node_traces.append(node_trace)
+            for label in SIMPLIFIED_LABELS
+        ]
 
         fig = go.Figure(
             data=[edge_trace, *node_traces],
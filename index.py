@@ -5,7 +5,7 @@ from dash.dependencies import Input, Output, State
 from dash.exceptions import PreventUpdate
 
 from app import app
-from apps import new_app, loaded_app
+from apps import new_app, loaded_app, jobs_api, metrics_api, figure_callbacks
 from config import Config
 from constants.div_properties import (
     ALIASES,
@@ -18,7 +18,9 @@ from constants.div_properties import (
     CHAT_COUNT,
     CHAT_COUNT_MEMORY,
     DATA,
+    FIGURE_TEMPLATES,
     PRIVACY,
+    SESSION,
     URL,
     N_CLICKS,
     VALUE,
@@ -30,7 +32,10 @@ from constants.div_properties import (
 )
 from constants.styling import BLUE, GREEN
 from layouts.error_layout import error_layout
+from layouts.graph_layout import figure_templates
 from services.counter_service import get_chat_count, get_message_count
+from datautils.resources import ensure_bundle
+from services.result_sweeper import get_result_sweeper
 from utils import is_hex_color
 
 DARK_THEME_COMPONENTS = "dark-theme-components"
@@ -55,8 +60,29 @@ theme = {
     "secondary": "#6E6E6E",
 }
 
-chat_count = get_chat_count()
-message_count = get_message_count()
+
+def layout_color_picker(dark_theme: bool = False):
+    # Only the color picker is themed by the provider, so toggling the theme doesn't redraw the rest of the page
+    return daq.DarkThemeProvider(
+        theme=dict(theme, dark=bool(dark_theme)),
+        children=daq.ColorPicker(
+            id="color-picker",
+            label="A color picker for your convenience",
+            value=dict(hex="#ffffff"),
+        ),
+    )
+
+
+def format_count(count):
+    # The counts are missing while the DB is unavailable
+    return "–" if count is None else count
+
+
+# The resource bundle is rebuilt here if its sources have changed since setup, rather than by the first analysis
+ensure_bundle()
+
+chat_count = format_count(get_chat_count())
+message_count = format_count(get_message_count())
 
 # Instructions layout
 instructions_layout = html.Details(
@@ -110,11 +136,10 @@ graph_detail_layout = (
                         placeholder="A list of HEX or RGBA colors corresponding "
                         "to each person - i.e. #6E6E6E,#007439",
                     ),
-                    daq.ColorPicker(
-                        id="color-picker",
+                    html.Div(
+                        id=DARK_THEME_COMPONENTS,
                         className="four columns",
-                        label="A color picker for your convenience",
-                        value=dict(hex="#ffffff"),
+                        children=[layout_color_picker()],
                     ),
                     html.Div(
                         [
@@ -179,7 +204,6 @@ privacy_notice_layout = html.Details(
     ],
 )
 
-# A little confusing, but the root layout needs to be defined separately so that the dark-theme-provider can render it
 root_layout = html.Div(
     [
         html.Div(id=GRAPH_CUSTOMIZATION),
@@ -195,6 +219,9 @@ app.layout = html.Div(
     children=[
         dcc.Store(id=CHAT_COUNT_MEMORY, storage_type="local"),
         dcc.Store(id=MESSAGE_COUNT_MEMORY, storage_type="local"),
+        dcc.Store(id=FIGURE_TEMPLATES, data=figure_templates()),
+        # The id of the session holding the user's upload on the server
+        dcc.Store(id=SESSION, storage_type="memory"),
         html.Header(
             className="container",
             style={"text-align": "center"},
@@ -270,12 +297,7 @@ app.layout = html.Div(
         html.Br(),
         html.Div(id=PRIVACY, className="container"),
         html.Br(),
-        html.Div(
-            id=DARK_THEME_COMPONENTS,
-            children=[
-                daq.DarkThemeProvider(theme=theme, children=root_layout)
-            ],
-        ),
+        root_layout,
         html.Br(),
         html.Footer(
             className="footer",
@@ -315,11 +337,7 @@ def display_page(pathname):
     Output(DARK_THEME_COMPONENTS, CHILDREN), [Input(DAQ_THEME, VALUE)]
 )
 def turn_dark(dark_theme):
-    if dark_theme:
-        theme.update(dark=True)
-    else:
-        theme.update(dark=False)
-    return daq.DarkThemeProvider(theme=theme, children=root_layout)
+    return layout_color_picker(dark_theme)
 
 
 @app.callback(Output(DARK_THEME_CONTAINER, "style"), [Input(DAQ_THEME, VALUE)])
@@ -345,7 +363,7 @@ def change_bg_2(dark_theme):
 )
 def update_chat_count(_, new_data):
     data = new_data or {}
-    return data.get(CHAT_COUNT, get_chat_count())
+    return format_count(data.get(CHAT_COUNT) or get_chat_count())
 
 
 @app.callback(
@@ -355,7 +373,7 @@ def update_chat_count(_, new_data):
 )
 def update_message_count(_, new_data):
     data = new_data or {}
-    return data.get(MESSAGE_COUNT, get_message_count())
+    return format_count(data.get(MESSAGE_COUNT) or get_message_count())
 
 
 @app.callback(Output(GRAPH_CUSTOMIZATION, CHILDREN), [Input(URL, "search")])
@@ -465,4 +483,8 @@ for field in CUSTOMIZATION_FIELDS:
 
 
 if __name__ == "__main__":
+    # The development server is a single process, so it deletes the expired results itself rather than running
+    # `python -m services.result_sweeper` next to it
+    if Config.SWEEP_INTERVAL:
+        get_result_sweeper().start()
     app.run_server(debug=True)
@@ -1,51 +1,401 @@
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, Iterable, List
+
 import dash_core_components as dcc
 import dash_html_components as html
 import plotly.io as pio
 
-from graphs.Graph import Graph
+from config import Config
+from constants.figures import (
+    CONVERSATIONS,
+    DASHBOARD_PRESETS,
+    DAILY_MESSAGES,
+    EMOJI_FREQUENCY,
+    EMOTION_TREE_MAP,
+    PIE_CHARTS,
+    PROFANITY_SUNBURST,
+    REPLY_HEAT_MAP,
+    RESPONSE_TIMES,
+    SENTIMENT_OVER_TIME,
+    TIME_HEAT_MAP,
+    TOPIC_GRAPH,
+    WORD_CLOUD,
+    WORD_DISTRIBUTION,
+)
+from graphs.Graph import HIERARCHIES, Graph
 from layouts.error_layout import error_layout
 
+# The dashboard's sections, each introduced by a quote and followed by its charts as (name, figure, style)
+SECTIONS = [
+    (
+        "What stories do the numbers tell?",
+        [
+            ("pie charts", PIE_CHARTS, None),
+            ("daily messages chart", DAILY_MESSAGES, None),
+            ("word distribution chart", WORD_DISTRIBUTION, None),
+            ("emoji frequency chart", EMOJI_FREQUENCY, None),
+            ("word cloud", WORD_CLOUD, {"FONT-WEIGHT": "300px"}),
+        ],
+    ),
+    (
+        "Time isn't the main thing. It's the only thing",
+        [
+            ("time heat map", TIME_HEAT_MAP, None),
+            ("conversations chart", CONVERSATIONS, None),
+            ("sentiment over time", SENTIMENT_OVER_TIME, None),
+        ],
+    ),
+    (
+        "The value of emotions comes from sharing them, not just having them",
+        [
+            ("emotion tree map", EMOTION_TREE_MAP, None),
+            ("profanity sunburst plot", PROFANITY_SUNBURST, None),
+        ],
+    ),
+    (
+        "When you talk, you are only repeating what you already know. "
+        "But if you listen, you may learn something new",
+        [
+            ("topic graph", TOPIC_GRAPH, None),
+            ("reply heat map", REPLY_HEAT_MAP, None),
+            ("response times chart", RESPONSE_TIMES, None),
+        ],
+    ),
+]
+
+
+# Every section can be collapsed, and only the first ones are open and drawn with the dashboard. The figures of
+# the others are drawn by a callback the first time their section is opened
+SECTION_SUMMARY = "section-summary"
+SECTION_FIGURES = "section-figures"
+SECTION_BODY = "section-body"
+LAZY_SECTION = "lazy-section"
+OPEN_SECTIONS = 1
+
+# Figures are wrapped in containers with pattern matching ids, so that they can be swapped in by callbacks
+FIGURE = "figure"
+PENDING_FIGURE = "pending-figure"
+# The charts of the hierarchical figures and the messages of the branch that was last clicked in them
+CHART = "chart"
+BRANCH_MESSAGES = "branch-messages"
+# The charts of the time series, which are re-aggregated when zoomed in
+TIME_SERIES = "time-series"
+TIME_SERIES_FIGURES = [DAILY_MESSAGES, SENTIMENT_OVER_TIME]
+
+# Every figure is drawn with the template of the theme, and the template is swapped client side when the theme is
+# toggled. The time series are redrawn by their zoom callback instead, which owns their figure
+LIGHT_TEMPLATE = "plotly"
+DARK_TEMPLATE = "plotly_dark"
+THEMED_CHART = "themed-chart"
+
+# Figures that missed their time budget get a placeholder that polls for them until they're drawn
+LATE_FIGURE = "late-figure"
+LATE_FIGURE_POLL = "late-figure-poll"
+LATE_FIGURE_TOKEN = "late-figure-token"
+# Seconds after which a late figure that was never collected (i.e. the page was closed) is forgotten
+LATE_FIGURE_TTL = 600
+
+logger = logging.getLogger(__name__)
+
+__pool = None
+__late_figures = {}
+__lock = threading.Lock()
+
+__CHARTS = {
+    figure: (name, style)
+    for _, charts in SECTIONS
+    for name, figure, style in charts
+}
+
+
+def graph_layout(
+    g: Graph,
+    dark_theme: bool,
+    preset: str = Config.DASHBOARD_PRESET,
+    pending_columns: Iterable[str] = (),
+) -> html.Div:
+    """
+    :param g: the Graph holding the data
+    :param dark_theme: whether the dark theme is enabled
+    :param preset: which of the dashboard presets to draw
+    :param pending_columns: columns that are still being computed in the background. Figures that need them get
+    a placeholder, and figures that only optionally use them are drawn now and redrawn later
+    """
+    pending_columns = set(pending_columns)
+    figures = DASHBOARD_PRESETS[preset]
+    sections = []
+    for quote, charts in SECTIONS:
+        charts = [figure for _, figure, _ in charts if figure in figures]
+        if charts:
+            sections.append((quote, charts))
+
+    children = []
+    for section, (quote, charts) in enumerate(sections):
+        is_open = section < OPEN_SECTIONS
+        children.append(
+            __layout_section(
+                section,
+                quote,
+                charts,
+                (
+                    layout_section_figures(
+                        g, charts, dark_theme, pending_columns
+                    )
+                    if is_open
+                    else None
+                ),
+            )
+        )
+    children.append(__layout_quote("Time spent learning is never wasted"))
+
+    return html.Div(style={"text-align": "center"}, children=children)
+
+
+def layout_section_figures(
+    g: Graph,
+    figures: Iterable[str],
+    dark_theme: bool,
+    pending_columns: Iterable[str] = (),
+) -> List[html.Div]:
+    """
+    Draws the figures of a section, each in a container that can be swapped in later
+    :param g: the Graph holding the data
+    :param figures: the figures of the section
+    :param dark_theme: whether the dark theme is enabled
+    :param pending_columns: columns that are still being computed in the background. Figures that need them get
+    a placeholder, and figures that only optionally use them are drawn now and redrawn later
+    """
+    pending_columns = set(pending_columns)
+    waiting_for = {}
+    for figure in figures:
+        waiting_for[figure] = pending_columns & set(
+            getattr(Graph, figure).required_columns
+        )
+    # The figures that can be drawn now are all drawn at the same time
+    layouts = layout_figures(
+        g,
+        [figure for figure in figures if not waiting_for[figure]],
+        dark_theme,
+    )
+
+    containers = []
+    for figure in figures:
+        is_pending = waiting_for[figure] or pending_columns & set(
+            getattr(Graph, figure).optional_columns
+        )
+        containers.append(
+            html.Div(
+                id={"type": FIGURE, "name": figure},
+                className=PENDING_FIGURE if is_pending else "",
+                children=(
+                    __layout_placeholder(figure)
+                    if waiting_for[figure]
+                    else layouts[figure]
+                ),
+            )
+        )
+    return containers
+
+
+def layout_figures(
+    g: Graph,
+    figures: Iterable[str],
+    dark_theme: bool = False,
+    time_budget: float = Config.FIGURE_TIME_BUDGET,
+) -> Dict:
+    """
+    Draws figures concurrently on the figure pool. A figure that isn't drawn within the time budget is replaced by
+    a placeholder that polls for it, see late_figure()
+    :param g: the Graph holding the data
+    :param figures: the figures to draw
+    :param dark_theme: whether the dark theme is enabled
+    :param time_budget: how many seconds to wait for the figures
+    :return: the layout of each figure
+    """
+    figures = list(figures)
+    # Missing columns are computed up front, so the figures don't race to compute the same ones
+    g.ensure_columns(Graph.required_columns(figures))
+
+    pool = __get_pool()
+    futures = {
+        figure: pool.submit(__timed_layout_figure, g, figure, dark_theme)
+        for figure in figures
+    }
+    wait(list(futures.values()), timeout=time_budget)
+
+    layouts = {}
+    with __lock:
+        __prune_late_figures()
+        for figure, future in futures.items():
+            if future.done():
+                layouts[figure] = future.result()
+            else:
+                logger.info(
+                    "figure %s missed its %.1fs budget", figure, time_budget
+                )
+                token = uuid.uuid4().hex
+                __late_figures[token] = (future, time.time())
+                layouts[figure] = __layout_late_figure(figure, token)
+    return layouts
 
-def graph_layout(g: Graph, dark_theme: bool) -> html.Div:
-    if dark_theme:
-        pio.templates.default = "plotly_dark"
-    else:
-        pio.templates.default = "plotly"
 
+def late_figure(token: str):
+    """
+    The layout of a figure that missed its time budget
+    :param token: the token its placeholder was given
+    :return: the layout, or None if the figure still isn't drawn
+    :raises KeyError: if the token is unknown, i.e. it was drawn by another process or forgotten
+    """
+    with __lock:
+        future, _ = __late_figures[token]
+        if not future.done():
+            return None
+        del __late_figures[token]
+    return future.result()
+
+
+def layout_figure(g: Graph, figure: str, dark_theme: bool = False):
+    """
+    Draws a single figure, i.e. once the columns it was waiting for are ready
+    """
+    name, style = __CHARTS[figure]
+    template = template_for(dark_theme)
+    if figure in TIME_SERIES_FIGURES:
+        return __layout_chart(
+            name,
+            getattr(g, figure),
+            style,
+            {"type": TIME_SERIES, "name": figure},
+            template,
+        )
+    if figure not in HIERARCHIES:
+        return __layout_chart(
+            name,
+            getattr(g, figure),
+            style,
+            {"type": THEMED_CHART, "name": figure},
+            template,
+        )
+
+    # Only the top messages of each branch are drawn, the rest are listed when the branch is clicked
     return html.Div(
-        style={"text-align": "center"},
-        children=[
-            __layout_quote("What stories do the numbers tell?"),
-            __layout_chart("pie charts", g.pie_charts),
-            __layout_chart("daily messages chart", g.daily_messages),
-            __layout_chart("word distribution chart", g.word_distribution),
+        [
             __layout_chart(
-                "word cloud", g.word_cloud, {"FONT-WEIGHT": "300px"}
+                name,
+                getattr(g, figure),
+                style,
+                {"type": CHART, "name": figure},
+                template,
             ),
-            __layout_quote("Time isn't the main thing. It's the only thing"),
-            __layout_chart("time heat map", g.time_heat_map),
-            __layout_chart("sentiment over time", g.sentiment_over_time),
-            __layout_quote(
-                "The value of emotions comes from sharing them, not just having them"
+            html.Div(id={"type": BRANCH_MESSAGES, "name": figure}),
+        ]
+    )
+
+
+def template_for(dark_theme: bool) -> str:
+    """The name of the plotly template figures are drawn with in a theme"""
+    return DARK_TEMPLATE if dark_theme else LIGHT_TEMPLATE
+
+
+def figure_templates() -> Dict:
+    """The light and dark templates, for swapping the template of the figures client side"""
+    return {
+        "light": pio.templates[LIGHT_TEMPLATE].to_plotly_json(),
+        "dark": pio.templates[DARK_TEMPLATE].to_plotly_json(),
+    }
+
+
+def branch_layout(branch, messages, total: int) -> html.Div:
+    """
+    Lists the messages of a branch of a hierarchical figure
+    :param branch: the values along the branch, i.e. [participant, emotion]
+    :param messages: the top (message, count) pairs of the branch
+    :param total: the total number of messages in the branch
+    """
+    return html.Div(
+        className="container",
+        children=[
+            html.H6(
+                "{} - top {} of {} messages".format(
+                    " › ".join(branch) or "Everyone", len(messages), total
+                )
             ),
-            __layout_chart("emotion tree map", g.emotion_tree_map),
-            __layout_chart("profanity sunburst plot", g.profanity_sunburst),
-            __layout_quote(
-                "When you talk, you are only repeating what you already know. "
-                "But if you listen, you may learn something new"
+            html.Ul(
+                [
+                    html.Li("{} (×{})".format(message, count))
+                    for message, count in messages
+                ],
+                style={"text-align": "left"},
             ),
-            __layout_chart("topic graph", g.topic_graph),
-            __layout_quote("Time spent learning is never wasted"),
         ],
     )
 
 
-def __layout_chart(name, graph_func, style=None):
+def __layout_placeholder(figure: str, status: str = "analysed") -> html.Div:
+    return html.Div(
+        className="container",
+        children=[
+            html.H6(
+                "⏳ The {} is still being {}".format(
+                    __CHARTS[figure][0], status
+                )
+            )
+        ],
+    )
+
+
+def __layout_late_figure(figure: str, token: str) -> html.Div:
+    return html.Div(
+        id={"type": LATE_FIGURE, "name": figure},
+        children=[
+            __layout_placeholder(figure, "drawn"),
+            dcc.Interval(
+                id={"type": LATE_FIGURE_POLL, "name": figure}, interval=1000
+            ),
+            dcc.Store(
+                id={"type": LATE_FIGURE_TOKEN, "name": figure}, data=token
+            ),
+        ],
+    )
+
+
+def __timed_layout_figure(g: Graph, figure: str, dark_theme: bool):
+    started_at = time.time()
+    layout = layout_figure(g, figure, dark_theme)
+    logger.info("figure %s built in %.3fs", figure, time.time() - started_at)
+    return layout
+
+
+def __get_pool() -> ThreadPoolExecutor:
+    # The pool is shared by every request handled by this process, and created on first use
+    global __pool
+    if __pool is None:
+        __pool = ThreadPoolExecutor(
+            max_workers=Config.FIGURE_WORKERS,
+            thread_name_prefix="banterly-figure",
+        )
+    return __pool
+
+
+def __prune_late_figures():
+    now = time.time()
+    for token, (future, created_at) in list(__late_figures.items()):
+        if now - created_at > LATE_FIGURE_TTL:
+            future.cancel()
+            del __late_figures[token]
+
+
+def __layout_chart(name, graph_func, style, chart_id, template):
     if style is None:
         style = {}
     try:
         return dcc.Graph(
-            figure=graph_func(),
+            id=chart_id,
+            figure=graph_func().update_layout(template=template),
             config={"displaylogo": False},
             className="graph-container",
             style=style,
@@ -56,6 +406,43 @@ def __layout_chart(name, graph_func, style=None):
         )
 
 
+def __layout_section(
+    section: int, quote: str, figures: List[str], containers=None
+) -> html.Details:
+    # The quote is the section's summary, so clicking it opens the section. Sections without containers are only
+    # drawn then, from the figures in their store
+    return html.Details(
+        open=containers is not None,
+        children=[
+            html.Summary(
+                id={"type": SECTION_SUMMARY, "section": section},
+                n_clicks=0,
+                className="container dashboard-section",
+                children=[
+                    html.Hr(),
+                    html.H3([html.Em('"{}"'.format(quote))]),
+                    html.Hr(),
+                ],
+            ),
+            dcc.Store(
+                id={"type": SECTION_FIGURES, "section": section}, data=figures
+            ),
+            html.Div(
+                id={"type": SECTION_BODY, "section": section},
+                className="" if containers is not None else LAZY_SECTION,
+                children=(
+                    containers
+                    if containers is not None
+                    else html.Div(
+                        className="container",
+                        children=[html.H6("⏳ Loading...")],
+                    )
+                ),
+            ),
+        ],
+    )
+
+
 def __layout_quote(quote: str) -> html.Div:
     return html.Div(
         className="container",
@@ -0,0 +1,36 @@
+from typing import Dict, List
+
+import dash_html_components as html
+
+from constants.styling import GREEN
+
+
+def progress_layout(status: str, stages: List[str], timings: Dict) -> html.Div:
+    """
+    A per stage progress indicator for an upload's processing job
+    :param status: the job's status
+    :param stages: the names of the stages the job is running
+    :param timings: the timings of the stages that are done, by name
+    """
+    items = [
+        html.Span("Status: {}".format(status), style={"margin": "0 10px"})
+    ]
+    for stage in stages:
+        timing = timings.get(stage)
+        if timing:
+            items.append(
+                html.Span(
+                    "✔️ {} ({:.1f}s)".format(stage, timing["wall_time"]),
+                    style={"color": GREEN, "margin": "0 10px"},
+                )
+            )
+        else:
+            items.append(
+                html.Span("⏳ {}".format(stage), style={"margin": "0 10px"})
+            )
+
+    return html.Div(
+        className="container",
+        style={"text-align": "center"},
+        children=[html.P(items)],
+    )
@@ -0,0 +1,135 @@
+"""Circuit breakers around the services the app can run without, i.e. the DB and the bucket. Once a service has failed
+a few times in a row its calls fail straight away for a while, so that a service that's down or slow doesn't hold up
+every request until it times out. Analyses keep working without it, just without counters and sharing"""
+import functools
+import logging
+import threading
+import time
+from typing import Callable, Tuple
+
+from botocore.exceptions import ConnectionError as StorageConnectionError
+from botocore.exceptions import HTTPClientError
+from pymongo.errors import ConnectionFailure
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half open"
+
+
+class ServiceUnavailableError(Exception):
+    """Raised when a service couldn't be reached in time, or its circuit is open"""
+
+
+class CircuitOpenError(ServiceUnavailableError):
+    """Raised instead of calling a service whose circuit is open"""
+
+
+class CircuitBreaker:
+    """
+    Counts the consecutive calls that failed with one of the errors a service raises when it's unavailable. Once
+    there have been too many, the circuit opens and calls raise a CircuitOpenError without being made. After a
+    while a single call is let through, which closes the circuit again if it succeeds
+    """
+
+    def __init__(
+        self,
+        name: str,
+        errors: Tuple,
+        max_failures: int = Config.CIRCUIT_BREAKER_FAILURES,
+        reset_timeout: float = Config.CIRCUIT_BREAKER_RESET,
+    ):
+        """
+        :param name: the service's name, for logging
+        :param errors: the errors that mean the service is unavailable, other errors are raised as they are
+        :param max_failures: how many calls in a row can fail before the circuit opens
+        :param reset_timeout: seconds before a call is let through an open circuit
+        """
+        self.name = name
+        self.errors = errors
+        self.max_failures = max_failures
+        self.reset_timeout = reset_timeout
+        self.__failures = 0
+        self.__opened_at = None
+        self.__is_trying = False
+        self.__lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self.__lock:
+            if self.__opened_at is None:
+                return CLOSED
+            if time.time() - self.__opened_at < self.reset_timeout:
+                return OPEN
+            return HALF_OPEN
+
+    def call(self, func: Callable, *args, **kwargs):
+        """
+        Calls func unless the circuit is open
+        :raises ServiceUnavailableError: if it failed with one of the breaker's errors, or wasn't called
+        """
+        self.__before_call()
+        try:
+            result = func(*args, **kwargs)
+        except self.errors as e:
+            self.__record(success=False)
+            raise ServiceUnavailableError(
+                "{} is unavailable: {}".format(self.name, e)
+            ) from e
+        except Exception:
+            # The service answered, even if it was with an error
+            self.__record(success=True)
+            raise
+        self.__record(success=True)
+        return result
+
+    def __call__(self, func: Callable) -> Callable:
+        """Decorates func so that it's always called through the breaker"""
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return self.call(func, *args, **kwargs)
+
+        return wrapper
+
+    def __before_call(self):
+        with self.__lock:
+            if self.__opened_at is None:
+                return
+            # Only one call is let through at a time once the circuit's been open for long enough
+            if (
+                time.time() - self.__opened_at < self.reset_timeout
+                or self.__is_trying
+            ):
+                raise CircuitOpenError("{} is unavailable".format(self.name))
+            self.__is_trying = True
+
+    def __record(self, success: bool):
+        with self.__lock:
+            self.__is_trying = False
+            if success:
+                if self.__opened_at is not None:
+                    logger.info("%s is available again", self.name)
+                self.__failures = 0
+                self.__opened_at = None
+                return
+            self.__failures += 1
+            if self.__failures >= self.max_failures:
+                if self.__opened_at is None:
+                    logger.warning(
+                        "%s failed %d times in a row, failing fast for %ss",
+                        self.name,
+                        self.__failures,
+                        self.reset_timeout,
+                    )
+                self.__opened_at = time.time()
+
+
+# The DB holds the counters and the entries of shared analyses, the bucket holds their data
+database_breaker = CircuitBreaker("the database", (ConnectionFailure,))
+storage_breaker = CircuitBreaker(
+    "the bucket", (StorageConnectionError, HTTPClientError)
+)
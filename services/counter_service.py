@@ -1,24 +1,46 @@
+from typing import Optional
+
 from app import db
 from constants.database_keys import TYPE, COUNT
+from services.circuit_breaker import ServiceUnavailableError, database_breaker
 
 __counters = db.counters
 __chat_query = {TYPE: "chats"}
 __message_query = {TYPE: "messages"}
 
+# The counters are left out while the DB is unavailable, rather than holding up the uploads that update them
+
 
-def get_chat_count() -> int:
-    c = __counters.find_one(__chat_query)
-    return c[COUNT]
+def get_chat_count() -> Optional[int]:
+    """:return: the number of chats analyzed so far, or None if the DB is unavailable"""
+    return __get_count(__chat_query)
 
 
-def get_message_count() -> int:
-    c = __counters.find_one(__message_query)
-    return c[COUNT]
+def get_message_count() -> Optional[int]:
+    """:return: the number of messages analyzed so far, or None if the DB is unavailable"""
+    return __get_count(__message_query)
 
 
 def increment_chat_count():
-    __counters.update_one(__chat_query, {"$inc": {COUNT: 1}})
+    __increase_count(__chat_query, 1)
 
 
 def increase_message_count(num_messages: int):
-    __counters.update_one(__message_query, {"$inc": {COUNT: num_messages}})
+    __increase_count(__message_query, num_messages)
+
+
+def __get_count(query: dict) -> Optional[int]:
+    try:
+        c = database_breaker.call(__counters.find_one, query)
+    except ServiceUnavailableError:
+        return None
+    return c[COUNT] if c else None
+
+
+def __increase_count(query: dict, amount: int):
+    try:
+        database_breaker.call(
+            __counters.update_one, query, {"$inc": {COUNT: amount}}
+        )
+    except ServiceUnavailableError:
+        pass
@@ -0,0 +1,356 @@
+"""A queue of background jobs with a bounded pool of workers, so that long running work (i.e. processing an upload)
+doesn't tie up the web workers. Jobs run on an in-process thread pool by default, or on RQ workers if Redis is
+configured"""
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from config import Config
+
+QUEUED = "queued"
+RUNNING = "running"
+FINISHED = "finished"
+FAILED = "failed"
+CANCELLED = "cancelled"
+TIMED_OUT = "timed out"
+DONE_STATUSES = {FINISHED, FAILED, CANCELLED, TIMED_OUT}
+
+LOCAL_BACKEND = "local"
+RQ_BACKEND = "rq"
+# The Redis key of an RQ job's cancellation flag. It's kept out of the job's meta, which the job itself rewrites
+# whenever it publishes something and would overwrite a flag set by another process in the meantime
+CANCEL_KEY = "banterly:cancelled:{}"
+
+__queue = None
+__queue_lock = threading.Lock()
+
+
+class QueueFullError(Exception):
+    """Raised when too many jobs are already waiting to be run"""
+
+
+class JobCancelled(Exception):
+    """Raised inside of a job when it's been cancelled"""
+
+
+class JobTimedOut(Exception):
+    """Raised inside of a job when it's gone over its time limit"""
+
+
+class LocalJob:
+    """
+    A job on the in-process queue. It's also what the job function receives as its first argument, to publish
+    partial results and to check whether it should stop
+    """
+
+    def __init__(self, job_id: str, timeout: Optional[float]):
+        self.id = job_id
+        self.status = QUEUED
+        self.meta = {}
+        self.result = None
+        self.error = None
+        self.enqueued_at = time.time()
+        self.started_at = None
+        self.ended_at = None
+        self.timeout = timeout
+        self.future = None
+        self.__cancelled = threading.Event()
+
+    @property
+    def is_timed_out(self) -> bool:
+        return (
+            self.timeout is not None
+            and self.started_at is not None
+            and time.time() - self.started_at > self.timeout
+        )
+
+    def publish(self, **data):
+        """Makes partial results available to whoever is polling the job"""
+        self.meta.update(data)
+
+    def check(self):
+        """Stops the job by raising if it's been cancelled or has run out of time"""
+        if self.__cancelled.is_set():
+            raise JobCancelled()
+        if self.is_timed_out:
+            raise JobTimedOut()
+
+    def cancel(self):
+        self.__cancelled.set()
+
+
+class LocalJobQueue:
+    """Runs jobs on a bounded thread pool inside of the web process"""
+
+    def __init__(
+        self,
+        workers: int = Config.JOB_WORKERS,
+        max_queued: int = Config.JOB_QUEUE_SIZE,
+        result_ttl: float = Config.JOB_RESULT_TTL,
+    ):
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self.__executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="banterly-job"
+        )
+        self.__jobs = {}
+        self.__lock = threading.Lock()
+
+    def submit(
+        self,
+        func: Callable,
+        *args,
+        timeout: float = Config.JOB_TIMEOUT,
+        **kwargs
+    ) -> str:
+        """
+        Queues func(job, *args, **kwargs)
+        :return: the job's id
+        """
+        with self.__lock:
+            self.__prune()
+            active = sum(
+                1
+                for job in self.__jobs.values()
+                if job.status not in DONE_STATUSES
+            )
+            if active >= self.max_queued:
+                raise QueueFullError(
+                    "there are already {} jobs waiting".format(active)
+                )
+            job = LocalJob(uuid.uuid4().hex, timeout)
+            self.__jobs[job.id] = job
+        job.future = self.__executor.submit(
+            self.__run, job, func, args, kwargs
+        )
+        return job.id
+
+    def status(self, job_id: str) -> Optional[Dict]:
+        job = self.__get(job_id)
+        if job is None:
+            return None
+        return {
+            "id": job.id,
+            "status": job.status,
+            "error": job.error,
+            "enqueued_at": job.enqueued_at,
+            "started_at": job.started_at,
+            "ended_at": job.ended_at,
+        }
+
+    def meta(self, job_id: str) -> Dict:
+        job = self.__get(job_id)
+        return dict(job.meta) if job else {}
+
+    def result(self, job_id: str):
+        job = self.__get(job_id)
+        return job.result if job and job.status == FINISHED else None
+
+    def cancel(self, job_id: str) -> bool:
+        job = self.__get(job_id)
+        if job is None or job.status in DONE_STATUSES:
+            return False
+        job.cancel()
+        # Jobs that haven't started yet are simply never run
+        if job.future.cancel():
+            self.__end(job, CANCELLED)
+        return True
+
+    def release(self, job_id: str):
+        """Forgets a job and its results once they're no longer needed"""
+        with self.__lock:
+            job = self.__jobs.pop(job_id, None)
+        if job is not None and job.status not in DONE_STATUSES:
+            job.cancel()
+
+    def __get(self, job_id: str) -> Optional[LocalJob]:
+        with self.__lock:
+            return self.__jobs.get(job_id)
+
+    def __prune(self):
+        # Forget jobs whose results were never collected
+        now = time.time()
+        for job_id, job in list(self.__jobs.items()):
+            if job.ended_at and now - job.ended_at > self.result_ttl:
+                del self.__jobs[job_id]
+
+    @staticmethod
+    def __end(job: LocalJob, status: str, error: str = None):
+        job.status = status
+        job.error = error
+        job.ended_at = time.time()
+
+    def __run(self, job: LocalJob, func: Callable, args, kwargs):
+        if job.status in DONE_STATUSES:
+            return
+        job.started_at = time.time()
+        job.status = RUNNING
+        try:
+            job.check()
+            job.result = func(job, *args, **kwargs)
+            self.__end(job, FINISHED)
+        except JobCancelled:
+            self.__end(job, CANCELLED)
+        except JobTimedOut:
+            self.__end(job, TIMED_OUT, "the job took too long")
+        except Exception as e:
+            self.__end(job, FAILED, str(e))
+
+
+class RQJob:
+    """What a job function receives as its first argument when it runs on an RQ worker"""
+
+    def __init__(self, job):
+        self.__job = job
+        self.id = job.id
+
+    def publish(self, **data):
+        self.__job.meta.update(data)
+        self.__job.save_meta()
+
+    def check(self):
+        # RQ enforces the timeout itself by killing the work horse
+        if self.__job.connection.exists(CANCEL_KEY.format(self.id)):
+            raise JobCancelled()
+
+
+def _run_rq_job(func: Callable, args, kwargs):
+    """The function RQ actually runs, which hands the job to func the same way the local queue does"""
+    from rq import get_current_job
+
+    return func(RQJob(get_current_job()), *args, **kwargs)
+
+
+class RQJobQueue:
+    """Runs jobs on RQ workers (`rq worker banterly`), for when the web and processing tiers are separate"""
+
+    __STATUSES = {
+        "queued": QUEUED,
+        "deferred": QUEUED,
+        "scheduled": QUEUED,
+        "started": RUNNING,
+        "finished": FINISHED,
+        "failed": FAILED,
+        "stopped": CANCELLED,
+        "canceled": CANCELLED,
+    }
+
+    def __init__(
+        self,
+        connection,
+        max_queued: int = Config.JOB_QUEUE_SIZE,
+        result_ttl: float = Config.JOB_RESULT_TTL,
+        is_async: bool = True,
+    ):
+        from rq import Queue
+
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self.__connection = connection
+        self.__queue = Queue(
+            "banterly", connection=connection, is_async=is_async
+        )
+
+    def submit(
+        self,
+        func: Callable,
+        *args,
+        timeout: float = Config.JOB_TIMEOUT,
+        **kwargs
+    ) -> str:
+        if len(self.__queue) >= self.max_queued:
+            raise QueueFullError(
+                "there are already {} jobs waiting".format(len(self.__queue))
+            )
+        job = self.__queue.enqueue(
+            _run_rq_job,
+            args=(func, args, kwargs),
+            job_timeout=timeout,
+            result_ttl=self.result_ttl,
+            failure_ttl=self.result_ttl,
+        )
+        return job.id
+
+    def status(self, job_id: str) -> Optional[Dict]:
+        job = self.__fetch(job_id)
+        if job is None:
+            return None
+        status = self.__STATUSES.get(job.get_status(), QUEUED)
+        error = None
+        if status == FAILED:
+            exc_info = job.exc_info or ""
+            error = exc_info.strip().splitlines()[-1] if exc_info else None
+            if exc_info and "JobTimeoutException" in exc_info:
+                status = TIMED_OUT
+        if status == FAILED and "JobCancelled" in (error or ""):
+            status = CANCELLED
+        return {
+            "id": job.id,
+            "status": status,
+            "error": error,
+            "enqueued_at": self.__timestamp(job.enqueued_at),
+            "started_at": self.__timestamp(job.started_at),
+            "ended_at": self.__timestamp(job.ended_at),
+        }
+
+    def meta(self, job_id: str) -> Dict:
+        job = self.__fetch(job_id)
+        return dict(job.get_meta(refresh=True)) if job else {}
+
+    def result(self, job_id: str):
+        job = self.__fetch(job_id)
+        if job is None or job.get_status() != "finished":
+            return None
+        return job.result
+
+    def cancel(self, job_id: str) -> bool:
+        job = self.__fetch(job_id)
+        if job is None or job.is_finished or job.is_failed:
+            return False
+        # The flag outlives the job for as long as its results would
+        self.__connection.set(
+            CANCEL_KEY.format(job_id),
+            1,
+            ex=int((job.timeout or Config.JOB_TIMEOUT) + self.result_ttl),
+        )
+        if job.get_status() == "queued":
+            job.cancel()
+        return True
+
+    def release(self, job_id: str):
+        job = self.__fetch(job_id)
+        if job is not None:
+            job.delete()
+        self.__connection.delete(CANCEL_KEY.format(job_id))
+
+    def __fetch(self, job_id: str):
+        from rq.exceptions import NoSuchJobError
+        from rq.job import Job
+
+        try:
+            return Job.fetch(job_id, connection=self.__connection)
+        except NoSuchJobError:
+            return None
+
+    @staticmethod
+    def __timestamp(value) -> Optional[float]:
+        return value.timestamp() if value else None
+
+
+def get_job_queue():
+    """
+    The queue is shared by every request handled by this process, and created on first use
+    """
+    global __queue
+    with __queue_lock:
+        if __queue is None:
+            if Config.JOB_BACKEND == RQ_BACKEND:
+                # Redis and RQ are optional dependencies, only needed for this backend
+                from redis import Redis
+
+                __queue = RQJobQueue(Redis.from_url(Config.REDIS_URL))
+            else:
+                __queue = LocalJobQueue()
+    return __queue
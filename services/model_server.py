@@ -0,0 +1,314 @@
+"""A sidecar process that holds the only copy of the NLP models, so that the web workers (and their processing pools)
+don't each load their own. Workers send it the texts of a stage over a Unix socket, and texts sent for the same task
+by concurrent requests are run together in micro-batches. Start it with `python -m services.model_server`"""
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing.connection import Client, Listener
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+__client = (None, None)
+__client_lock = threading.Lock()
+
+
+class ModelServerError(RuntimeError):
+    """Raised when a task failed inside of the model server"""
+
+
+class Request(NamedTuple):
+    """The values a worker sent for a task, and where to send their outputs"""
+
+    connection: object
+    send_lock: threading.Lock
+    request_id: int
+    task: str
+    lang: str
+    values: List
+    received_at: float
+
+
+class ModelServer:
+    """
+    Serves the tasks over a Unix socket. Requests are queued per task and language, and a batch is run as soon as
+    it holds enough values or its oldest request has waited long enough. Batches are run on a pool of processes
+    forked once the models are loaded, so that they share the models' memory but not the GIL
+    """
+
+    def __init__(
+        self,
+        address: str,
+        tasks: Dict[str, Callable],
+        batch_size: int = Config.MODEL_BATCH_SIZE,
+        max_latency: float = Config.MODEL_BATCH_LATENCY,
+        threads: int = Config.MODEL_SERVER_THREADS,
+        processes: int = Config.MODEL_SERVER_PROCESSES,
+        authkey: bytes = None,
+    ):
+        """
+        :param address: the path of the Unix socket
+        :param tasks: task(values, lang) -> a list with an output per value, by name
+        :param batch_size: how many values a batch holds before it's run without waiting for more requests
+        :param max_latency: seconds a request waits for others to be batched with
+        :param threads: how many batches are run at the same time
+        :param processes: how many processes the batches are run on, 0 runs them on the threads of this process
+        (where they hold the GIL, so only the parts of the models that release it run in parallel)
+        :param authkey: what the workers have to know to connect, derived from the app's SECRET_KEY by default
+        :raises ValueError: if there is no authkey
+        """
+        self.address = address
+        self.tasks = tasks
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.processes = processes
+        self.__requests = queue.Queue()
+        # Each thread waits for a batch it's handed to a process
+        self.__executor = ThreadPoolExecutor(
+            max_workers=max(threads, processes),
+            thread_name_prefix="banterly-models",
+        )
+        self.__pool = None
+        self.__authkey = authkey or _authkey()
+        self.__listener = None
+        self.__stopped = threading.Event()
+
+    def serve_forever(self):
+        if os.path.exists(self.address):
+            os.remove(self.address)
+        if self.processes:
+            # The tasks are sent to the processes by reference, and their models are inherited rather than loaded
+            # again. They're all started now, before this process has any other threads
+            self.__pool = ProcessPoolExecutor(
+                max_workers=self.processes,
+                mp_context=multiprocessing.get_context("fork"),
+            )
+            self.__pool.submit(os.getpid).result()
+        self.__listener = Listener(
+            self.address, family="AF_UNIX", authkey=self.__authkey
+        )
+        threading.Thread(
+            target=self.__batch, name="banterly-batcher", daemon=True
+        ).start()
+        logger.info("model server listening on %s", self.address)
+        while not self.__stopped.is_set():
+            try:
+                connection = self.__listener.accept()
+            except OSError:
+                if self.__stopped.is_set():
+                    return
+                logger.exception("couldn't accept a connection")
+                continue
+            threading.Thread(
+                target=self.__receive, args=(connection,), daemon=True
+            ).start()
+
+    def close(self):
+        self.__stopped.set()
+        if self.__listener is not None:
+            self.__listener.close()
+        if self.__pool is not None:
+            self.__pool.shutdown(wait=False)
+
+    def __receive(self, connection):
+        # Each worker process has a single connection, which its threads share
+        send_lock = threading.Lock()
+        with connection:
+            while True:
+                try:
+                    request_id, task, lang, values = connection.recv()
+                except (EOFError, OSError):
+                    return
+                self.__requests.put(
+                    Request(
+                        connection,
+                        send_lock,
+                        request_id,
+                        task,
+                        lang,
+                        values,
+                        time.time(),
+                    )
+                )
+
+    def __batch(self):
+        pending = {}
+        while not self.__stopped.is_set():
+            timeout = None
+            if pending:
+                oldest = min(
+                    batch[0].received_at for batch in pending.values()
+                )
+                timeout = max(0.0, oldest + self.max_latency - time.time())
+            try:
+                request = self.__requests.get(timeout=timeout)
+                pending.setdefault((request.task, request.lang), []).append(
+                    request
+                )
+            except queue.Empty:
+                pass
+
+            now = time.time()
+            for key, batch in list(pending.items()):
+                if (
+                    sum(len(request.values) for request in batch)
+                    >= self.batch_size
+                    or now - batch[0].received_at >= self.max_latency
+                ):
+                    del pending[key]
+                    self.__executor.submit(self.__run, key, batch)
+
+    def __run(self, key, batch: List[Request]):
+        task, lang = key
+        started_at = time.time()
+        outputs, error = None, None
+        values = [value for request in batch for value in request.values]
+        try:
+            if self.__pool is not None:
+                outputs = self.__pool.submit(
+                    self.tasks[task], values, lang
+                ).result()
+            else:
+                outputs = self.tasks[task](values, lang)
+        except Exception as e:
+            logger.exception("task %s failed", task)
+            error = "{}: {}".format(type(e).__name__, e)
+        logger.info(
+            "ran %s on %d values from %d requests in %.3fs",
+            task,
+            len(values),
+            len(batch),
+            time.time() - started_at,
+        )
+
+        start = 0
+        for request in batch:
+            stop = start + len(request.values)
+            response = (
+                request.request_id,
+                outputs[start:stop] if error is None else None,
+                error,
+            )
+            start = stop
+            try:
+                with request.send_lock:
+                    request.connection.send(response)
+            except (OSError, ValueError):
+                # The worker's gone, nobody's waiting for its outputs
+                pass
+
+
+class ModelClient:
+    """A worker process' connection to the model server, shared by its threads"""
+
+    def __init__(self, address: str, authkey: bytes = None):
+        """
+        :raises ValueError: if there is no authkey
+        """
+        self.__connection = Client(
+            address, family="AF_UNIX", authkey=authkey or _authkey()
+        )
+        self.__send_lock = threading.Lock()
+        self.__futures = {}
+        self.__futures_lock = threading.Lock()
+        self.__request_ids = itertools.count()
+        self.is_closed = False
+        threading.Thread(
+            target=self.__receive, name="banterly-model-client", daemon=True
+        ).start()
+
+    def infer(self, task: str, values: List, lang: str = "en") -> List:
+        """
+        Runs a task on the model server
+        :return: an output per value
+        :raises ConnectionError: if the model server can't be reached
+        :raises ModelServerError: if the task failed
+        """
+        future = Future()
+        with self.__futures_lock:
+            if self.is_closed:
+                raise ConnectionError("the model server closed the connection")
+            request_id = next(self.__request_ids)
+            self.__futures[request_id] = future
+        try:
+            with self.__send_lock:
+                self.__connection.send((request_id, task, lang, list(values)))
+        except (OSError, ValueError) as e:
+            with self.__futures_lock:
+                self.__futures.pop(request_id, None)
+            raise ConnectionError(
+                "couldn't reach the model server: {}".format(e)
+            ) from e
+        return future.result()
+
+    def __receive(self):
+        while True:
+            try:
+                request_id, outputs, error = self.__connection.recv()
+            except (EOFError, OSError):
+                break
+            with self.__futures_lock:
+                future = self.__futures.pop(request_id, None)
+            if future is None:
+                continue
+            if error is None:
+                future.set_result(outputs)
+            else:
+                future.set_exception(ModelServerError(error))
+
+        with self.__futures_lock:
+            self.is_closed = True
+            futures, self.__futures = self.__futures, {}
+        for future in futures.values():
+            future.set_exception(
+                ConnectionError("the model server closed the connection")
+            )
+
+
+def get_model_client() -> Optional[ModelClient]:
+    """
+    The connection of this process to the model server, created on first use (and again if it's been closed, or
+    the process has been forked)
+    :return: None if no model server is configured
+    :raises ConnectionError: if it's configured but can't be reached
+    """
+    global __client
+    if not Config.MODEL_SERVER_ADDRESS:
+        return None
+    with __client_lock:
+        pid, client = __client
+        if pid != os.getpid() or client.is_closed:
+            try:
+                client = ModelClient(Config.MODEL_SERVER_ADDRESS)
+            except (OSError, ValueError) as e:
+                raise ConnectionError(
+                    "couldn't reach the model server: {}".format(e)
+                ) from e
+            __client = (os.getpid(), client)
+        return client
+
+
+def _authkey() -> bytes:
+    # Only processes that know the app's secret key can connect, so nothing is served without one
+    if not Config.SECRET_KEY:
+        raise ValueError("the model server needs SECRET_KEY to be set")
+    return Config.SECRET_KEY.encode("utf-8")
+
+
+if __name__ == "__main__":
+    from datautils.processor import MODEL_TASKS, load_models
+    from datautils.resources import ensure_bundle
+
+    if not Config.MODEL_SERVER_ADDRESS or not Config.SECRET_KEY:
+        raise SystemExit("MODEL_SERVER_ADDRESS and SECRET_KEY need to be set")
+    logging.basicConfig(level=logging.INFO)
+    ensure_bundle()
+    load_models()
+    ModelServer(Config.MODEL_SERVER_ADDRESS, MODEL_TASKS).serve_forever()
@@ -1,33 +1,143 @@
+import re
 from datetime import datetime
-from typing import Dict
+from typing import Dict, Iterable, Optional, Set
 
 from bson.objectid import ObjectId
 
 from app import db
+from config import Config
 from constants.database_keys import (
     OID,
     URI,
     LAST_UPDATED,
     MEDIA_COUNTER,
     COLOR_MAP,
+    WORD_CLOUD_LAYOUT,
+    TOPIC_GRAPH_LAYOUT,
+    STATUS,
+    IS_PERMANENT,
 )
+from services.circuit_breaker import database_breaker
+
+# The statuses of an entry, which is inserted as soon as its id is handed out and updated once it's been written
+PENDING = "pending"
+READY = "ready"
+FAILED = "failed"
 
 __processed_data = db.processed_data
+# The sweeper runs in its own process, and keeps its metrics here for the web workers
+__sweeper_metrics = db.sweeper_metrics
+SWEEPER_METRICS_ID = "sweeper"
 
 
-def create_processed_data_entry(
-    oid: ObjectId, uri: str, color_map: Dict, media_counter: Dict
-):
+# Every call fails fast while the DB is unavailable, by raising a ServiceUnavailableError. The entries' times are
+# in UTC, which is what their TTL index expects
+@database_breaker
+def create_indexes():
+    """
+    Expires temporary entries RESULT_TTL seconds after they were last updated. Entries from before the permanent
+    flag existed are flagged by where they were stored first
+    """
+    if Config.PERMANENT_BUCKET_PATH:
+        __processed_data.update_many(
+            {
+                IS_PERMANENT: {"$exists": False},
+                URI: {"$regex": "^" + re.escape(Config.PERMANENT_BUCKET_PATH)},
+            },
+            {"$set": {IS_PERMANENT: True}},
+        )
+    __processed_data.update_many(
+        {IS_PERMANENT: {"$exists": False}}, {"$set": {IS_PERMANENT: False}}
+    )
+    options = {
+        "expireAfterSeconds": Config.RESULT_TTL,
+        "partialFilterExpression": {IS_PERMANENT: False},
+    }
+    for name, index in __processed_data.index_information().items():
+        # collMod can change an index's TTL but not its filter, so an index with other options is replaced
+        if index["key"] == [(LAST_UPDATED, 1)] and any(
+            index.get(option) != value for option, value in options.items()
+        ):
+            __processed_data.drop_index(name)
+    __processed_data.create_index(LAST_UPDATED, **options)
+
+
+@database_breaker
+def create_pending_entry(oid: ObjectId, is_permanent: bool = False):
+    """Reserves the entry of a result that's still being written, so that it can already be shared"""
     return __processed_data.insert_one(
         {
             OID: oid,
-            URI: uri,
-            LAST_UPDATED: datetime.now(),
-            COLOR_MAP: color_map,
-            MEDIA_COUNTER: media_counter,
+            LAST_UPDATED: datetime.utcnow(),
+            STATUS: PENDING,
+            IS_PERMANENT: is_permanent,
         }
     ).acknowledged
 
 
+@database_breaker
+def create_processed_data_entry(
+    oid: ObjectId,
+    uri: str,
+    color_map: Dict,
+    media_counter: Dict,
+    word_cloud_layout: Dict = None,
+    topic_graph_layout: Dict = None,
+    is_permanent: bool = False,
+):
+    # The entry might have been reserved while it was being written
+    return __processed_data.update_one(
+        {OID: oid},
+        {
+            "$set": {
+                URI: uri,
+                LAST_UPDATED: datetime.utcnow(),
+                COLOR_MAP: color_map,
+                MEDIA_COUNTER: media_counter,
+                WORD_CLOUD_LAYOUT: word_cloud_layout,
+                TOPIC_GRAPH_LAYOUT: topic_graph_layout,
+                STATUS: READY,
+                IS_PERMANENT: is_permanent,
+            }
+        },
+        upsert=True,
+    ).acknowledged
+
+
+@database_breaker
+def fail_processed_data_entry(oid: ObjectId):
+    """Marks an entry whose result couldn't be written"""
+    return __processed_data.update_one(
+        {OID: oid}, {"$set": {STATUS: FAILED, LAST_UPDATED: datetime.utcnow()}}
+    ).acknowledged
+
+
+@database_breaker
 def get_processed_data(oid: ObjectId) -> dict:
     return __processed_data.find_one({OID: oid})
+
+
+@database_breaker
+def get_existing_oids(oids: Iterable[ObjectId]) -> Set[ObjectId]:
+    """:return: the ids that still have an entry, i.e. that haven't expired"""
+    return {
+        entry[OID]
+        for entry in __processed_data.find(
+            {OID: {"$in": list(oids)}}, {OID: True}
+        )
+    }
+
+
+@database_breaker
+def save_sweeper_metrics(metrics: Dict):
+    __sweeper_metrics.replace_one(
+        {OID: SWEEPER_METRICS_ID},
+        dict(metrics, **{OID: SWEEPER_METRICS_ID}),
+        upsert=True,
+    )
+
+
+@database_breaker
+def get_sweeper_metrics() -> Optional[Dict]:
+    """:return: None if the sweeper hasn't run yet"""
+    return __sweeper_metrics.find_one({OID: SWEEPER_METRICS_ID}, {OID: False})
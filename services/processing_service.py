@@ -0,0 +1,119 @@
+"""The job that processes an upload, run on the job queue so that the web workers stay free"""
+import pickle
+from typing import Dict, Iterable
+
+import pandas as pd
+from botocore.exceptions import NoCredentialsError
+from bson.objectid import ObjectId
+
+from config import Config
+from datautils.Parser import Parser
+from datautils.chat_frame import ChatFrame
+from datautils.executor import StageTiming
+from datautils.processor import compute_columns, inline_columns, stages_for
+from services.result_store import get_result_store
+
+# Keys of what the job publishes while it's running
+PARSED = "parsed"
+STAGES = "stages"
+TIMINGS = "timings"
+COLUMNS = "columns"
+# The key of the parsed dataframe's uri, next to the participants and media counts
+PARSED_URI = "uri"
+
+
+def process_upload(
+    job, raw_text: str, columns: Iterable[str] = None, lang: str = "en"
+) -> Dict:
+    """
+    Parses an upload and computes the columns needed by the dashboard. As soon as it's parsed, the dataframe with
+    the cheap columns is published so the first figures can be drawn, and then the columns of each NLP stage are
+    published as soon as the stage is done. They're put in the result store, and only their uris are published
+    (see read_partial)
+    :param job: the job this is running as
+    :param raw_text: the exported chat file's contents
+    :param columns: the columns that are needed, defaults to all of them
+    :param lang: language code, default is 'en'
+    :return: the parsed data, with the dataframe and every column rather than its uri
+    """
+    parser = Parser()
+    parser.parse(raw_text)
+
+    chat = ChatFrame(parser.parsed_df)
+    df = chat.df
+    compute_columns(df, inline_columns(columns, df.columns), lang)
+    chat.compact()
+    stages = stages_for(columns, df.columns)
+    parsed = {
+        "participants": chat.participants,
+        "media_count_map": dict(parser.media_count_map),
+    }
+    # Every partial result of the job is named after the same id
+    oid = ObjectId()
+    job.publish(
+        **{
+            PARSED: dict(
+                parsed, **{PARSED_URI: __store_partial(oid, "parsed", df)}
+            ),
+            STAGES: [stage.name for stage in stages],
+            TIMINGS: {},
+            COLUMNS: {},
+        }
+    )
+    job.check()
+
+    timings = {}
+    completed_columns = {}
+
+    def on_stage_complete(timing: StageTiming):
+        for stage in stages:
+            if stage.name == timing.name:
+                completed_columns[stage.name] = __store_partial(
+                    oid,
+                    stage.name,
+                    pd.DataFrame(
+                        {column: df[column] for column in stage.outputs}
+                    ),
+                )
+        timings[timing.name] = timing._asdict()
+        job.publish(
+            **{TIMINGS: dict(timings), COLUMNS: dict(completed_columns)}
+        )
+
+    # The stages are stopped as soon as the job is cancelled or runs out of time, rather than when one completes
+    compute_columns(
+        df, columns, lang, callback=on_stage_complete, check=job.check
+    )
+    chat.compact()
+    return dict(parsed, df=df)
+
+
+def read_partial(uri: str):
+    """A partial result whose uri the job published, i.e. the parsed dataframe or the columns of a stage"""
+    return pickle.loads(get_result_store(uri).read(uri))
+
+
+def delete_partials(meta: Dict):
+    """
+    Deletes the partial results the job published once they've been collected. The ones that never are (i.e. when
+    the job fails or the session expires) are named after a result without an entry, so the sweeper deletes them
+    """
+    uris = list(meta.get(COLUMNS, {}).values())
+    if meta.get(PARSED):
+        uris.append(meta[PARSED][PARSED_URI])
+    for uri in uris:
+        get_result_store(uri).delete(uri)
+
+
+def __store_partial(oid: ObjectId, name: str, data) -> str:
+    # Next to the temporary results, the same way the parser saves them
+    data = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+    uri = "{}{}.{}.pkl".format(
+        Config.TEMP_BUCKET_PATH or Config.LOCAL_RESULT_PATH, oid, name
+    )
+    try:
+        get_result_store(uri).write(uri, data)
+    except NoCredentialsError:
+        uri = "{}{}.{}.pkl".format(Config.LOCAL_RESULT_PATH, oid, name)
+        get_result_store(uri).write(uri, data)
+    return uri
@@ -0,0 +1,321 @@
+"""Where processed results are stored: an S3 bucket, the local filesystem, or memory (i.e. for tests). The store of a
+result is picked by the scheme of its uri, and stores are shared by the whole process, so that the bucket's client
+and its pool of connections are reused by every read and write rather than created for each one"""
+import io
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config as BotocoreConfig
+
+from config import Config
+from services.circuit_breaker import storage_breaker
+
+S3_SCHEME = "s3://"
+MEMORY_SCHEME = "memory://"
+# Results bigger than this are uploaded and downloaded in parts of this size, several at a time
+MULTIPART_CHUNK_SIZE = 8 * 1024 * 1024
+# The most prefetched results that are kept around without being read
+MAX_PREFETCHED = 8
+# The most objects S3 deletes in a single request
+MAX_S3_DELETES = 1000
+
+# What's listed for each stored object, its modification time is a timestamp
+StoredObject = namedtuple("StoredObject", ["uri", "size", "modified_at"])
+
+__stores = {}
+__stores_lock = threading.Lock()
+__s3_client = (None, None)
+__s3_client_lock = threading.Lock()
+__prefetcher = None
+
+
+class ResultStore(ABC):
+    """
+    The interface of every store. Results are written whole, and read whole or by byte range. A result that's
+    about to be needed can be prefetched, so that it's read in the background while something else is done
+    """
+
+    def __init__(self):
+        self.__prefetched = OrderedDict()
+        self.__prefetched_lock = threading.Lock()
+
+    @abstractmethod
+    def write(self, uri: str, data: bytes):
+        pass
+
+    @abstractmethod
+    def read(self, uri: str, byte_range: Tuple[int, int] = None) -> bytes:
+        """
+        :param byte_range: the first and last byte to read, both included (like an HTTP range). The whole result
+        by default
+        """
+
+    @abstractmethod
+    def delete(self, uri: str):
+        pass
+
+    def delete_many(self, uris: List[str]):
+        for uri in uris:
+            self.delete(uri)
+
+    @abstractmethod
+    def list_objects(self, prefix: str) -> Iterator[StoredObject]:
+        """Every object whose uri starts with the prefix, listed lazily"""
+
+    def prefetch(self, uri: str):
+        """Starts reading a whole result in the background, for the next fetch() of it"""
+        with self.__prefetched_lock:
+            if uri in self.__prefetched:
+                return
+            self.__prefetched[uri] = get_prefetcher().submit(self.read, uri)
+            while len(self.__prefetched) > MAX_PREFETCHED:
+                self.__prefetched.popitem(last=False)
+
+    def fetch(self, uri: str) -> io.BytesIO:
+        """
+        Reads a whole result, waiting for its prefetch if it's been started. A failed prefetch is read again, so
+        that its error is raised here
+        """
+        with self.__prefetched_lock:
+            future = self.__prefetched.pop(uri, None)
+        if future is not None:
+            try:
+                return io.BytesIO(future.result())
+            except Exception:
+                pass
+        return io.BytesIO(self.read(uri))
+
+
+class MemoryResultStore(ResultStore):
+    """Keeps results in a dict, for tests and for running without a bucket or a writable disk"""
+
+    def __init__(self):
+        super().__init__()
+        self.__results = {}
+        self.__lock = threading.Lock()
+
+    def write(self, uri: str, data: bytes):
+        with self.__lock:
+            self.__results[uri] = (bytes(data), time.time())
+
+    def read(self, uri: str, byte_range: Tuple[int, int] = None) -> bytes:
+        with self.__lock:
+            if uri not in self.__results:
+                raise FileNotFoundError(uri)
+            data, _ = self.__results[uri]
+        if byte_range is None:
+            return data
+        return data[byte_range[0] : byte_range[1] + 1]
+
+    def delete(self, uri: str):
+        with self.__lock:
+            self.__results.pop(uri, None)
+
+    def list_objects(self, prefix: str) -> Iterator[StoredObject]:
+        with self.__lock:
+            results = list(self.__results.items())
+        for uri, (data, modified_at) in results:
+            if uri.startswith(prefix):
+                yield StoredObject(uri, len(data), modified_at)
+
+
+class FileResultStore(ResultStore):
+    """Keeps results on the local filesystem, i.e. when the bucket isn't configured"""
+
+    def write(self, uri: str, data: bytes):
+        # Results are written to a temporary file first, so that they're never read half written
+        directory = os.path.dirname(uri)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = "{}.{}.part".format(uri, threading.get_ident())
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, uri)
+
+    def read(self, uri: str, byte_range: Tuple[int, int] = None) -> bytes:
+        with open(uri, "rb") as f:
+            if byte_range is None:
+                return f.read()
+            f.seek(byte_range[0])
+            return f.read(byte_range[1] - byte_range[0] + 1)
+
+    def delete(self, uri: str):
+        try:
+            os.remove(uri)
+        except FileNotFoundError:
+            pass
+
+    def list_objects(self, prefix: str) -> Iterator[StoredObject]:
+        directory, name_prefix = os.path.split(prefix)
+        try:
+            entries = os.scandir(directory or ".")
+        except FileNotFoundError:
+            return
+        with entries:
+            for entry in entries:
+                if entry.name.startswith(name_prefix) and entry.is_file():
+                    stat = entry.stat()
+                    yield StoredObject(
+                        os.path.join(directory, entry.name),
+                        stat.st_size,
+                        stat.st_mtime,
+                    )
+
+
+class S3ResultStore(ResultStore):
+    """
+    Keeps results in an S3 bucket. Big results are transferred in parts, several at a time, and ranged reads only
+    download the bytes they need. Calls fail fast while the bucket is unavailable, by raising a
+    ServiceUnavailableError
+    """
+
+    def __init__(self, client=None, transfer_config: TransferConfig = None):
+        """
+        :param client: the S3 client to use, the process' shared one by default
+        :param transfer_config: how multipart transfers are split up and how many parts are sent at a time
+        """
+        super().__init__()
+        self.__client = client
+        self.transfer_config = transfer_config or TransferConfig(
+            multipart_threshold=MULTIPART_CHUNK_SIZE,
+            multipart_chunksize=MULTIPART_CHUNK_SIZE,
+            max_concurrency=Config.RESULT_STORE_CONCURRENCY,
+        )
+
+    @property
+    def client(self):
+        return self.__client or get_s3_client()
+
+    def write(self, uri: str, data: bytes):
+        bucket, key = self.__split(uri)
+        storage_breaker.call(
+            self.client.upload_fileobj,
+            io.BytesIO(data),
+            bucket,
+            key,
+            Config=self.transfer_config,
+        )
+
+    def read(self, uri: str, byte_range: Tuple[int, int] = None) -> bytes:
+        bucket, key = self.__split(uri)
+        if byte_range is not None:
+            return storage_breaker.call(
+                lambda: self.client.get_object(
+                    Bucket=bucket,
+                    Key=key,
+                    Range="bytes={}-{}".format(*byte_range),
+                )["Body"].read()
+            )
+        buffer = io.BytesIO()
+        storage_breaker.call(
+            self.client.download_fileobj,
+            bucket,
+            key,
+            buffer,
+            Config=self.transfer_config,
+        )
+        return buffer.getvalue()
+
+    def delete(self, uri: str):
+        bucket, key = self.__split(uri)
+        storage_breaker.call(self.client.delete_object, Bucket=bucket, Key=key)
+
+    def delete_many(self, uris: List[str]):
+        # Objects are deleted a thousand at a time, per bucket
+        by_bucket = {}
+        for uri in uris:
+            bucket, key = self.__split(uri)
+            by_bucket.setdefault(bucket, []).append({"Key": key})
+        for bucket, objects in by_bucket.items():
+            for start in range(0, len(objects), MAX_S3_DELETES):
+                storage_breaker.call(
+                    self.client.delete_objects,
+                    Bucket=bucket,
+                    Delete={
+                        "Objects": objects[start : start + MAX_S3_DELETES],
+                        "Quiet": True,
+                    },
+                )
+
+    def list_objects(self, prefix: str) -> Iterator[StoredObject]:
+        bucket, key_prefix = self.__split(prefix)
+        kwargs = dict(Bucket=bucket, Prefix=key_prefix)
+        while True:
+            page = storage_breaker.call(self.client.list_objects_v2, **kwargs)
+            for item in page.get("Contents", []):
+                yield StoredObject(
+                    S3_SCHEME + bucket + "/" + item["Key"],
+                    item["Size"],
+                    item["LastModified"].timestamp(),
+                )
+            if not page.get("IsTruncated"):
+                return
+            kwargs["ContinuationToken"] = page["NextContinuationToken"]
+
+    @staticmethod
+    def __split(uri: str) -> Tuple[str, str]:
+        bucket, _, key = uri[len(S3_SCHEME) :].partition("/")
+        return bucket, key
+
+
+def get_result_store(uri: Optional[str]) -> ResultStore:
+    """
+    The store that a result's uri is in, which is created on first use and shared by every request handled by
+    this process
+    """
+    if uri and uri.startswith(S3_SCHEME):
+        store_class = S3ResultStore
+    elif uri and uri.startswith(MEMORY_SCHEME):
+        store_class = MemoryResultStore
+    else:
+        store_class = FileResultStore
+    with __stores_lock:
+        if store_class not in __stores:
+            __stores[store_class] = store_class()
+        return __stores[store_class]
+
+
+def get_s3_client():
+    """
+    The S3 client of this process, with a pool of connections shared by all of its threads. Clients can't be
+    shared with forked processes, so a forked process creates its own. Calls time out after STORAGE_TIMEOUT, and
+    are retried once
+    """
+    global __s3_client
+    with __s3_client_lock:
+        pid, client = __s3_client
+        if pid != os.getpid():
+            session = boto3.session.Session(
+                aws_access_key_id=Config.AWS_ACCESS_KEY_ID,
+                aws_secret_access_key=Config.AWS_SECRET_ACCESS_KEY,
+            )
+            client = session.client(
+                "s3",
+                config=BotocoreConfig(
+                    max_pool_connections=Config.RESULT_STORE_CONNECTIONS,
+                    connect_timeout=Config.STORAGE_TIMEOUT,
+                    read_timeout=Config.STORAGE_TIMEOUT,
+                    retries={"max_attempts": 1},
+                ),
+            )
+            __s3_client = (os.getpid(), client)
+        return client
+
+
+def get_prefetcher() -> ThreadPoolExecutor:
+    """The threads that prefetch results, shared by every store"""
+    global __prefetcher
+    with __stores_lock:
+        if __prefetcher is None:
+            __prefetcher = ThreadPoolExecutor(
+                max_workers=Config.RESULT_STORE_CONCURRENCY,
+                thread_name_prefix="banterly-prefetch",
+            )
+        return __prefetcher
@@ -0,0 +1,227 @@
+"""Deletes the stored objects of temporary results once their entries have expired (which their TTL index does), and
+of results that never got an entry at all. Objects are looked up and deleted in batches, and what's been reclaimed is
+kept as metrics"""
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Set
+
+from bson.objectid import ObjectId
+
+from config import Config
+from services import processed_data_service
+from services.circuit_breaker import ServiceUnavailableError
+from services.result_store import ResultStore, StoredObject, get_result_store
+
+logger = logging.getLogger(__name__)
+
+# The sweeper's metrics, totals over every sweep and the figures of the last one
+RUNS = "runs"
+DELETED_OBJECTS = "deleted_objects"
+RECLAIMED_BYTES = "reclaimed_bytes"
+DURATION = "duration"
+FINISHED_AT = "finished_at"
+ERROR = "error"
+LAST_RUN = "last_run"
+# Objects left behind by a write that never finished
+PARTIAL_SUFFIX = ".part"
+
+__sweeper = None
+__sweeper_lock = threading.Lock()
+
+
+class ResultSweeper:
+    """Sweeps the places temporary results are stored, on a background thread once it's started"""
+
+    def __init__(
+        self,
+        prefixes: List[str] = None,
+        batch_size: int = Config.SWEEP_BATCH_SIZE,
+        grace_period: float = Config.SWEEP_GRACE_PERIOD,
+    ):
+        """
+        :param prefixes: the uri prefixes of temporary results, the local and temporary bucket paths by default.
+        Research results are never swept
+        :param batch_size: how many objects are looked up and deleted at a time
+        :param grace_period: seconds since an object was written before it can be swept, so that results that are
+        being written (and don't have an entry yet) are left alone
+        """
+        self.prefixes = (
+            prefixes if prefixes is not None else temporary_prefixes()
+        )
+        self.batch_size = batch_size
+        self.grace_period = grace_period
+        self.__metrics = {
+            RUNS: 0,
+            DELETED_OBJECTS: 0,
+            RECLAIMED_BYTES: 0,
+            LAST_RUN: None,
+        }
+        self.__listeners = []
+        self.__lock = threading.Lock()
+        self.__stopped = threading.Event()
+        self.__thread = None
+
+    def add_listener(self, listener: Callable[[Set[ObjectId]], None]):
+        """
+        Calls listener with the ids of the results whose objects were deleted, after each batch (i.e. to forget the
+        results this process is holding on to)
+        """
+        with self.__lock:
+            self.__listeners.append(listener)
+
+    def sweep(self) -> Dict:
+        """
+        Sweeps every prefix once. A sweep stops early if the DB or the bucket is unavailable
+        :return: the figures of the sweep
+        """
+        started_at = time.time()
+        run = {DELETED_OBJECTS: 0, RECLAIMED_BYTES: 0, ERROR: None}
+        try:
+            for prefix in self.prefixes:
+                store = get_result_store(prefix)
+                batch = []
+                for stored in store.list_objects(prefix):
+                    if started_at - stored.modified_at < self.grace_period:
+                        continue
+                    batch.append(stored)
+                    if len(batch) == self.batch_size:
+                        self.__notify(self.__sweep_batch(store, batch, run))
+                        batch = []
+                if batch:
+                    self.__notify(self.__sweep_batch(store, batch, run))
+        except ServiceUnavailableError as e:
+            run[ERROR] = str(e)
+            logger.warning("sweep stopped early: %s", e)
+        run[DURATION] = time.time() - started_at
+        run[FINISHED_AT] = time.time()
+
+        with self.__lock:
+            self.__metrics[RUNS] += 1
+            self.__metrics[DELETED_OBJECTS] += run[DELETED_OBJECTS]
+            self.__metrics[RECLAIMED_BYTES] += run[RECLAIMED_BYTES]
+            self.__metrics[LAST_RUN] = run
+        logger.info(
+            "swept %d objects (%d bytes) in %.3fs",
+            run[DELETED_OBJECTS],
+            run[RECLAIMED_BYTES],
+            run[DURATION],
+        )
+        return run
+
+    def metrics(self) -> Dict:
+        with self.__lock:
+            return dict(self.__metrics)
+
+    def start(self, interval: float = Config.SWEEP_INTERVAL):
+        """Sweeps straight away and then every interval seconds, on a daemon thread"""
+        with self.__lock:
+            if self.__thread is not None:
+                return
+            self.__thread = threading.Thread(
+                target=self.run,
+                args=(interval,),
+                name="banterly-sweeper",
+                daemon=True,
+            )
+        self.__thread.start()
+
+    def stop(self):
+        self.__stopped.set()
+
+    def run(self, interval: float = Config.SWEEP_INTERVAL):
+        """Sweeps straight away and then every interval seconds, until it's stopped"""
+        has_indexes = False
+        while True:
+            # The TTL index is what expires the entries, so it's created first (once the DB is available)
+            if not has_indexes:
+                try:
+                    processed_data_service.create_indexes()
+                    has_indexes = True
+                except ServiceUnavailableError as e:
+                    logger.warning("couldn't create the TTL index: %s", e)
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception("sweep failed")
+            try:
+                processed_data_service.save_sweeper_metrics(self.metrics())
+            except ServiceUnavailableError as e:
+                logger.warning("couldn't save the sweeper's metrics: %s", e)
+            if self.__stopped.wait(interval):
+                return
+
+    def __notify(self, oids: Set[ObjectId]):
+        if not oids:
+            return
+        with self.__lock:
+            listeners = list(self.__listeners)
+        for listener in listeners:
+            try:
+                listener(oids)
+            except Exception:
+                logger.exception("sweep listener failed")
+
+    @staticmethod
+    def __sweep_batch(
+        store: ResultStore, batch: List[StoredObject], run: Dict
+    ) -> Set[ObjectId]:
+        oids = {stored.uri: result_oid(stored.uri) for stored in batch}
+        existing = processed_data_service.get_existing_oids(
+            {oid for oid in oids.values() if oid is not None}
+        )
+        # Objects that aren't named after a result are never deleted
+        orphans = [
+            stored
+            for stored in batch
+            if oids[stored.uri] is not None
+            and (
+                oids[stored.uri] not in existing
+                or stored.uri.endswith(PARTIAL_SUFFIX)
+            )
+        ]
+        if orphans:
+            store.delete_many([stored.uri for stored in orphans])
+        run[DELETED_OBJECTS] += len(orphans)
+        run[RECLAIMED_BYTES] += sum(stored.size for stored in orphans)
+        return {oids[stored.uri] for stored in orphans}
+
+
+def result_oid(uri: str) -> Optional[ObjectId]:
+    """
+    The id of the result an object belongs to, which is what its name starts with (i.e. <id>.csv, or
+    <id>.<table>.csv for the tables stored next to it)
+    :return: None if it isn't named after a result
+    """
+    name = os.path.basename(uri).split(".")[0]
+    return ObjectId(name) if ObjectId.is_valid(name) else None
+
+
+def temporary_prefixes() -> List[str]:
+    prefixes = [Config.LOCAL_RESULT_PATH]
+    if (
+        Config.TEMP_BUCKET_PATH
+        and Config.TEMP_BUCKET_PATH != Config.PERMANENT_BUCKET_PATH
+    ):
+        prefixes.append(Config.TEMP_BUCKET_PATH)
+    return prefixes
+
+
+def get_result_sweeper() -> ResultSweeper:
+    """
+    The sweeper of this process, created on first use. Only one process sweeps, see __main__ below
+    """
+    global __sweeper
+    with __sweeper_lock:
+        if __sweeper is None:
+            __sweeper = ResultSweeper()
+    return __sweeper
+
+
+if __name__ == "__main__":
+    # A single sweeper is run next to the app, rather than one by each of its workers
+    if not Config.SWEEP_INTERVAL:
+        raise SystemExit("SWEEP_INTERVAL needs to be set")
+    logging.basicConfig(level=logging.INFO)
+    get_result_sweeper().run(Config.SWEEP_INTERVAL)
@@ -0,0 +1,136 @@
+"""The server side state of every user's session, so that concurrent uploads don't overwrite each other. Sessions
+are kept in memory, and the least recently used ones are evicted once there are too many of them, they hold too
+much memory or they've been idle for too long"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional
+
+from config import Config
+from datautils.Parser import Parser
+from graphs.Graph import Graph
+
+__store = None
+__store_lock = threading.Lock()
+
+
+class Session:
+    """
+    Everything a single user's upload needs between callbacks: the Graph of the processed chat and the Parser that
+    saves it. Callbacks that change it should hold its lock
+    """
+
+    def __init__(self, session_id: str):
+        self.id = session_id
+        self.graph = Graph()
+        self.parser = Parser()
+        # The participants and media counts as they were parsed, which the customization's aliases are applied to
+        self.parsed_participants = []
+        self.parsed_media_count = {}
+        # The uris of the partial results of the processing job that have already been added to the chat
+        self.collected_partials = set()
+        # Whether the upload has been fully processed, and the uid it was saved under for research (once it has
+        # been)
+        self.is_processed = False
+        self.research_uid = None
+        self.lock = threading.RLock()
+        self.last_used = time.time()
+        self.__memory_usage = (None, 0)
+
+    def memory_usage(self) -> int:
+        """
+        The number of bytes used by the session's chat. It's only measured again once columns have been added
+        """
+        chat = self.graph.chat
+        if chat is None:
+            return 0
+        key = (id(chat), len(chat.df.columns))
+        if self.__memory_usage[0] != key:
+            self.__memory_usage = (key, chat.memory_usage())
+        return self.__memory_usage[1]
+
+
+class SessionStore:
+    """An in-process LRU of sessions, bounded by their number, memory and idle time"""
+
+    def __init__(
+        self,
+        max_sessions: int = Config.SESSION_LIMIT,
+        max_memory: int = Config.SESSION_MEMORY_LIMIT,
+        ttl: float = Config.SESSION_TTL,
+    ):
+        """
+        :param max_sessions: the most sessions kept at the same time
+        :param max_memory: the most bytes the sessions' chats can use together
+        :param ttl: seconds after which an idle session is evicted
+        """
+        self.max_sessions = max_sessions
+        self.max_memory = max_memory
+        self.ttl = ttl
+        self.__sessions = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def create(self) -> Session:
+        """Starts a new session, evicting the least recently used ones if needed to make room for it"""
+        session = Session(uuid.uuid4().hex)
+        with self.__lock:
+            self.__sessions[session.id] = session
+            self.__evict(keep=session.id)
+        return session
+
+    def get(self, session_id: Optional[str]) -> Optional[Session]:
+        """
+        :return: the session, or None if there's no such session or it's been evicted
+        """
+        with self.__lock:
+            session = self.__sessions.get(session_id)
+            if session is None:
+                return None
+            session.last_used = time.time()
+            self.__sessions.move_to_end(session_id)
+            self.__evict(keep=session_id)
+        return session
+
+    def release(self, session_id: Optional[str]):
+        """Drops a session that's no longer needed, i.e. once another chat is uploaded in its place"""
+        with self.__lock:
+            self.__sessions.pop(session_id, None)
+
+    def memory_usage(self) -> int:
+        with self.__lock:
+            return sum(
+                session.memory_usage() for session in self.__sessions.values()
+            )
+
+    def __len__(self) -> int:
+        return len(self.__sessions)
+
+    def __evict(self, keep: str):
+        # The session in use is never evicted, even if it's over the memory limit on its own
+        now = time.time()
+        for session_id, session in list(self.__sessions.items()):
+            if session_id != keep and now - session.last_used > self.ttl:
+                del self.__sessions[session_id]
+
+        memory = sum(
+            session.memory_usage() for session in self.__sessions.values()
+        )
+        for session_id in list(self.__sessions):
+            if len(self.__sessions) <= self.max_sessions and (
+                memory <= self.max_memory
+            ):
+                break
+            if session_id != keep:
+                memory -= self.__sessions.pop(session_id).memory_usage()
+
+
+def get_session_store() -> SessionStore:
+    """
+    The store is shared by every request handled by this process, and created on first use
+    """
+    global __store
+    with __store_lock:
+        if __store is None:
+            __store = SessionStore()
+    return __store
@@ -0,0 +1,108 @@
+"""Writes results to the bucket and the DB in the background, so that share links can be handed out straight away.
+The id of a result is reserved as soon as it's submitted, and the share page waits for it to be written"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+
+from bson.objectid import ObjectId
+
+from config import Config
+from datautils.Parser import Parser
+from services import processed_data_service
+from services.circuit_breaker import ServiceUnavailableError
+
+logger = logging.getLogger(__name__)
+
+__writer = None
+__writer_lock = threading.Lock()
+
+
+class ShareWriter:
+    """Saves parsers on a small thread pool, retrying failed writes with an exponential backoff"""
+
+    def __init__(
+        self,
+        workers: int = Config.SHARE_WRITER_WORKERS,
+        retries: int = Config.SHARE_WRITE_RETRIES,
+        backoff: float = 1.0,
+    ):
+        """
+        :param workers: how many results are written at the same time
+        :param retries: how many more times a failed write is attempted
+        :param backoff: seconds to wait before the first retry, doubled before every other one
+        """
+        self.retries = retries
+        self.backoff = backoff
+        self.__executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="banterly-share"
+        )
+
+    def submit(
+        self,
+        parser: Parser,
+        sender_color_map: Dict,
+        is_permanent: bool = False,
+        word_cloud_layout: Dict = None,
+        topic_graph_layout: Dict = None,
+    ) -> str:
+        """
+        Reserves an id for the parser's result and writes it in the background. What the parser holds is copied
+        first, so it can keep changing
+        :return: the id the result will be saved under
+        :raises ServiceUnavailableError: if the DB is unavailable, in which case nothing is written
+        """
+        oid = ObjectId()
+        processed_data_service.create_pending_entry(oid, is_permanent)
+        self.__executor.submit(
+            self.__write,
+            oid,
+            parser.snapshot(),
+            sender_color_map,
+            is_permanent,
+            word_cloud_layout,
+            topic_graph_layout,
+        )
+        return str(oid)
+
+    def __write(self, oid: ObjectId, parser: Parser, *args):
+        for attempt in range(self.retries + 1):
+            started_at = time.time()
+            try:
+                parser.save_data(*args, oid=oid)
+                logger.info(
+                    "result %s written in %.3fs", oid, time.time() - started_at
+                )
+                return
+            except Exception:
+                if attempt == self.retries:
+                    logger.exception(
+                        "result %s couldn't be written after %d attempts",
+                        oid,
+                        attempt + 1,
+                    )
+                    try:
+                        processed_data_service.fail_processed_data_entry(oid)
+                    except ServiceUnavailableError:
+                        pass
+                    return
+                logger.warning(
+                    "writing result %s failed, retrying (attempt %d of %d)",
+                    oid,
+                    attempt + 1,
+                    self.retries + 1,
+                    exc_info=True,
+                )
+                time.sleep(self.backoff * 2 ** attempt)
+
+
+def get_share_writer() -> ShareWriter:
+    """
+    The writer is shared by every request handled by this process, and created on first use
+    """
+    global __writer
+    with __writer_lock:
+        if __writer is None:
+            __writer = ShareWriter()
+    return __writer
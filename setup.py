@@ -5,6 +5,8 @@ import nltk
 
 from app import db
 from constants.database_keys import TYPE, COUNT, LAST_UPDATED
+from datautils.resources import ensure_bundle
+from services.processed_data_service import create_indexes
 
 # Download additional NLTK Data
 nltk.download("punkt")
@@ -12,6 +14,9 @@ nltk.download("stopwords")
 nltk.download("wordnet")
 nltk.download("vader_lexicon")
 
+# Compile the stop words, lexicons and lemmas the processing loads
+ensure_bundle()
+
 # Create the counters in the DB
 counters = db.counters
 if not counters.find_one({TYPE: "chats"}):
@@ -21,3 +26,6 @@ if not counters.find_one({TYPE: "chats"}):
             {TYPE: "messages", COUNT: 0, LAST_UPDATED: datetime.now()},
         ]
     )
+
+# Expire the temporary results
+create_indexes()
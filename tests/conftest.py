@@ -0,0 +1,39 @@
+import pandas as pd
+import pytest
+
+from constants.column_names import RAW_TEXT, SENDER, TIMESTAMP
+from datautils.chat_frame import ChatFrame
+
+
+@pytest.fixture
+def make_chat():
+    """
+    Builds a chat from the timestamps and senders of its messages, with empty messages unless their texts are
+    passed in along with the other columns
+    """
+
+    def make(timestamps, senders, columns=None):
+        df = pd.DataFrame(
+            {
+                TIMESTAMP: pd.to_datetime(timestamps),
+                SENDER: senders,
+                RAW_TEXT: [""] * len(senders),
+            }
+        )
+        for column, values in (columns or {}).items():
+            df[column] = values
+        return ChatFrame(df)
+
+    return make
+
+
+@pytest.fixture
+def make_graph(make_chat):
+    """The same as make_chat, with the chat wrapped in a graph"""
+    # Only imported by the tests that need it, since it loads the NLP libraries
+    from graphs.Graph import Graph
+
+    def make(timestamps, senders, columns=None):
+        return Graph(make_chat(timestamps, senders, columns))
+
+    return make
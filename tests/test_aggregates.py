@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from constants.column_names import RAW_TEXT, SENTIMENT_SCORE, WORD_COUNT
+from datautils.aggregates import (
+    DAILY,
+    MESSAGES,
+    MONTHLY,
+    WEEKLY,
+    WORDS,
+    ChatCube,
+)
+
+
+@pytest.fixture
+def chat(make_chat):
+    return make_chat(
+        [
+            "2020-01-30 10:15",  # Thursday
+            "2020-01-30 10:45",
+            "2020-01-31 23:00",
+            "2020-02-03 10:00",  # Monday
+        ],
+        ["Laila", "Laila", "Amir", "Laila"],
+        {
+            RAW_TEXT: ["hi", "how are you", "good", "so"],
+            WORD_COUNT: [1, 3, 1, 1],
+        },
+    )
+
+
+def test_cube_daily_slices(chat):
+    cube = ChatCube(chat)
+    daily = cube.over_time(MESSAGES)
+    assert list(daily.index) == list(pd.date_range("2020-01-30", "2020-02-03"))
+    assert list(daily["Laila"]) == [2, 0, 0, 0, 1]
+    assert list(daily["Amir"]) == [0, 1, 0, 0, 0]
+    assert cube.totals(WORDS) == {"Laila": 5, "Amir": 1}
+
+    heat_map = cube.heat_map()
+    assert heat_map.shape == (24, 7)
+    assert heat_map[10, 3] == 2 and heat_map[23, 4] == 1
+    assert heat_map[10, 0] == 1 and heat_map.sum() == 4
+
+    assert list(cube.word_histogram[0]) == [0, 2, 0, 1]
+
+
+def test_cube_rollups(chat):
+    cube = ChatCube(chat)
+    weekly = cube.over_time(MESSAGES, WEEKLY)
+    assert list(weekly.index) == list(
+        pd.to_datetime(["2020-01-27", "2020-02-03"])
+    )
+    assert list(weekly["Laila"]) == [2, 1]
+    monthly = cube.over_time(WORDS, MONTHLY)
+    assert list(monthly.index) == list(
+        pd.to_datetime(["2020-01-01", "2020-02-01"])
+    )
+    assert list(monthly["Laila"]) == [4, 1]
+
+
+def test_cube_adds_sentiment_later(chat):
+    cube = ChatCube(chat)
+    chat.add_columns({SENTIMENT_SCORE: pd.Series([0.5, -0.1, 0.25, np.nan])})
+    cube.update()
+    sentiment = cube.sentiment_over_time()
+    assert np.isclose(sentiment["Laila"].iloc[0], 0.2)
+    assert np.isclose(sentiment["Amir"].iloc[1], 0.25)
+    assert np.isnan(sentiment["Laila"].iloc[-1])
+
+
+def test_cube_resolution_and_range(chat):
+    cube = ChatCube(chat)
+    assert cube.resolution() == DAILY
+    assert cube.resolution(max_points=2) == WEEKLY
+    assert (
+        cube.resolution(
+            pd.Timestamp("2020-01-01"), pd.Timestamp("2021-12-31"), 50
+        )
+        == MONTHLY
+    )
+
+    daily = cube.over_time(
+        MESSAGES, DAILY, pd.Timestamp("2020-01-31"), pd.Timestamp("2020-02-01")
+    )
+    assert list(daily.index) == list(
+        pd.to_datetime(["2020-01-31", "2020-02-01"])
+    )
+    # Periods that started before the range but overlap it are included
+    weekly = cube.over_time(MESSAGES, WEEKLY, pd.Timestamp("2020-02-01"))
+    assert list(weekly["Laila"]) == [2, 1]
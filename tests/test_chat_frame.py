@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from constants.column_names import (
+    HOUR,
+    RAW_TEXT,
+    SENTIMENT_LABEL,
+    SENTIMENT_SCORE,
+)
+
+
+@pytest.fixture
+def chat(make_chat):
+    return make_chat(
+        ["2020-01-01 10:00", "2020-01-01 11:00", "2020-01-02 09:30"],
+        ["Laila", "Amir", "Laila"],
+        {RAW_TEXT: ["hi", "hey there", "yo"]},
+    )
+
+
+def test_chat_frame_groups(chat):
+    assert chat.participants == ["Laila", "Amir"]
+    assert [list(p) for p in chat.groups.values()] == [[0, 2], [1]]
+    assert dict(
+        (name, list(texts)) for name, texts in chat.by_participant(RAW_TEXT)
+    ) == {"Laila": ["hi", "yo"], "Amir": ["hey there"]}
+    assert isinstance(chat.timestamps, pd.DatetimeIndex)
+
+
+def test_chat_frame_compacts_new_columns(chat):
+    assert chat.add_columns(
+        {
+            HOUR: pd.Series([10, 11, 9]),
+            SENTIMENT_SCORE: pd.Series([0.5, -0.1, 0.0]),
+            SENTIMENT_LABEL: pd.Series(["Positive", "Neutral", "Neutral"]),
+        }
+    )
+    assert chat.df[HOUR].dtype == np.int8
+    assert chat.df[SENTIMENT_SCORE].dtype == np.float32
+    assert isinstance(chat.df[SENTIMENT_LABEL].dtype, pd.CategoricalDtype)
+    assert not chat.add_columns({HOUR: pd.Series([0, 0, 0])})
+
+
+def test_chat_frame_rename_participants(chat):
+    chat.rename_participants({"Laila": "🦁"})
+    assert chat.participants == ["🦁", "Amir"]
+    assert list(chat.groups) == ["🦁", "Amir"]
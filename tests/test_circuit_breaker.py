@@ -0,0 +1,56 @@
+import time
+
+import pytest
+from pymongo.errors import ServerSelectionTimeoutError
+
+from services.circuit_breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    CircuitOpenError,
+    ServiceUnavailableError,
+)
+
+
+def test_circuit_opens_after_failures_and_fails_fast():
+    breaker = CircuitBreaker(
+        "db", (ServerSelectionTimeoutError,), max_failures=2, reset_timeout=0.1
+    )
+    calls = []
+
+    @breaker
+    def find(fail):
+        calls.append(fail)
+        if fail:
+            raise ServerSelectionTimeoutError("timed out")
+        return "found"
+
+    for _ in range(2):
+        with pytest.raises(ServiceUnavailableError):
+            find(True)
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        find(False)
+    assert len(calls) == 2
+
+    # A single call is let through once the circuit's been open for long enough
+    time.sleep(0.1)
+    assert breaker.state == HALF_OPEN
+    assert find(False) == "found"
+    assert breaker.state == CLOSED
+
+
+def test_other_errors_dont_open_the_circuit():
+    breaker = CircuitBreaker(
+        "db", (ServerSelectionTimeoutError,), max_failures=1
+    )
+
+    @breaker
+    def find():
+        raise KeyError("missing")
+
+    for _ in range(3):
+        with pytest.raises(KeyError):
+            find()
+    assert breaker.state == CLOSED
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from config import Config
+from constants.column_names import CONVERSATION
+from datautils.conversations import (
+    INITIATOR,
+    ConversationTable,
+    split_conversations,
+)
+
+
+@pytest.fixture
+def chat(make_chat):
+    timestamps = pd.to_datetime(
+        [
+            "2020-01-01 10:00",
+            "2020-01-01 10:02",
+            "2020-01-01 10:03",
+            "2020-01-01 10:13",
+            "2020-01-02 09:00",
+            "2020-01-02 09:30",
+        ]
+    )
+    return make_chat(
+        timestamps,
+        ["Laila", "Amir", "Amir", "Laila", "Amir", "Laila"],
+        {
+            CONVERSATION: split_conversations(
+                timestamps.values, Config.CONVERSATION_GAP
+            )
+        },
+    )
+
+
+def test_split_conversations():
+    timestamps = pd.to_datetime(
+        ["2020-01-01 10:00", "2020-01-01 10:59", "2020-01-01 12:00"]
+    ).values
+    assert list(split_conversations(timestamps, 3600)) == [0, 0, 1]
+    assert list(split_conversations(timestamps, 60)) == [0, 1, 2]
+    assert len(split_conversations(timestamps[:0], 60)) == 0
+
+
+def test_conversation_table(chat):
+    conversations = chat.conversations
+    assert chat.df[CONVERSATION].dtype == np.int32
+    assert len(conversations) == 2
+    assert list(conversations.message_counts()) == [4, 2]
+    assert list(conversations.durations()) == [13 * 60, 30 * 60]
+    # Laila started the first conversation and Amir the second
+    assert list(conversations.initiations(2)) == [1, 1]
+
+    # Amir replied once after 2 minutes (his second message isn't a reply), and Laila after 10 and 30 minutes
+    reply_times, replies = conversations.response_times(2)
+    assert list(replies) == [2, 1]
+    assert list(reply_times) == [20 * 60, 2 * 60]
+
+
+def test_conversation_table_round_trip(chat):
+    frame = chat.conversations.to_frame(chat.participants)
+    table = ConversationTable.from_frame(frame, chat.participants)
+    assert table.members.equals(chat.conversations.members)
+    assert list(table.conversations[INITIATOR]) == [0, 1]
+    assert (
+        table.conversations.values == chat.conversations.conversations.values
+    ).all()
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+
+from constants.column_names import EMOJIS, RAW_TEXT, SENDER, TIMESTAMP
+from datautils.chat_frame import ChatFrame
+from datautils.emojis import (
+    EMOJI_ID,
+    PARTICIPANT,
+    USES,
+    WORD_PATTERN,
+    EmojiTable,
+    find_emojis,
+)
+
+
+def test_find_emojis_matches_whole_graphemes():
+    message_ids, emojis = find_emojis(
+        ["hi 👍🏽", "no emojis", "", "👨‍👩‍👧 and 🇬🇧 1️⃣", "😂😂"]
+    )
+    assert list(message_ids) == [0, 3, 3, 3, 4, 4]
+    assert emojis == ["👍🏽", "👨‍👩‍👧", "🇬🇧", "1️⃣", "😂", "😂"]
+
+
+def test_word_pattern():
+    assert WORD_PATTERN.fullmatch("héllo")
+    assert WORD_PATTERN.fullmatch("👨‍👩‍👧😂")
+    assert not WORD_PATTERN.fullmatch("a1")
+
+
+def test_chat_frame_moves_emojis_to_table():
+    chat = ChatFrame(
+        pd.DataFrame(
+            {
+                TIMESTAMP: pd.to_datetime(
+                    ["2020-01-01", "2020-01-02", "2020-01-03"]
+                ),
+                SENDER: ["Laila", "Amir", "Laila"],
+                RAW_TEXT: ["", "", ""],
+                EMOJIS: [["😂", "👍🏽"], [], ["😂"]],
+            }
+        )
+    )
+    assert chat.df[EMOJIS].dtype == np.int16
+    assert list(chat.df[EMOJIS]) == [2, 0, 1]
+
+    top = chat.emojis.top_emojis(chat.participants, 1)
+    assert list(zip(top[PARTICIPANT], top[EMOJI_ID], top[USES])) == [
+        ("Laila", "😂", 2)
+    ]
+
+    codes = chat.df[SENDER].cat.codes.values
+    table = EmojiTable.from_frame(chat.emojis.to_frame(), codes)
+    assert list(table.emojis) == list(chat.emojis.emojis)
+    assert table.uses.equals(chat.emojis.uses)
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from constants.column_names import ENTITIES, SENDER
+from datautils.entities import ENTITY, MENTIONS, PARTICIPANT, EntityTable
+
+
+@pytest.fixture
+def chat(make_chat):
+    return make_chat(
+        ["2020-01-01", "2020-01-02", "2020-01-03", "2020-02-01"],
+        ["Laila", "Amir", "Laila", "Amir"],
+        {
+            ENTITIES: [
+                {"Paris": "Places", "Sami": "People"},
+                {"paris": "Places"},
+                {"Paris": "Places"},
+                {},
+            ]
+        },
+    )
+
+
+def test_chat_frame_moves_entities_to_table(chat):
+    assert chat.df[ENTITIES].dtype == np.int16
+    assert list(chat.df[ENTITIES]) == [2, 1, 1, 0]
+
+    entities = chat.entities
+    assert len(entities) == 4
+    assert sorted(entities.names) == ["Paris", "Sami"]
+    assert entities.names[np.argmax(entities.counts())] == "Paris"
+    weights = entities.weights()
+    paris = list(entities.names).index("Paris")
+    assert weights[0, paris] == 2 and weights[1, paris] == 1
+
+
+def test_entity_queries(chat):
+    top = chat.entities.top_entities(chat.participants, 1)
+    assert list(zip(top[PARTICIPANT], top[ENTITY], top[MENTIONS])) == [
+        ("Laila", "Paris", 2),
+        ("Amir", "Paris", 1),
+    ]
+    january = chat.entities_between(
+        pd.Timestamp("2020-01-02"), pd.Timestamp("2020-02-01")
+    )
+    assert len(january) == 2
+
+
+def test_entity_table_round_trip(chat):
+    frame = chat.entities.to_frame()
+    table = EntityTable.from_frame(frame, chat.df[SENDER].cat.codes.values)
+    assert list(table.names) == list(chat.entities.names)
+    assert table.mentions.equals(chat.entities.mentions)
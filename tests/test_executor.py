@@ -0,0 +1,92 @@
+import time
+
+import pandas as pd
+import pytest
+
+from datautils.executor import (
+    SharedTextColumn,
+    Stage,
+    read_shared_text,
+    run_stages,
+)
+
+
+def upper(columns, context):
+    return {"Upper": [text.upper() for text in columns["Text"]]}
+
+
+def length(columns, context):
+    return {
+        "Length": [len(text) + context["offset"] for text in columns["Upper"]]
+    }
+
+
+def first_letter(columns, context):
+    return {"First": columns["Text"].str[0].values}
+
+
+def slow(columns, context):
+    time.sleep(0.5)
+    return {"Slow": columns["Text"]}
+
+
+class Stop(Exception):
+    pass
+
+
+def test_shared_text_column():
+    values = ["hello", "", "👂🏽 emoji", "multi\nline"]
+    column = SharedTextColumn(values)
+    try:
+        assert read_shared_text(column.handle, 0, 4) == values
+        assert read_shared_text(column.handle, 1, 3) == values[1:3]
+    finally:
+        column.close()
+
+
+def test_run_stages():
+    df = pd.DataFrame({"Text": ["abc", "de", "f"] * 300})
+    completed = []
+    timings = run_stages(
+        df,
+        [
+            Stage("length", ("Upper",), ("Length",), length),
+            Stage("upper", ("Text",), ("Upper",), upper),
+            Stage(
+                "first", ("Text",), ("First",), first_letter, parallel=False
+            ),
+        ],
+        context={"offset": 1},
+        shared_columns=["Text"],
+        callback=lambda timing: completed.append(timing.name),
+    )
+
+    assert list(df["Upper"][:3]) == ["ABC", "DE", "F"]
+    assert list(df["Length"][:3]) == [4, 3, 2]
+    assert list(df["First"][:3]) == ["a", "d", "f"]
+    assert completed.index("upper") < completed.index("length")
+    assert [t.name for t in timings] == completed
+
+
+def test_run_stages_missing_input():
+    with pytest.raises(ValueError):
+        run_stages(
+            pd.DataFrame({"Text": ["a"]}),
+            [Stage("length", ("Upper",), ("Length",), length)],
+        )
+
+
+def test_run_stages_is_stopped_by_check():
+    df = pd.DataFrame({"Text": ["abc"] * 10000})
+    deadline = time.time() + 0.3
+
+    def check():
+        if time.time() > deadline:
+            raise Stop()
+
+    with pytest.raises(Stop):
+        run_stages(
+            df, [Stage("slow", ("Text",), ("Slow",), slow)], check=check
+        )
+    assert time.time() - deadline < 0.5
+    assert "Slow" not in df.columns
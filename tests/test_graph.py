@@ -0,0 +1,199 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from constants.column_names import (
+    CLEANED_TEXT,
+    ENTITIES,
+    EMOTION_LABEL,
+    PROFANITY_LABEL,
+    PROFANITY_SCORE,
+    RAW_TEXT,
+    SENTIMENT_LABEL,
+    SENTIMENT_SCORE,
+)
+from constants.figures import EMOTION_TREE_MAP, PROFANITY_SUNBURST
+from constants.topic_labels import PARTICIPANTS_LABEL
+from graphs.Graph import cloud_size
+
+
+def chat_of(num_messages=1000):
+    """The timestamps, senders and columns of a chat of num_messages, for make_graph"""
+    return (
+        pd.date_range("2020-01-01", periods=num_messages, freq="min"),
+        ["Laila", "Amir"] * (num_messages // 2),
+        {
+            RAW_TEXT: [
+                "message {}".format(i % 100) for i in range(num_messages)
+            ],
+            EMOTION_LABEL: "joy",
+            SENTIMENT_LABEL: "Positive",
+            PROFANITY_LABEL: "Clean",
+            PROFANITY_SCORE: [i / num_messages for i in range(num_messages)],
+        },
+    )
+
+
+def test_hierarchy_size_is_bounded(make_graph):
+    g = make_graph(*chat_of())
+    tree_map = g.emotion_tree_map().data[0]
+    # The total, 2 participants, their emotion and sentiment, and 10 messages and a remainder for each
+    assert len(tree_map.ids) == 1 + 2 * 3 + 2 * 11
+    assert tree_map.values[0] == 1000
+    assert sorted(tree_map.values)[-1] == 1000
+
+
+def test_branch_messages(make_graph):
+    g = make_graph(*chat_of())
+    messages, total = g.branch_messages(EMOTION_TREE_MAP, ["Laila", "joy"], 3)
+    assert total == 500
+    assert len(messages) == 3
+    assert all(count == 10 for _, count in messages)
+
+    # Profane messages are ranked by their score rather than how often they're sent
+    messages, total = g.branch_messages(PROFANITY_SUNBURST, ["Amir"], 2)
+    assert total == 500
+    assert messages == [("message 99", 10), ("message 97", 10)]
+
+
+def test_time_series_resolution_follows_range(make_graph):
+    g = make_graph(*chat_of(2 * 24 * 60 * 500))
+    fig = g.daily_messages()
+    assert fig.data[0].type == "scattergl"
+    assert len(fig.data[0].x) <= 400
+    assert fig.layout.title.text.startswith("Number of Weekly")
+
+    fig = g.daily_messages(("2020-02-01", "2020-03-01"))
+    assert fig.layout.title.text.startswith("Number of Daily")
+    assert len(fig.data[0].x) == 30
+
+
+def test_word_cloud_layout_is_reused(make_graph):
+    g = make_graph(*chat_of())
+    g.add_columns(
+        {
+            CLEANED_TEXT: pd.Series(
+                [["message", str(i % 100)] for i in range(1000)]
+            )
+        }
+    )
+    first = g.word_cloud()
+    layout = g.word_cloud_layout
+
+    # A graph for the same chat (i.e. a shared analysis) reuses the stored layout rather than computing its own
+    shared = make_graph(*chat_of())
+    shared.add_columns({CLEANED_TEXT: g.df[CLEANED_TEXT]})
+    shared.word_cloud_layout = layout
+    assert shared.word_cloud().data[0].x == first.data[0].x
+    assert shared.word_cloud_layout is layout
+
+
+def test_cube_is_built_once_by_concurrent_figures(make_graph):
+    g = make_graph(*chat_of())
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        cubes = list(pool.map(lambda _: g.cube, range(8)))
+    assert all(cube is cubes[0] for cube in cubes)
+
+
+def test_cloud_size():
+    assert cloud_size(Counter({"a": 1})) == 1
+    assert cloud_size(Counter({str(i): 2 for i in range(100)})) == 100
+    assert cloud_size(Counter({str(i): 2 for i in range(10 ** 4)})) == 500
+
+
+def test_entities_named_after_participants_are_their_own_nodes(make_graph):
+    # Laila talks about Amir, and Amir about Paris
+    g = make_graph(*chat_of(4))
+    g.add_columns(
+        {
+            ENTITIES: pd.Series(
+                [{"Amir": "People"}, {"Paris": "Places"}, {}, {}]
+            )
+        }
+    )
+    fig = g.topic_graph()
+    positions = {
+        (trace.name, text.split("</b>")[0][3:]): (x, y)
+        for trace in fig.data[1:]
+        for text, x, y in zip(trace.text, trace.x, trace.y)
+    }
+    assert sorted(positions) == [
+        ("Participants", "Amir"),
+        ("Participants", "Laila"),
+        ("People", "Amir"),
+        ("Places", "Paris"),
+    ]
+    assert positions["Participants", "Amir"] != positions["People", "Amir"]
+
+    edges = fig.data[0]
+    drawn = {
+        frozenset([(edges.x[i], edges.y[i]), (edges.x[i + 1], edges.y[i + 1])])
+        for i in range(0, len(edges.x), 3)
+    }
+    assert drawn == {
+        frozenset(
+            [positions["Participants", "Laila"], positions["People", "Amir"]]
+        ),
+        frozenset(
+            [positions["Participants", "Amir"], positions["Places", "Paris"]]
+        ),
+    }
+
+
+def test_topic_graph_is_pruned_and_merged(make_graph):
+    g = make_graph(*chat_of(400))
+    g.add_columns(
+        {
+            ENTITIES: pd.Series(
+                [
+                    (
+                        {"Paris": "Places", "topic {}".format(i): "Things"}
+                        if i % 2
+                        else {"paris": "Places"}
+                        if i % 4 == 0
+                        else {}
+                    )
+                    for i in range(400)
+                ]
+            )
+        }
+    )
+    fig = g.topic_graph(max_topics=5)
+    places = next(trace for trace in fig.data if trace.name == "Places")
+    assert len(places.text) == 1 and "Paris" in places.text[0]
+    things = next(trace for trace in fig.data if trace.name == "Things")
+    assert len(things.text) == 4
+
+    # The layout is the same every time
+    layout = g.topic_graph_layout
+    g.topic_graph_layout = None
+    g.topic_graph(max_topics=5)
+    assert g.topic_graph_layout == layout
+
+    # And renaming the participants (i.e. customizing their aliases) keeps it
+    g.chat.rename_participants({"Laila": "👑", "Amir": "🦁"})
+    fig = g.topic_graph(max_topics=5)
+    assert g.topic_graph_layout == layout
+    participants = next(
+        trace for trace in fig.data if trace.name == PARTICIPANTS_LABEL
+    )
+    assert sorted(text.split("</b>")[0] for text in participants.text) == [
+        "<b>👑",
+        "<b>🦁",
+    ]
+
+
+def test_sentiment_lines_take_the_participants_colours(make_graph):
+    g = make_graph(*chat_of(100))
+    g.add_columns({SENTIMENT_SCORE: pd.Series([0.5] * 100)})
+    g.color_map = {"Laila": "#ff0000", "Amir": "#00ff00"}
+    fig = g.sentiment_over_time()
+    colours = {
+        trace.name: (trace.marker.color, trace.line.color)
+        for trace in fig.data
+    }
+    assert colours == {
+        "Laila": ("#ff0000", "#ff0000"),
+        "Amir": ("#00ff00", "#00ff00"),
+    }
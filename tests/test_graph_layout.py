@@ -0,0 +1,122 @@
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+import layouts.graph_layout as graph_layout
+from constants.column_names import (
+    CLEANED_TEXT,
+    CONVERSATION,
+    EMOJIS,
+    EMOTION_LABEL,
+    ENTITIES,
+    PROFANITY_LABEL,
+    PROFANITY_SCORE,
+    RAW_TEXT,
+    SENTIMENT_LABEL,
+    SENTIMENT_SCORE,
+    WORD_COUNT,
+)
+from constants.figures import (
+    CONVERSATIONS,
+    DAILY_MESSAGES,
+    FULL_DASHBOARD,
+    SENTIMENT_OVER_TIME,
+    TIME_HEAT_MAP,
+)
+
+
+@pytest.fixture
+def graph(make_graph):
+    """A graph with every column already computed, so that drawing it never runs the processing"""
+    return make_graph(
+        pd.date_range("2020-01-01", periods=4),
+        ["Laila", "Amir"] * 2,
+        {
+            RAW_TEXT: ["hi"] * 4,
+            WORD_COUNT: [1] * 4,
+            CLEANED_TEXT: [["hi"]] * 4,
+            EMOJIS: [[]] * 4,
+            CONVERSATION: [0] * 4,
+            SENTIMENT_SCORE: [0.5] * 4,
+            SENTIMENT_LABEL: ["Positive"] * 4,
+            PROFANITY_SCORE: [0.0] * 4,
+            PROFANITY_LABEL: ["Clean"] * 4,
+            EMOTION_LABEL: ["joy"] * 4,
+            ENTITIES: [{}] * 4,
+        },
+    )
+
+
+def test_late_figures_are_filled_in_later(graph, monkeypatch):
+    g = graph
+    slow = threading.Event()
+
+    def layout_figure(g, figure, dark_theme):
+        if figure == TIME_HEAT_MAP:
+            slow.wait(5)
+        return figure
+
+    monkeypatch.setattr(graph_layout, "layout_figure", layout_figure)
+    layouts = graph_layout.layout_figures(
+        g, [DAILY_MESSAGES, TIME_HEAT_MAP], time_budget=0.2
+    )
+    assert layouts[DAILY_MESSAGES] == DAILY_MESSAGES
+
+    placeholder = layouts[TIME_HEAT_MAP]
+    assert placeholder.id == {
+        "type": graph_layout.LATE_FIGURE,
+        "name": TIME_HEAT_MAP,
+    }
+    token = placeholder.children[-1].data
+    assert graph_layout.late_figure(token) is None
+
+    slow.set()
+    for _ in range(50):
+        layout = graph_layout.late_figure(token)
+        if layout is not None:
+            break
+        time.sleep(0.1)
+    assert layout == TIME_HEAT_MAP
+
+
+def test_only_the_open_sections_are_drawn(graph, monkeypatch):
+    g = graph
+    columns = list(g.df.columns)
+    drawn = []
+
+    def layout_figure(g, figure, dark_theme):
+        drawn.append(figure)
+        return figure
+
+    monkeypatch.setattr(graph_layout, "layout_figure", layout_figure)
+    sections = graph_layout.graph_layout(g, False, FULL_DASHBOARD).children
+    assert sorted(drawn) == sorted(
+        figure for _, figure, _ in graph_layout.SECTIONS[0][1]
+    )
+
+    lazy = sections[1]
+    assert not lazy.open
+    figures = lazy.children[1].data
+    assert figures == [TIME_HEAT_MAP, CONVERSATIONS, SENTIMENT_OVER_TIME]
+    assert lazy.children[2].className == graph_layout.LAZY_SECTION
+
+    containers = graph_layout.layout_section_figures(
+        g, figures, False, [SENTIMENT_SCORE]
+    )
+    # The sentiment is still being computed, so only the heat map and the conversations are drawn
+    assert containers[0].children == TIME_HEAT_MAP
+    assert containers[1].children == CONVERSATIONS
+    assert containers[2].className == graph_layout.PENDING_FIGURE
+    assert drawn[-2:] == [TIME_HEAT_MAP, CONVERSATIONS]
+    assert list(g.df.columns) == columns
+
+
+def test_figures_get_the_template_of_the_theme(graph):
+    g = graph
+    light = graph_layout.layout_figure(g, DAILY_MESSAGES)
+    dark = graph_layout.layout_figure(g, DAILY_MESSAGES, dark_theme=True)
+    templates = graph_layout.figure_templates()
+    assert light.figure.layout.template.to_plotly_json() == templates["light"]
+    assert dark.figure.layout.template.to_plotly_json() == templates["dark"]
@@ -0,0 +1,113 @@
+import time
+
+import pytest
+
+from services.job_queue import (
+    CANCELLED,
+    FAILED,
+    FINISHED,
+    TIMED_OUT,
+    LocalJobQueue,
+    QueueFullError,
+    RQJobQueue,
+)
+
+
+def add(job, a, b):
+    job.publish(progress="halfway")
+    return a + b
+
+
+def fail(job):
+    raise ValueError("bad chat")
+
+
+def wait_until_cancelled(job):
+    while True:
+        job.check()
+        time.sleep(0.01)
+
+
+# The queue that cancelled_between_stages is run on, which can't be pickled into the job's arguments
+rq_job_queues = []
+
+
+def cancelled_between_stages(job):
+    job.publish(stage=1)
+    # As the web process would, while the job is running
+    rq_job_queues[-1].cancel(job.id)
+    job.publish(stage=2)
+    job.check()
+
+
+def wait_for(job_queue, job_id, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = job_queue.status(job_id)["status"]
+        if status in (FINISHED, FAILED, CANCELLED, TIMED_OUT):
+            return status
+        time.sleep(0.01)
+    raise AssertionError("the job never finished")
+
+
+def test_local_job_queue():
+    job_queue = LocalJobQueue(workers=1, max_queued=4)
+    job_id = job_queue.submit(add, 1, 2)
+    assert wait_for(job_queue, job_id) == FINISHED
+    assert job_queue.result(job_id) == 3
+    assert job_queue.meta(job_id) == {"progress": "halfway"}
+
+    job_queue.release(job_id)
+    assert job_queue.status(job_id) is None
+
+
+def test_local_job_queue_failure():
+    job_queue = LocalJobQueue(workers=1, max_queued=4)
+    job_id = job_queue.submit(fail)
+    assert wait_for(job_queue, job_id) == FAILED
+    assert job_queue.status(job_id)["error"] == "bad chat"
+    assert job_queue.result(job_id) is None
+
+
+def test_local_job_queue_cancel_and_timeout():
+    job_queue = LocalJobQueue(workers=2, max_queued=4)
+    job_id = job_queue.submit(wait_until_cancelled)
+    assert job_queue.cancel(job_id)
+    assert wait_for(job_queue, job_id) == CANCELLED
+
+    job_id = job_queue.submit(wait_until_cancelled, timeout=0.05)
+    assert wait_for(job_queue, job_id) == TIMED_OUT
+
+
+def test_local_job_queue_is_bounded():
+    job_queue = LocalJobQueue(workers=1, max_queued=1)
+    job_id = job_queue.submit(wait_until_cancelled)
+    with pytest.raises(QueueFullError):
+        job_queue.submit(add, 1, 2)
+    job_queue.cancel(job_id)
+
+
+def test_rq_job_queue():
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("rq")
+
+    job_queue = RQJobQueue(fakeredis.FakeStrictRedis(), is_async=False)
+    job_id = job_queue.submit(add, 1, 2)
+    assert job_queue.status(job_id)["status"] == FINISHED
+    assert job_queue.result(job_id) == 3
+    assert job_queue.meta(job_id)["progress"] == "halfway"
+
+    job_id = job_queue.submit(fail)
+    assert job_queue.status(job_id)["status"] == FAILED
+    assert "bad chat" in job_queue.status(job_id)["error"]
+
+
+def test_rq_job_cancel_survives_publishing():
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("rq")
+
+    job_queue = RQJobQueue(fakeredis.FakeStrictRedis(), is_async=False)
+    rq_job_queues.append(job_queue)
+    job_id = job_queue.submit(cancelled_between_stages)
+    assert job_queue.status(job_id)["status"] == CANCELLED
+    assert job_queue.meta(job_id)["stage"] == 2
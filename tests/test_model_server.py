@@ -0,0 +1,99 @@
+import os
+import threading
+
+import pytest
+
+from config import Config
+from services.model_server import ModelClient, ModelServer, ModelServerError
+
+
+def pids(values, lang):
+    return [os.getpid()] * len(values)
+
+
+def serve(server):
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    while not os.path.exists(server.address):
+        thread.join(0.01)
+
+
+@pytest.fixture
+def server(tmp_path):
+    batches = []
+
+    def shout(values, lang):
+        batches.append(list(values))
+        return [value.upper() + "!" * (lang == "en") for value in values]
+
+    def fail(values, lang):
+        raise ValueError("no model")
+
+    server = ModelServer(
+        str(tmp_path / "models.sock"),
+        {"shout": shout, "fail": fail},
+        batch_size=100,
+        max_latency=0.2,
+        threads=1,
+        processes=0,
+        authkey=b"secret",
+    )
+    serve(server)
+    yield server, batches
+    server.close()
+
+
+def test_concurrent_requests_are_batched(server):
+    server, batches = server
+    client = ModelClient(server.address, b"secret")
+    results = {}
+
+    def infer(name, values):
+        results[name] = client.infer("shout", values)
+
+    threads = [
+        threading.Thread(target=infer, args=(name, values))
+        for name, values in [("a", ["hi", "yo"]), ("b", ["hey"])]
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {"a": ["HI!", "YO!"], "b": ["HEY!"]}
+    assert len(batches) == 1 and sorted(batches[0]) == ["hey", "hi", "yo"]
+
+    # Full batches don't wait for more requests
+    assert client.infer("shout", ["x"] * 100, lang="fr") == ["X"] * 100
+
+
+def test_failed_tasks_are_raised(server):
+    server, _ = server
+    client = ModelClient(server.address, b"secret")
+    with pytest.raises(ModelServerError, match="no model"):
+        client.infer("fail", ["hi"])
+    assert client.infer("shout", ["hi"]) == ["HI!"]
+
+
+def test_an_authkey_is_required(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "SECRET_KEY", None)
+    with pytest.raises(ValueError):
+        ModelServer(str(tmp_path / "models.sock"), {})
+
+
+def test_batches_are_run_on_the_processes(tmp_path):
+    server = ModelServer(
+        str(tmp_path / "models.sock"),
+        {"pids": pids},
+        max_latency=0.01,
+        processes=1,
+        authkey=b"secret",
+    )
+    serve(server)
+    try:
+        client = ModelClient(server.address, b"secret")
+        (pid,) = client.infer("pids", ["hi"])
+        assert pid != os.getpid()
+        assert client.infer("pids", ["hi", "yo"]) == [pid, pid]
+    finally:
+        server.close()
@@ -0,0 +1,70 @@
+import os
+
+from config import Config
+from constants.column_names import CLEANED_TEXT, RAW_TEXT, WORD_COUNT
+from datautils.executor import StageTiming
+from datautils.processor import compute_columns
+from services import counter_service, processing_service
+from services.processing_service import (
+    COLUMNS,
+    PARSED,
+    PARSED_URI,
+    delete_partials,
+    process_upload,
+    read_partial,
+)
+
+CHAT = (
+    "2019-07-27, 14:43 - Amir: Well\n"
+    "2019-07-27, 14:44 - Laila: You see\n"
+    "2019-07-27, 14:45 - Amir: No"
+)
+
+
+class Job:
+    id = "job"
+
+    def __init__(self):
+        self.meta = {}
+
+    def publish(self, **data):
+        self.meta.update(data)
+
+    def check(self):
+        pass
+
+
+def clean(df, columns, lang, callback=None, check=None):
+    # The inline columns are computed as usual, and the NLP stages (which need their models) are replaced
+    if callback is None:
+        return compute_columns(df, columns, lang)
+    df[CLEANED_TEXT] = df[RAW_TEXT].str.lower()
+    callback(StageTiming("cleaning", 0, 0, 0))
+
+
+def test_partial_results_are_stored_rather_than_published(
+    tmp_path, monkeypatch
+):
+    monkeypatch.setattr(Config, "TEMP_BUCKET_PATH", None)
+    monkeypatch.setattr(Config, "LOCAL_RESULT_PATH", str(tmp_path) + "/")
+    monkeypatch.setattr(counter_service, "increment_chat_count", lambda: None)
+    monkeypatch.setattr(
+        counter_service, "increase_message_count", lambda count: None
+    )
+    monkeypatch.setattr(processing_service, "compute_columns", clean)
+
+    job = Job()
+    result = process_upload(job, CHAT, columns=[WORD_COUNT, CLEANED_TEXT])
+    assert list(result["df"][CLEANED_TEXT]) == ["well", "you see", "no"]
+
+    # Only the uris of the dataframe and of the stage's columns are published
+    parsed = read_partial(job.meta[PARSED][PARSED_URI])
+    assert list(parsed[RAW_TEXT]) == ["Well", "You see", "No"]
+    assert set(job.meta[COLUMNS]) == {"cleaning"}
+    columns = read_partial(job.meta[COLUMNS]["cleaning"])
+    assert list(columns) == [CLEANED_TEXT]
+
+    # And they're deleted once they've been collected
+    assert len(os.listdir(str(tmp_path))) == 2
+    delete_partials(job.meta)
+    assert os.listdir(str(tmp_path)) == []
@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+
+from datautils.replies import LATENCY_BINS, ReplyGraph
+
+
+def test_reply_graph():
+    timestamps = pd.to_datetime(
+        [
+            "2020-01-01 10:00:00",
+            "2020-01-01 10:00:30",
+            "2020-01-01 10:10:30",
+            "2020-01-01 10:11:00",
+            "2020-01-02 09:00:00",
+            "2020-01-02 11:00:00",
+        ]
+    ).values
+    # The fifth message starts a new conversation, so it isn't a reply
+    replies = ReplyGraph.from_messages(
+        np.array([0, 0, 0, 0, 1, 1]),
+        timestamps,
+        np.array([0, 1, 2, 2, 0, 2]),
+        3,
+    )
+    assert replies.counts.toarray().tolist() == [
+        [0, 0, 0],
+        [1, 0, 0],
+        [1, 1, 0],
+    ]
+    assert replies.mean_reply_times()[2, 1] == 600
+    assert replies.mean_reply_times()[2, 0] == 7200
+    assert np.isnan(replies.mean_reply_times()[0, 1])
+
+    assert replies.histograms.shape == (3, len(LATENCY_BINS))
+    assert replies.histograms[1].tolist() == [1, 0, 0, 0, 0, 0]
+    assert replies.histograms[2].tolist() == [0, 0, 1, 0, 1, 0]
+    assert replies.most_replying(2) == [2, 1]
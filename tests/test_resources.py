@@ -0,0 +1,98 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from datautils.resources import (
+    MANIFEST,
+    UNKNOWN_EMOTION,
+    ResourceBundle,
+    remove_stale_bundles,
+    verb_lemma_table,
+    write_bundle,
+)
+
+
+def build(tmp_path):
+    emolex = pd.DataFrame(
+        [
+            ["happy", "joy", 0.9],
+            ["happy", "trust", 0.4],
+            ["storm", "fear", 0.6],
+            ["storm", "anger", 0.5],
+            ["cry", "sadness", 0.7],
+        ],
+        columns=["word", "emotion", "score"],
+    )
+    path = os.path.join(str(tmp_path), "v1-test")
+    write_bundle(
+        path,
+        {"the", "a", "and"},
+        emolex,
+        {"good": 1.9, "bad": -2.5},
+        {"ran": "run", "cries": "cry"},
+    )
+    return ResourceBundle(path)
+
+
+def test_bundle_round_trip(tmp_path):
+    bundle = build(tmp_path)
+    assert bundle.stop_words == frozenset({"the", "a", "and"})
+    assert bundle.sentiment_lexicon == {"good": 1.9, "bad": -2.5}
+    assert bundle.lemmatize_verb("ran") == "run"
+    assert bundle.lemmatize_verb("walk") == "walk"
+    # The arrays are memory mapped rather than read
+    assert isinstance(bundle.emotion_lexicon.scores, np.memmap)
+    assert not [
+        name for name in os.listdir(str(tmp_path)) if name.startswith(".")
+    ]
+
+
+def test_emotion_labels(tmp_path):
+    lexicon = build(tmp_path).emotion_lexicon
+    assert lexicon.label(["happy", "day"]) == "joy"
+    # Repeated words count every time
+    assert lexicon.label(["happy", "storm", "storm"]) == "fear"
+    assert lexicon.label(["zzz", "aaa"]) == UNKNOWN_EMOTION
+    assert lexicon.label([]) == UNKNOWN_EMOTION
+
+
+def test_verb_lemma_table():
+    lemmatized = {"walks": "walk", "walked": "walk", "went": "go"}
+    table = verb_lemma_table(
+        ["walk", "go"], ["went"], lambda form: lemmatized.get(form, form)
+    )
+    assert table == lemmatized
+
+
+def test_only_older_bundles_past_their_grace_are_removed(tmp_path):
+    now = time.time()
+    for name, age in [("v1-old", 7200), ("v1-recent", 60), ("v1-new", 10)]:
+        os.makedirs(str(tmp_path / name))
+        manifest = str(tmp_path / name / MANIFEST)
+        open(manifest, "w").close()
+        os.utime(manifest, (now - age, now - age))
+    # A bundle that's still being built, and one built by a newer release
+    os.makedirs(str(tmp_path / ".building-x"))
+    os.makedirs(str(tmp_path / "v1-newer"))
+    open(str(tmp_path / "v1-newer" / MANIFEST), "w").close()
+
+    remove_stale_bundles(str(tmp_path / "v1-new"), grace=3600)
+    assert sorted(os.listdir(str(tmp_path))) == [
+        ".building-x",
+        "v1-new",
+        "v1-newer",
+        "v1-recent",
+    ]
+
+
+def test_stale_bundles_are_kept_without_a_current_manifest(tmp_path):
+    os.makedirs(str(tmp_path / "v1-old"))
+    manifest = str(tmp_path / "v1-old" / MANIFEST)
+    open(manifest, "w").close()
+    os.utime(manifest, (0, 0))
+    os.makedirs(str(tmp_path / "v1-new"))
+
+    remove_stale_bundles(str(tmp_path / "v1-new"), grace=0)
+    assert sorted(os.listdir(str(tmp_path))) == ["v1-new", "v1-old"]
@@ -0,0 +1,83 @@
+import pytest
+from boto3.s3.transfer import TransferConfig
+
+from services.result_store import (
+    FileResultStore,
+    MemoryResultStore,
+    ResultStore,
+    S3ResultStore,
+    get_result_store,
+)
+
+
+def test_result_stores_round_trip(tmp_path):
+    uri = str(tmp_path / "results" / "chat.csv")
+    for store, uri in [
+        (MemoryResultStore(), "memory://results/chat.csv"),
+        (FileResultStore(), uri),
+    ]:
+        store.write(uri, b"timestamp,sender\n1,Laila\n")
+        assert store.read(uri) == b"timestamp,sender\n1,Laila\n"
+        assert store.read(uri, (17, 18)) == b"1,"
+
+        # A prefetched result is read once, and then read again if it's fetched again
+        store.prefetch(uri)
+        assert store.fetch(uri).read() == b"timestamp,sender\n1,Laila\n"
+        store.delete(uri)
+        store.prefetch(uri)
+        with pytest.raises(FileNotFoundError):
+            store.fetch(uri)
+
+
+def test_result_store_needs_its_methods():
+    class ReadOnlyResultStore(ResultStore):
+        def read(self, uri, byte_range=None):
+            return b""
+
+    with pytest.raises(TypeError):
+        ReadOnlyResultStore()
+
+
+def test_result_store_is_picked_by_scheme():
+    assert isinstance(get_result_store("s3://bucket/chat.csv"), S3ResultStore)
+    assert isinstance(get_result_store("./tmp/chat.csv"), FileResultStore)
+    assert get_result_store("memory://a") is get_result_store("memory://b")
+
+
+def test_s3_result_store(monkeypatch):
+    moto = pytest.importorskip("moto")
+    import boto3
+
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    mock = getattr(moto, "mock_aws", None) or moto.mock_s3
+    with mock():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket="bucket")
+        # Small parts, so that the result is uploaded and downloaded in several of them
+        chunk_size = 5 * 1024 * 1024
+        store = S3ResultStore(
+            client,
+            TransferConfig(
+                multipart_threshold=chunk_size,
+                multipart_chunksize=chunk_size,
+                max_concurrency=2,
+            ),
+        )
+        data = bytes(range(256)) * (3 * chunk_size // 256)
+        store.write("s3://bucket/folder/chat.csv", data)
+
+        head = client.head_object(Bucket="bucket", Key="folder/chat.csv")
+        assert head["ETag"].strip('"').endswith("-3")
+        assert store.read("s3://bucket/folder/chat.csv") == data
+        assert store.read("s3://bucket/folder/chat.csv", (254, 257)) == bytes(
+            [254, 255, 0, 1]
+        )
+        store.write("s3://bucket/folder/chat.entities.csv", b"entities")
+        listed = sorted(store.list_objects("s3://bucket/folder/"))
+        assert [(stored.uri, stored.size) for stored in listed] == [
+            ("s3://bucket/folder/chat.csv", len(data)),
+            ("s3://bucket/folder/chat.entities.csv", 8),
+        ]
+        store.delete_many([stored.uri for stored in listed])
+        assert client.list_objects_v2(Bucket="bucket")["KeyCount"] == 0
@@ -0,0 +1,64 @@
+from bson.objectid import ObjectId
+
+from services import processed_data_service
+from services.result_store import get_result_store
+from services.result_sweeper import (
+    DELETED_OBJECTS,
+    LAST_RUN,
+    RECLAIMED_BYTES,
+    RUNS,
+    ResultSweeper,
+)
+
+
+def test_sweeper_deletes_expired_results(monkeypatch):
+    store = get_result_store("memory://")
+    expired, kept = ObjectId(), ObjectId()
+    uris = [
+        "memory://sweep/{}.csv".format(expired),
+        "memory://sweep/{}.entities.csv".format(expired),
+        "memory://sweep/{}.csv".format(kept),
+        "memory://sweep/{}.csv.1.part".format(kept),
+        "memory://sweep/notes.txt",
+    ]
+    for uri in uris:
+        store.write(uri, b"12345")
+    lookups = []
+
+    def get_existing_oids(oids):
+        lookups.append(set(oids))
+        return {kept} & set(oids)
+
+    monkeypatch.setattr(
+        processed_data_service, "get_existing_oids", get_existing_oids
+    )
+    sweeper = ResultSweeper(["memory://sweep/"], batch_size=2, grace_period=0)
+    forgotten = set()
+    sweeper.add_listener(forgotten.update)
+    run = sweeper.sweep()
+
+    assert len(lookups) == 3
+    assert run[DELETED_OBJECTS] == 3 and run[RECLAIMED_BYTES] == 15
+    # The partial object of the kept result is deleted too
+    assert forgotten == {expired, kept}
+    assert sorted(
+        stored.uri for stored in store.list_objects("memory://")
+    ) == ["memory://sweep/{}.csv".format(kept), "memory://sweep/notes.txt"]
+    metrics = sweeper.metrics()
+    assert metrics[RUNS] == 1 and metrics[LAST_RUN] == run
+
+    # Objects that were just written are left alone
+    store.write("memory://sweep/{}.csv".format(expired), b"12345")
+    assert ResultSweeper(["memory://sweep/"]).sweep()[DELETED_OBJECTS] == 0
+
+
+def test_sweeper_saves_its_metrics(monkeypatch):
+    saved = []
+    monkeypatch.setattr(processed_data_service, "create_indexes", lambda: None)
+    monkeypatch.setattr(
+        processed_data_service, "save_sweeper_metrics", saved.append
+    )
+    sweeper = ResultSweeper(["memory://empty/"])
+    sweeper.stop()
+    sweeper.run(interval=60)
+    assert saved == [sweeper.metrics()] and saved[0][RUNS] == 1
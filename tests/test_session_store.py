@@ -0,0 +1,58 @@
+import time
+
+import pandas as pd
+
+from constants.column_names import RAW_TEXT, SENDER, TIMESTAMP
+from datautils.chat_frame import ChatFrame
+from services.session_store import SessionStore
+
+
+def add_chat(session, num_messages=100):
+    session.graph.chat = ChatFrame(
+        pd.DataFrame(
+            {
+                TIMESTAMP: pd.date_range("2020-01-01", periods=num_messages),
+                SENDER: ["Laila", "Amir"] * (num_messages // 2),
+                RAW_TEXT: ["hi"] * num_messages,
+            }
+        )
+    )
+
+
+def test_sessions_are_separate_and_released():
+    store = SessionStore(max_sessions=4, max_memory=10 ** 9, ttl=60)
+    first, second = store.create(), store.create()
+    add_chat(first)
+    assert first.id != second.id
+    assert store.get(first.id).graph.chat is first.graph.chat
+    assert second.graph.chat is None
+
+    store.release(first.id)
+    assert store.get(first.id) is None
+    assert store.get(None) is None
+    assert len(store) == 1
+
+
+def test_least_recently_used_sessions_are_evicted():
+    store = SessionStore(max_sessions=2, max_memory=10 ** 9, ttl=60)
+    first, second = store.create(), store.create()
+    store.get(first.id)
+    third = store.create()
+    assert store.get(second.id) is None
+    assert store.get(first.id) is first and store.get(third.id) is third
+
+    # Sessions are also evicted once their chats use too much memory
+    add_chat(first)
+    store.max_memory = first.memory_usage()
+    add_chat(third)
+    store.get(third.id)
+    assert store.get(first.id) is None
+    assert store.memory_usage() == third.memory_usage()
+
+
+def test_idle_sessions_are_evicted():
+    store = SessionStore(max_sessions=4, max_memory=10 ** 9, ttl=60)
+    idle, active = store.create(), store.create()
+    idle.last_used = time.time() - 61
+    store.get(active.id)
+    assert store.get(idle.id) is None
@@ -0,0 +1,40 @@
+from services import processed_data_service
+from services.share_writer import ShareWriter
+
+
+class FlakyParser:
+    def __init__(self, failures):
+        self.failures = failures
+        self.saved = []
+
+    def snapshot(self):
+        return self
+
+    def save_data(self, *args, oid=None):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("bucket unavailable")
+        self.saved.append(oid)
+
+
+def test_failed_writes_are_retried_then_marked(monkeypatch):
+    pending, failed = [], []
+    monkeypatch.setattr(
+        processed_data_service,
+        "create_pending_entry",
+        lambda oid, is_permanent: pending.append(oid),
+    )
+    monkeypatch.setattr(
+        processed_data_service, "fail_processed_data_entry", failed.append
+    )
+
+    writer = ShareWriter(workers=1, retries=2, backoff=0)
+    parser = FlakyParser(failures=2)
+    uid = writer.submit(parser, {})
+    flaky = FlakyParser(failures=3)
+    failing_uid = writer.submit(flaky, {})
+    writer._ShareWriter__executor.shutdown(wait=True)
+
+    assert [str(oid) for oid in pending] == [uid, failing_uid]
+    assert [str(oid) for oid in parser.saved] == [uid]
+    assert flaky.saved == [] and [str(oid) for oid in failed] == [failing_uid]